@@ -1,4 +1,5 @@
 
+import logging
 import os
 import sqlite3
 from flask import Flask, g
@@ -7,9 +8,12 @@ from config import Config
 from db import db as db_module
 
 
+logger = logging.getLogger(__name__)
+
 login_manager = LoginManager()
 
 login_manager.login_view = 'auth.login'
+login_manager.blueprint_login_views = {'api': None} # JSON clients get a 401 instead of a redirect to the login page
 login_manager.login_message = 'Please log in to access this page.'
 login_manager.login_message_category = 'info'
 
@@ -26,8 +30,35 @@ def create_app(config_class=Config):
     login_manager.init_app(app)
 
    
+    from . import metrics
+    metrics.init_app(app) # First of the request hooks, so its timer covers all the others
+
+    from . import log
+    log.init_app(app) # Before anything logs, so it all goes through the queue
+
     db_module.init_app(app)
 
+    from . import pagination
+    pagination.init_app(app)
+
+    from . import reference
+    reference.init_app(app)
+
+    from . import page_cache
+    page_cache.init_app(app)
+
+    from . import jobs
+    jobs.init_app(app)
+
+    from . import write_batch
+    write_batch.init_app(app)
+
+    from . import images
+    images.init_app(app)
+
+    from . import assets
+    assets.init_app(app)
+
    
     from . import routes as main_routes
     app.register_blueprint(main_routes.bp)
@@ -39,9 +70,11 @@ def create_app(config_class=Config):
    
     from app import product
     app.register_blueprint(product.bp)
+
+    from . import api
+    app.register_blueprint(api.bp)
     
 
-    print(f"App created with instance path: {app.instance_path}")
-    print(f"Database path from config: {app.config['DATABASE']}")
+    logger.info('App created', extra={'instance_path': app.instance_path, 'database': app.config['DATABASE']})
 
     return app
\ No newline at end of file
@@ -0,0 +1,343 @@
+# app/api.py
+import datetime
+import hashlib
+import json
+import logging
+import sqlite3
+import zlib
+from flask import Blueprint, current_app, jsonify, request, stream_with_context, url_for
+from flask_login import login_required
+from werkzeug.exceptions import HTTPException
+
+from db.db import get_read_db, fts_match_query
+from .images import image_variants
+from .pagination import decode_cursor, rank_sort_key, split_page, timestamp_sort_key
+from .product_detail import load_product_detail, product_comments
+from .reference import get_categories, get_category
+from .routes import parse_search_filters, search_cursor, search_query
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Fields each resource can return, in output order; ?fields= picks a subset
+PRODUCT_FIELDS = ('id', 'title', 'description', 'price', 'condition', 'is_sold', 'date_posted',
+                  'like_count', 'comment_count', 'category_id', 'category_name', 'seller_id', 'seller_name',
+                  'image_url', 'images')
+CATEGORY_FIELDS = ('id', 'name', 'description')
+PROFILE_FIELDS = ('id', 'name', 'join_date', 'profile_info', 'campus_name', 'review_count', 'average_rating',
+                  'rating_distribution', 'available_count', 'sold_count', 'last_active')
+COMMENT_FIELDS = ('id', 'text', 'timestamp', 'commenter_name')
+REVIEW_FIELDS = ('id', 'text', 'rating', 'timestamp', 'reviewer_name')
+
+PRODUCT_COLUMNS = """
+    p.id, p.title, p.description, p.price, p.condition, p.image_path, p.is_sold, p.date_posted,
+    p.like_count, p.comment_count, p.category_id, c.name AS category_name, p.seller_id, u.name AS seller_name
+"""
+
+# Responses stream out in pieces of about this size, each compressed as it goes
+STREAM_CHUNK_BYTES = 16 * 1024
+
+
+class ApiError(Exception):
+    """An error answered as {"error": message} with the given HTTP status."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+@bp.errorhandler(ApiError)
+def _api_error(e):
+    return jsonify(error=e.message), e.status
+
+@bp.errorhandler(HTTPException)
+def _http_error(e):
+    return jsonify(error=e.description), e.code
+
+@bp.errorhandler(sqlite3.Error)
+def _db_error(e):
+    logger.exception('DB error in API', extra={'endpoint': request.endpoint})
+    return jsonify(error='A database error occurred.'), 500
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False, default=_json_default)
+
+def _requested_fields(allowed):
+    """The ?fields= selection as a tuple in allowed's order, or all of allowed if absent."""
+    raw = request.args.get('fields', '')
+    if not raw:
+        return allowed
+    requested = {name.strip() for name in raw.split(',') if name.strip()}
+    unknown = requested.difference(allowed)
+    if unknown:
+        raise ApiError(f"Unknown fields: {', '.join(sorted(unknown))}. Available: {', '.join(allowed)}")
+    return tuple(name for name in allowed if name in requested)
+
+def _page_limit():
+    """?limit= clamped to 1..API_MAX_PAGE_SIZE, defaulting to PRODUCTS_PER_PAGE."""
+    limit = request.args.get('limit', type=int) or current_app.config['PRODUCTS_PER_PAGE']
+    return max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+
+def _cursor():
+    token = request.args.get('cursor')
+    cursor = decode_cursor(token)
+    if token and cursor is None:
+        raise ApiError('Invalid cursor.')
+    return cursor
+
+def _next_url(next_cursor):
+    if next_cursor is None:
+        return None
+    args = request.args.to_dict()
+    args['cursor'] = next_cursor
+    return url_for(request.endpoint, **(request.view_args or {}), **args, _external=True)
+
+
+def _chunks(pieces):
+    """Joins small strings into encoded chunks of about STREAM_CHUNK_BYTES."""
+    buffer, size = [], 0
+    for piece in pieces:
+        data = piece.encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= STREAM_CHUNK_BYTES:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(current_app.config['API_GZIP_LEVEL'], zlib.DEFLATED, 31) # 31: gzip framing
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def _respond(pieces, etag_source):
+    """A streamed JSON response of the strings in pieces, with an ETag over etag_source.
+
+    etag_source is whatever determines the body (the selected rows, fields and
+    cursor), so a matching If-None-Match is answered with 304 before anything
+    is serialized. The body is gzipped on the fly for clients that accept it.
+    """
+    etag = hashlib.sha1(repr(etag_source).encode()).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        body = _chunks(pieces)
+        gzip_ok = current_app.config['API_GZIP'] and request.accept_encodings['gzip']
+        response = current_app.response_class(
+            stream_with_context(_gzipped(body) if gzip_ok else body),
+            mimetype='application/json'
+        )
+        if gzip_ok:
+            response.headers['Content-Encoding'] = 'gzip'
+    # Weak: the gzipped and plain bodies are the same representation, not the same bytes
+    response.set_etag(etag, weak=True)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.no_cache = True # May be stored, but revalidated with the ETag
+    return response
+
+def _private(response):
+    # Login-only resources must not be stored by shared caches and handed to anonymous clients
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
+def _list_response(items, fields, next_cursor, serialize, related=None):
+    """{"data": [...], "next_cursor": ..., "next": url} for rows, one item serialized at a time.
+
+    related is any other data serialize reads (e.g. image variants), for the ETag.
+    """
+    def pieces():
+        yield '{"data":['
+        for i, item in enumerate(items):
+            yield (',' if i else '') + _dumps(serialize(item, fields))
+        yield f'],"next_cursor":{_dumps(next_cursor)},"next":{_dumps(_next_url(next_cursor))}}}'
+    return _respond(pieces(), ([tuple(item) if isinstance(item, sqlite3.Row) else item for item in items],
+                               fields, next_cursor, related))
+
+def _item_response(item, fields, serialize):
+    data = serialize(item, fields)
+    return _respond(iter(('{"data":', _dumps(data), '}')), (data, fields))
+
+def _select(row, fields):
+    return {name: row[name] for name in fields}
+
+
+def _serialize_product(row, fields, variants):
+    product = {}
+    for name in fields:
+        if name == 'image_url':
+            path = row['image_path']
+            product[name] = url_for('static', filename=path, _external=True) if path else None
+        elif name == 'images':
+            product[name] = {
+                variant: {
+                    'url': url_for('static', filename=image['image_url'], _external=True),
+                    'width': image['width'],
+                    'height': image['height'],
+                }
+                for variant, image in variants.get(row['id'], {}).items()
+            }
+        elif name == 'is_sold':
+            product[name] = bool(row[name])
+        else:
+            product[name] = row[name]
+    return product
+
+def _product_list(rows, next_cursor, fields):
+    variants = image_variants(row['id'] for row in rows) if 'images' in fields else {}
+    image_urls = sorted((product_id, name, image['image_url'])
+                        for product_id, images in variants.items() for name, image in images.items())
+    return _list_response(rows, fields, next_cursor,
+                          lambda row, fields: _serialize_product(row, fields, variants), related=image_urls)
+
+def _search_products(match_query, filters):
+    limit = _page_limit()
+    fields = _requested_fields(PRODUCT_FIELDS)
+    _cursor() # Rejects a malformed token; one from the other sort order just restarts, as in main.search
+    cursor = search_cursor(match_query)
+    query, parameters = search_query(filters, match_query, cursor, limit + 1, columns=PRODUCT_COLUMNS)
+    rows = get_read_db().execute(query, parameters).fetchall()
+    if match_query:
+        rows, next_cursor = split_page(rows, limit, rank_sort_key)
+    else:
+        rows, next_cursor = split_page(rows, limit)
+    return _product_list(rows, next_cursor, fields)
+
+
+@bp.route('/products')
+def products():
+    """Listings, newest first, filtered like main.search (category, min_price, max_price, condition, status)."""
+    filters = parse_search_filters(request.args)
+    filters['keyword'] = ''
+    return _search_products(None, filters)
+
+@bp.route('/search')
+def search():
+    """Keyword search over listings by relevance, with the same filters as /products. Requires keyword."""
+    filters = parse_search_filters(request.args)
+    match_query = fts_match_query(filters['keyword'])
+    if not match_query:
+        raise ApiError('keyword is required.')
+    return _search_products(match_query, filters)
+
+@bp.route('/products/<int:product_id>')
+@login_required
+def product(product_id):
+    detail, _ = load_product_detail(product_id)
+    if detail is None:
+        raise ApiError('Product not found.', 404)
+    fields = _requested_fields(PRODUCT_FIELDS)
+    variants = {product_id: detail['variants']}
+    return _private(_item_response(
+        detail['product'], fields, lambda row, fields: _serialize_product(row, fields, variants)
+    ))
+
+@bp.route('/products/<int:product_id>/comments')
+@login_required
+def product_comments_list(product_id):
+    if get_read_db().execute('SELECT 1 FROM products WHERE id = ?', (product_id,)).fetchone() is None:
+        raise ApiError('Product not found.', 404)
+    fields = _requested_fields(COMMENT_FIELDS)
+    comments, next_cursor = product_comments(product_id, _cursor())
+    return _private(_list_response(comments, fields, next_cursor, _select))
+
+@bp.route('/categories')
+def categories():
+    fields = _requested_fields(CATEGORY_FIELDS)
+    items = get_categories()
+    return _list_response(items, fields, None, _select)
+
+@bp.route('/categories/<int:category_id>')
+def category(category_id):
+    item = get_category(category_id)
+    if item is None:
+        raise ApiError('Category not found.', 404)
+    return _item_response(item, _requested_fields(CATEGORY_FIELDS), _select)
+
+@bp.route('/profiles/<int:user_id>')
+def profile(user_id):
+    """A user's public profile with their precomputed review and listing figures (see db/user_stats.sql)."""
+    row = get_read_db().execute(
+        '''
+        SELECT
+            u.id, u.name, u.join_date, u.profile_info,
+            c.name AS campus_name,
+            s.review_count, s.rating_sum, s.rating_1, s.rating_2, s.rating_3, s.rating_4, s.rating_5,
+            s.available_count, s.sold_count, s.last_active
+        FROM users u
+        LEFT JOIN campuses c ON u.campus_id = c.id
+        LEFT JOIN user_stats s ON s.user_id = u.id
+        WHERE u.id = ?
+        ''',
+        (user_id,)
+    ).fetchone()
+    if row is None:
+        raise ApiError('Profile not found.', 404)
+    review_count = row['review_count'] or 0
+    profile = {
+        'id': row['id'],
+        'name': row['name'],
+        'join_date': row['join_date'],
+        'profile_info': row['profile_info'],
+        'campus_name': row['campus_name'],
+        'review_count': review_count,
+        'average_rating': row['rating_sum'] / review_count if review_count else None,
+        'rating_distribution': {str(stars): row[f'rating_{stars}'] or 0 for stars in range(1, 6)},
+        'available_count': row['available_count'] or 0,
+        'sold_count': row['sold_count'] or 0,
+        'last_active': row['last_active'],
+    }
+    return _item_response(profile, _requested_fields(PROFILE_FIELDS), _select)
+
+@bp.route('/profiles/<int:user_id>/products')
+def profile_products(user_id):
+    """A user's listings, newest first, sold ones included."""
+    limit = _page_limit()
+    fields = _requested_fields(PRODUCT_FIELDS)
+    cursor = _cursor()
+    rows = get_read_db().execute(
+        f'''
+        SELECT {PRODUCT_COLUMNS}
+        FROM products p
+        JOIN categories c ON p.category_id = c.id
+        JOIN users u ON p.seller_id = u.id
+        WHERE p.seller_id = ? {'AND (p.date_posted, p.id) < (?, ?)' if cursor else ''}
+        ORDER BY p.date_posted DESC, p.id DESC
+        LIMIT ?
+        ''',
+        (user_id, *(cursor or ()), limit + 1)
+    ).fetchall()
+    rows, next_cursor = split_page(rows, limit)
+    return _product_list(rows, next_cursor, fields)
+
+@bp.route('/profiles/<int:user_id>/reviews')
+def profile_reviews(user_id):
+    """Reviews a user received, newest first."""
+    limit = _page_limit()
+    fields = _requested_fields(REVIEW_FIELDS)
+    cursor = _cursor()
+    rows = get_read_db().execute(
+        f'''
+        SELECT r.id, r.comment AS text, r.rating, r.timestamp, u.name AS reviewer_name
+        FROM reviews r
+        JOIN users u ON r.reviewer_id = u.id
+        WHERE r.reviewed_user_id = ? {'AND (r.timestamp, r.id) < (?, ?)' if cursor else ''}
+        ORDER BY r.timestamp DESC, r.id DESC
+        LIMIT ?
+        ''',
+        (user_id, *(cursor or ()), limit + 1)
+    ).fetchall()
+    rows, next_cursor = split_page(rows, limit, timestamp_sort_key)
+    return _list_response(rows, fields, next_cursor, _select)
@@ -0,0 +1,221 @@
+# app/assets.py
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import with_appcontext
+
+from .images import UPLOADS_DIR, VARIANTS_DIR
+
+try:
+    import brotli
+except ImportError: # Optional; without it only .gz copies are built
+    brotli = None
+
+# Text assets worth storing precompressed, and the smallest size worth compressing
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt')
+MIN_COMPRESS_BYTES = 1024
+
+# Precompressed suffix per Content-Encoding, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+class AssetManifest:
+    """Content hashes of the files in the static folder, used to fingerprint their URLs.
+
+    Entries are keyed by filename (relative to static/) and record the file's
+    size and mtime, so a saved manifest is only trusted for files that have
+    not changed since it was written. Uploaded product images are skipped:
+    content-addressed ones already have their hash in their path.
+    """
+
+    def __init__(self, static_folder, path):
+        self.static_folder = static_folder
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def _hash_file(self, filename):
+        digest = hashlib.sha256()
+        with open(os.path.join(self.static_folder, filename), 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()[:12]
+
+    def _entry(self, filename, stat, known=None):
+        if known and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime:
+            return known
+        return {'hash': self._hash_file(filename), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def _static_files(self):
+        for dirpath, dirnames, filenames in os.walk(self.static_folder):
+            rel_dir = os.path.relpath(dirpath, self.static_folder).replace(os.sep, '/')
+            if rel_dir == UPLOADS_DIR:
+                dirnames[:] = [] # Shards and variants: content-addressed and far too many to hash
+            for filename in filenames:
+                if filename.endswith(tuple(suffix for _, suffix in ENCODINGS)) or filename.startswith('.'):
+                    continue
+                yield filename if rel_dir == '.' else f'{rel_dir}/{filename}'
+
+    def load(self):
+        """Fills the manifest from the saved file, rehashing anything that changed since."""
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = {}
+        entries = {}
+        for filename in self._static_files():
+            try:
+                stat = os.stat(os.path.join(self.static_folder, filename))
+                entries[filename] = self._entry(filename, stat, saved.get(filename))
+            except OSError:
+                continue
+        with self._lock:
+            self._entries = entries
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with self._lock:
+            data = json.dumps(self._entries, indent=1, sort_keys=True)
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def version(self, filename, check_mtime=False):
+        """Short content hash of a static file, or None if it is not in the manifest.
+
+        check_mtime rehashes a file edited since it was recorded (used in debug mode).
+        """
+        with self._lock:
+            entry = self._entries.get(filename)
+        if entry is None or not check_mtime:
+            return entry and entry['hash']
+        try:
+            stat = os.stat(os.path.join(self.static_folder, filename))
+        except OSError:
+            return None
+        fresh = self._entry(filename, stat, entry)
+        if fresh is not entry:
+            with self._lock:
+                self._entries[filename] = fresh
+        return fresh['hash']
+
+    def filenames(self):
+        with self._lock:
+            return list(self._entries)
+
+
+def asset_manifest():
+    """The current app's AssetManifest."""
+    return current_app.extensions['asset_manifest']
+
+def _is_content_addressed(filename):
+    # Uploads and variants stored under their hash (see images.content_path) never change
+    return filename.startswith((f'{UPLOADS_DIR}/', f'{VARIANTS_DIR}/')) and filename.count('/') >= 3
+
+def _fingerprint_static_urls(endpoint, values):
+    if endpoint != 'static' or 'filename' not in values or _is_content_addressed(values['filename']):
+        return
+    version = asset_manifest().version(values['filename'], check_mtime=current_app.debug)
+    if version:
+        values.setdefault('v', version)
+
+
+def _accepted_encoding(filename):
+    """(encoding, compressed filename) of the best up-to-date precompressed copy the client accepts."""
+    if not filename.endswith(COMPRESSIBLE_EXTENSIONS):
+        return None
+    source = os.path.join(current_app.static_folder, filename)
+    for encoding, suffix in ENCODINGS:
+        if not request.accept_encodings[encoding]:
+            continue
+        try:
+            if os.path.getmtime(source + suffix) >= os.path.getmtime(source):
+                return encoding, filename + suffix
+        except OSError:
+            continue
+    return None
+
+def static_view(filename):
+    """Replaces Flask's static view to serve precompressed copies and long-lived caching headers.
+
+    A response is cacheable forever when its URL carries the file's current
+    content hash (?v=, added by url_for) or its path is content-addressed.
+    Anything else is served as before, with revalidation.
+    """
+    precompressed = _accepted_encoding(filename)
+    if precompressed is not None:
+        encoding, compressed = precompressed
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(current_app.static_folder, compressed, mimetype=mimetype)
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = current_app.send_static_file(filename)
+    if filename.endswith(COMPRESSIBLE_EXTENSIONS):
+        response.vary.add('Accept-Encoding')
+
+    version = request.args.get('v')
+    current = asset_manifest().version(filename, check_mtime=current_app.debug)
+    if _is_content_addressed(filename) or (version and version == current):
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    return response
+
+
+def precompress_assets(filenames):
+    """Writes .gz (and .br, if brotli is installed) copies of compressible files that are stale or missing.
+
+    Returns the number of files written.
+    """
+    written = 0
+    for filename in filenames:
+        source = os.path.join(current_app.static_folder, filename)
+        if not filename.endswith(COMPRESSIBLE_EXTENSIONS) or os.path.getsize(source) < MIN_COMPRESS_BYTES:
+            continue
+        with open(source, 'rb') as f:
+            data = f.read()
+        compressors = [('.gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            compressors.append(('.br', lambda d: brotli.compress(d, quality=11)))
+        for suffix, compress in compressors:
+            target = source + suffix
+            if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+                continue
+            tmp_path = f'{target}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(compress(data))
+            os.replace(tmp_path, target)
+            written += 1
+    return written
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Flask CLI command to hash static files into the manifest and precompress CSS/JS."""
+    manifest = asset_manifest()
+    manifest.load()
+    manifest.save()
+    written = precompress_assets(manifest.filenames())
+    click.echo(f'Fingerprinted {len(manifest.filenames())} static files, wrote {written} precompressed copies'
+               + ('' if brotli is not None else ' (gzip only; install brotli for .br)') + '.')
+
+
+def init_app(app):
+    """Load the asset manifest and install fingerprinted static URLs and the static view."""
+    manifest = AssetManifest(app.static_folder, app.config['ASSET_MANIFEST'])
+    manifest.load()
+    app.extensions['asset_manifest'] = manifest
+    app.url_defaults(_fingerprint_static_urls)
+    app.view_functions['static'] = static_view
+    app.cli.add_command(build_assets_command)
@@ -1,4 +1,5 @@
 # app/auth.py
+import logging
 from datetime import datetime
 from flask import (
     Blueprint, render_template, request, flash, redirect, url_for, session
@@ -9,9 +10,15 @@ import sqlite3
 
 from .forms import EditProfileForm, RegistrationForm, LoginForm
 from .models import User
-from db.db import get_db
+from .reference import get_campuses
+from .jobs import enqueue
+from .page_cache import invalidate_pages
+from .product_detail import invalidate_product_detail
+from db.db import get_db, get_read_db
 from app import login_manager
 
+logger = logging.getLogger(__name__)
+
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
 @login_manager.user_loader
@@ -47,7 +54,7 @@ def register():
         except sqlite3.Error as e:
             db.rollback()
             flash(f'An error occurred during registration: {e}', 'danger')
-            print(f"DB Error on registration: {e}")
+            logger.exception('DB error on registration')
 
     return render_template('auth/register.html', title='Register', form=form)
 
@@ -62,7 +69,7 @@ def login():
         password = form.password.data
         remember = form.remember.data
 
-        db = get_db()
+        db = get_read_db()
         try:
             user_row = db.execute(
                 'SELECT id, password_hash FROM users WHERE email = ?', (email,)
@@ -88,7 +95,7 @@ def login():
 
         except sqlite3.Error as e:
             flash(f'An error occurred during login: {e}', 'danger')
-            print(f"DB Error on login: {e}")
+            logger.exception('DB error on login')
 
     return render_template('auth/login.html', title='Login', form=form)
 
@@ -102,13 +109,10 @@ def logout():
 @bp.route('/edit_profile', methods=['GET', 'POST'])
 @login_required
 def edit_profile():
-    db = get_db()
     form = EditProfileForm()
 
-    # Fetch campuses for the dropdown
-    campuses = db.execute(
-        'SELECT id, name FROM campuses ORDER BY name'
-    ).fetchall()
+    # Campuses for the dropdown
+    campuses = get_campuses()
     # Add a 'None' option or similar if campus is optional
     form.campus_id.choices = [(0, '-- Select Campus --')] + [(campus['id'], campus['name']) for campus in campuses]
 
@@ -126,12 +130,16 @@ def edit_profile():
         # Handle the 'None' option for campus
         campus_id = form.campus_id.data if form.campus_id.data != 0 else None
 
+        db = get_db()
         try:
             db.execute(
                 'UPDATE users SET name = ?, email = ?, profile_info = ?, campus_id = ? WHERE id = ?',
                 (name, email, profile_info, campus_id, current_user.id)
             )
             db.commit()
+            User.invalidate(current_user.id)
+            invalidate_pages() # Seller names appear on the cached category pages
+            invalidate_product_detail() # and as seller or commenter on any cached product page
 
             current_user.name = name
             current_user.email = email
@@ -146,7 +154,7 @@ def edit_profile():
         except sqlite3.Error as e:
             db.rollback()
             flash(f'An error occurred while updating your profile: {e}', 'danger')
-            print(f"DB Error on profile update: {e}")
+            logger.exception('DB error on profile update', extra={'user_id': current_user.id})
 
     return render_template('auth/edit_profile.html', title='Edit Profile', form=form)
 
@@ -188,7 +196,8 @@ def leave_review(reviewed_user_id):
     except sqlite3.Error as e:
         db.rollback()
         flash(f'An error occurred while submitting your review: {e}', 'danger')
-        print(f"DB Error on review submission: {e}")
+        logger.exception('DB error on review submission', extra={'user_id': current_user.id,
+                                                                  'reviewed_user_id': reviewed_user_id})
 
     return redirect(url_for('main.profile', user_id=reviewed_user_id, _anchor='reviews'))
 
@@ -197,8 +206,21 @@ def leave_review(reviewed_user_id):
 def delete_profile():
     db = get_db()
     try:
+        # Databases created before the products.seller_id constraint was fixed also
+        # carry a non-cascading copy of it, so remove the listings explicitly.
+        old_files = [row['path'] for row in db.execute(
+            'SELECT image_path AS path FROM products WHERE seller_id = ? AND image_path IS NOT NULL '
+            'UNION SELECT i.image_url FROM product_images i JOIN products p ON i.product_id = p.id '
+            'WHERE p.seller_id = ?',
+            (current_user.id, current_user.id)
+        )]
+        db.execute('DELETE FROM products WHERE seller_id = ?', (current_user.id,))
         db.execute('DELETE FROM users WHERE id = ?', (current_user.id,))
+        enqueue(db, 'delete_files', paths=old_files)
         db.commit()
+        User.invalidate(current_user.id)
+        invalidate_pages()
+        invalidate_product_detail()
 
         logout_user()
         flash('Your profile has been deleted successfully.', 'success')
@@ -206,6 +228,6 @@ def delete_profile():
     except sqlite3.Error as e:
         db.rollback()
         flash(f'An error occurred while deleting your profile: {e}', 'danger')
-        print(f"DB Error on profile deletion: {e}")
+        logger.exception('DB error on profile deletion', extra={'user_id': current_user.id})
         # Redirect to index if profile doesn't exist anymore
         return redirect(url_for('main.index'))
\ No newline at end of file
@@ -1,10 +1,15 @@
 # app/forms.py
+import logging
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
 from wtforms import StringField, PasswordField, SubmitField, BooleanField, TextAreaField, SelectField, DecimalField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError, NumberRange
 import sqlite3
-from db.db import get_db
+from db.db import get_read_db
+from .reference import get_categories
+from .images import sniff_image_type
+
+logger = logging.getLogger(__name__)
 
 def edu_email_required(form, field):
     if not field.data.lower().endswith('.edu'):
@@ -12,15 +17,25 @@ def edu_email_required(form, field):
 
 def email_exists(form, field):
     try:
-        db = get_db()
+        db = get_read_db()
         cursor = db.execute('SELECT id FROM users WHERE email = ?', (field.data,))
         user = cursor.fetchone()
         if user:
             raise ValidationError('Email address already registered. Please log in.')
-    except sqlite3.Error as e:
-        print(f"Database error during email check: {e}")
+    except sqlite3.Error:
+        logger.exception('DB error during email check')
         pass
 
+def image_content_check(form, field):
+    # FileAllowed only looks at the file name; this looks at the bytes
+    if not field.data:
+        return
+    stream = field.data.stream
+    header = stream.read(16)
+    stream.seek(0)
+    if sniff_image_type(header) is None:
+        raise ValidationError('File must be a JPEG, PNG or GIF image.')
+
 class RegistrationForm(FlaskForm):
     name = StringField('Full Name', validators=[DataRequired(), Length(min=2, max=100)])
     email = StringField('Email (.edu)', validators=[DataRequired(), Email(), edu_email_required, email_exists])
@@ -51,18 +66,18 @@ class ProductForm(FlaskForm):
                                ('poor', 'Poor (significant wear)')
                            ])
     image = FileField('Upload Image (optional)', validators=[
-        FileAllowed(['jpg', 'jpeg', 'png', 'gif'], 'Images only!')
+        FileAllowed(['jpg', 'jpeg', 'png', 'gif'], 'Images only!'),
+        image_content_check
     ])
     submit = SubmitField('Post Listing')
 
     def __init__(self, *args, **kwargs):
         super(ProductForm, self).__init__(*args, **kwargs)
         try:
-            db = get_db()
-            categories = db.execute('SELECT id, name FROM categories ORDER BY name').fetchall()
+            categories = get_categories()
             self.category.choices = [(cat['id'], cat['name']) for cat in categories]
-        except (sqlite3.Error, AttributeError) as e:
-            print(f"Error loading categories: {e}")
+        except (sqlite3.Error, AttributeError):
+            logger.exception('Error loading categories')
             self.category.choices = [(0, 'Error loading categories')]
 
 class EditProfileForm(FlaskForm):
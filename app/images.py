@@ -0,0 +1,431 @@
+# app/images.py
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+
+from db.db import get_db, get_read_db, add_missing_columns, run_sql_script
+from .jobs import job
+from .metrics import IMAGE_PROCESSING_SECONDS, UPLOAD_BYTES, UPLOADS
+from .page_cache import invalidate_pages
+from .product_detail import invalidate_product_detail
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError: # Pillow is optional; without it products just keep their original image
+    Image = None
+
+# Resized copies made of every product image, smallest first: (name, longest edge in px)
+VARIANTS = (
+    ('thumb', 160),
+    ('card', 480),
+    ('full', 1280),
+)
+
+UPLOADS_DIR = 'product_images'
+VARIANTS_DIR = 'product_images/variants'
+
+# Accepted upload formats by their leading magic bytes, and the extension they are stored with
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+)
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# At the top level of UPLOADS_DIR gc-images only collects uploads saved before content
+# addressing (16 random hex digits) and temp files left by an interrupted store_upload;
+# anything else there (the seeder's placeholder images) is left alone.
+_COLLECTABLE_TOP_LEVEL = re.compile(r'^(?:[0-9a-f]{16}\.\w+|\.upload-.*\.tmp)$')
+
+
+class InvalidImage(ValueError):
+    """Raised by store_upload for an upload that is not an acceptable image."""
+
+
+def content_path(digest, suffix, directory=UPLOADS_DIR):
+    """Path (relative to static/) under which content with the given hex digest is stored.
+
+    Files are sharded by the first two bytes of the digest, e.g.
+    product_images/3f/a2/3fa2...e1.jpg, so no single directory grows too large.
+    """
+    return f'{directory}/{digest[:2]}/{digest[2:4]}/{digest}{suffix}'
+
+def sniff_image_type(header):
+    """Extension of the image format identified by header's magic bytes, or None."""
+    for signature, ext in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return ext
+    return None
+
+def store_upload(stream):
+    """Streams an uploaded image into content-addressed storage and returns its path relative to static/.
+
+    The upload is copied in chunks to a temporary file beside its destination
+    while being hashed, then renamed into place, so memory use stays flat and
+    a half-written file is never visible under its final name. The stored
+    extension comes from the magic bytes, not the client's file name. Raises
+    InvalidImage if the content is not a JPEG, PNG or GIF, or is larger than
+    MAX_IMAGE_UPLOAD_BYTES.
+    """
+    upload_root = os.path.join(current_app.static_folder, UPLOADS_DIR)
+    os.makedirs(upload_root, exist_ok=True)
+    limit = current_app.config['MAX_IMAGE_UPLOAD_BYTES']
+    digest = hashlib.sha256()
+    size = 0
+    ext = None
+
+    fd, tmp_path = tempfile.mkstemp(prefix='.upload-', suffix='.tmp', dir=upload_root)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while chunk := stream.read(UPLOAD_CHUNK_SIZE):
+                if ext is None:
+                    ext = sniff_image_type(chunk)
+                    if ext is None:
+                        UPLOADS.inc(1, 'rejected')
+                        raise InvalidImage('File must be a JPEG, PNG or GIF image.')
+                size += len(chunk)
+                if size > limit:
+                    UPLOADS.inc(1, 'rejected')
+                    raise InvalidImage(f'Images must be at most {limit / 1024 / 1024:.0f} MB.')
+                digest.update(chunk)
+                out.write(chunk)
+        if ext is None:
+            UPLOADS.inc(1, 'rejected')
+            raise InvalidImage('The uploaded file is empty.')
+
+        image_path = content_path(digest.hexdigest(), ext)
+        file_path = os.path.join(current_app.static_folder, image_path)
+        if os.path.exists(file_path):
+            os.utime(file_path) # Mark it fresh so a pending delete_files job leaves it alone
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    UPLOADS.inc(1, 'stored')
+    UPLOAD_BYTES.inc(size)
+    return image_path
+
+
+def _output_format():
+    """(Pillow format, file extension, mime type) used for variants."""
+    if features.check('webp'):
+        return 'WEBP', '.webp', 'image/webp'
+    return 'JPEG', '.jpg', 'image/jpeg'
+
+def _prepare(img, pillow_format):
+    img = ImageOps.exif_transpose(img) # Phone photos are often stored sideways with an EXIF rotation
+    has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+    if has_alpha and pillow_format == 'WEBP':
+        return img.convert('RGBA')
+    if has_alpha:
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img.convert('RGBA'), mask=img.convert('RGBA').getchannel('A'))
+        return background
+    return img.convert('RGB')
+
+def create_variants(image_path):
+    """Writes resized, re-encoded copies of a product image.
+
+    image_path is relative to the static folder (as stored in products.image_path).
+    Returns a list of dicts (variant, image_url, width, height, mime_type), or an
+    empty list if Pillow is not installed or the file cannot be read as an image.
+    Variants are named after the source file, which is named after its content,
+    so a variant that already exists on disk is reused rather than re-encoded.
+    """
+    if Image is None or not image_path:
+        return []
+    source = os.path.join(current_app.static_folder, image_path)
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    pillow_format, ext, mime_type = _output_format()
+
+    variants = []
+    started = time.perf_counter()
+    try:
+        with Image.open(source) as original:
+            img = _prepare(original, pillow_format)
+            for name, edge in VARIANTS:
+                image_url = content_path(stem, f'_{name}{ext}', VARIANTS_DIR)
+                out_path = os.path.join(current_app.static_folder, image_url)
+                if os.path.exists(out_path):
+                    with Image.open(out_path) as existing:
+                        size = existing.size
+                    os.utime(out_path) # Mark it fresh, see _delete_unreferenced
+                else:
+                    resized = img.copy()
+                    resized.thumbnail((edge, edge), Image.LANCZOS) # Keeps aspect ratio, never upscales
+                    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+                    tmp_path = f'{out_path}.{os.getpid()}.tmp'
+                    if pillow_format == 'WEBP':
+                        resized.save(tmp_path, 'WEBP', quality=80, method=4)
+                    else:
+                        resized.save(tmp_path, 'JPEG', quality=82, optimize=True, progressive=True)
+                    os.replace(tmp_path, out_path) # Never expose a half-written file under its final name
+                    size = resized.size
+                variants.append({
+                    'variant': name,
+                    'image_url': image_url,
+                    'width': size[0],
+                    'height': size[1],
+                    'mime_type': mime_type,
+                })
+    except (OSError, Image.DecompressionBombError) as e:
+        logger.warning('Could not create image variants for %s: %s', image_path, e)
+        return []
+    IMAGE_PROCESSING_SECONDS.observe(time.perf_counter() - started)
+    return variants
+
+def record_variants(db, product_id, variants):
+    """Stores variants from create_variants in product_images. The caller commits."""
+    db.executemany(
+        'INSERT INTO product_images (product_id, variant, image_url, width, height, mime_type) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        [(product_id, v['variant'], v['image_url'], v['width'], v['height'], v['mime_type']) for v in variants]
+    )
+
+def remove_variants(db, product_id):
+    """Deletes a product's product_images rows. The caller commits.
+
+    Returns the variant paths, for the caller to pass to a delete_files job.
+    """
+    image_urls = [row['image_url'] for row in db.execute(
+        'SELECT image_url FROM product_images WHERE product_id = ?', (product_id,)
+    )]
+    db.execute('DELETE FROM product_images WHERE product_id = ?', (product_id,))
+    return image_urls
+
+@job('process_image')
+def process_image(product_id, image_path):
+    """Background job: creates and records the variants of a product's uploaded image."""
+    variants = create_variants(image_path) # Slow part first, before taking the writer connection
+    db = get_db()
+    product = db.execute('SELECT image_path FROM products WHERE id = ?', (product_id,)).fetchone()
+    if product is None or product['image_path'] != image_path:
+        # Deleted or given another image while queued; a delete_files job owns the old files
+        _delete_unreferenced(db, [v['image_url'] for v in variants])
+        return
+    db.execute('DELETE FROM product_images WHERE product_id = ?', (product_id,))
+    record_variants(db, product_id, variants)
+    db.commit()
+    invalidate_pages()
+    invalidate_product_detail(product_id)
+
+@job('delete_files')
+def delete_files(paths):
+    """Background job: removes image files (relative to static/) that nothing refers to anymore."""
+    # The writer connection, so that in JOBS_SYNC mode the check sees the caller's uncommitted delete
+    db = get_db()
+    _delete_unreferenced(db, paths)
+    db.commit()
+
+def _delete_unreferenced(db, paths):
+    """Removes those of paths whose image_files refcount is 0. The caller commits.
+
+    A file written or reused in the last IMAGE_GC_GRACE_SECONDS is kept: an upload
+    of the same content may be between saving its file and committing the row
+    that references it. gc-images picks such files up later.
+    """
+    cutoff = time.time() - current_app.config['IMAGE_GC_GRACE_SECONDS']
+    for path in paths:
+        if not _is_collectable(path):
+            continue
+        row = db.execute('SELECT refcount FROM image_files WHERE path = ?', (path,)).fetchone()
+        if row is not None and row['refcount'] > 0:
+            continue
+        file_path = os.path.join(current_app.static_folder, path)
+        try:
+            if os.path.getmtime(file_path) > cutoff:
+                continue
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+        db.execute('DELETE FROM image_files WHERE path = ? AND refcount <= 0', (path,))
+
+def image_variants(product_ids):
+    """Returns {product_id: {variant: row}} for the given products, in one query."""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    placeholders = ', '.join('?' * len(product_ids))
+    variants = {}
+    try:
+        rows = get_read_db().execute(
+            f'SELECT product_id, variant, image_url, width, height FROM product_images '
+            f'WHERE product_id IN ({placeholders})',
+            product_ids
+        ).fetchall()
+    except sqlite3.Error:
+        logger.exception('DB error fetching image variants')
+        return {}
+    for row in rows:
+        variants.setdefault(row['product_id'], {})[row['variant']] = row
+    return variants
+
+
+def image_src(image_path, variants, size):
+    """URL of the named variant, falling back to the original upload."""
+    variant = variants.get(size) if variants else None
+    if variant is not None:
+        return url_for('static', filename=variant['image_url'])
+    return url_for('static', filename=image_path)
+
+def image_srcset(variants):
+    """srcset attribute value listing every variant with its width, for the browser to choose from."""
+    if not variants:
+        return ''
+    return ', '.join(
+        f"{url_for('static', filename=variants[name]['image_url'])} {variants[name]['width']}w"
+        for name, _ in VARIANTS if name in variants
+    )
+
+
+def generate_missing_variants():
+    """Creates variants for every product with an image but no product_images rows.
+
+    Products sharing one source image (the seeded placeholders) reuse the same files.
+    Returns the number of products updated.
+    """
+    db = get_db()
+    add_missing_columns(db, 'product_images', {
+        'variant': "TEXT NOT NULL DEFAULT 'original'",
+        'width': 'INTEGER',
+        'height': 'INTEGER',
+        'mime_type': 'TEXT',
+    })
+    products = db.execute(
+        'SELECT id, image_path FROM products p WHERE image_path IS NOT NULL '
+        'AND NOT EXISTS (SELECT 1 FROM product_images i WHERE i.product_id = p.id)'
+    ).fetchall()
+    by_source = {}
+    for product in products:
+        if product['image_path'] not in by_source:
+            by_source[product['image_path']] = create_variants(product['image_path'])
+        variants = by_source[product['image_path']]
+        if variants:
+            record_variants(db, product['id'], variants)
+    db.commit()
+    return sum(1 for product in products if by_source[product['image_path']])
+
+# One row per reference to a stored image, from a listing or an image variant
+_IMAGE_REFERENCES = '''
+    SELECT image_path AS path FROM products WHERE image_path IS NOT NULL
+    UNION ALL
+    SELECT image_url FROM product_images
+'''
+
+def recount_image_refs(db):
+    """Recomputes image_files from products and product_images. The caller commits."""
+    run_sql_script(db, 'image_refs.sql')
+    db.execute('DELETE FROM image_files')
+    db.execute(
+        f'INSERT INTO image_files (path, refcount) SELECT path, COUNT(*) FROM ({_IMAGE_REFERENCES}) GROUP BY path'
+    )
+
+def _is_collectable(path):
+    """Whether path (relative to static/) is an upload or variant that may be deleted once unreferenced."""
+    directory, _, filename = path.rpartition('/')
+    if directory == UPLOADS_DIR:
+        return bool(_COLLECTABLE_TOP_LEVEL.match(filename))
+    return directory.startswith(UPLOADS_DIR + '/')
+
+def _stored_images():
+    """Paths (relative to static/) of every upload and variant file gc-images may remove."""
+    root = os.path.join(current_app.static_folder, UPLOADS_DIR)
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            full_path = os.path.join(dirpath, filename)
+            path = os.path.relpath(full_path, current_app.static_folder).replace(os.sep, '/')
+            if _is_collectable(path):
+                yield path, full_path
+
+def gc_images(dry_run=False, min_age=None):
+    """Removes stored image files that no product or variant row refers to.
+
+    Refcounts are recomputed first, so drift from before image_refs.sql existed
+    is corrected. Files younger than min_age seconds (default
+    IMAGE_GC_GRACE_SECONDS) are kept. Returns (files removed, bytes freed).
+    A dry run writes nothing: it reads the references without storing the counts.
+    """
+    if min_age is None:
+        min_age = current_app.config['IMAGE_GC_GRACE_SECONDS']
+    if dry_run:
+        rows = get_read_db().execute(f'SELECT DISTINCT path FROM ({_IMAGE_REFERENCES})')
+        referenced = {row['path'] for row in rows}
+    else:
+        db = get_db()
+        recount_image_refs(db)
+        db.commit()
+        referenced = {row['path'] for row in db.execute('SELECT path FROM image_files WHERE refcount > 0')}
+
+    cutoff = time.time() - min_age
+    removed = freed = 0
+    for path, full_path in _stored_images():
+        if path in referenced:
+            continue
+        stat = os.stat(full_path)
+        if stat.st_mtime > cutoff:
+            continue
+        if not dry_run:
+            os.remove(full_path)
+        removed += 1
+        freed += stat.st_size
+    if not dry_run:
+        _remove_empty_dirs(os.path.join(current_app.static_folder, UPLOADS_DIR))
+    return removed, freed
+
+def _remove_empty_dirs(root):
+    for dirpath, _, _ in os.walk(root, topdown=False):
+        if dirpath != root and not os.listdir(dirpath):
+            try:
+                os.rmdir(dirpath)
+            except OSError:
+                pass # Something was just written into it
+
+
+@click.command('generate-thumbnails')
+@with_appcontext
+def generate_thumbnails_command():
+    """Flask CLI command to create resized variants for products that have none yet."""
+    if Image is None:
+        raise click.ClickException('Pillow is not installed; run pip install -r requirements-optional.txt')
+    try:
+        updated = generate_missing_variants()
+    except sqlite3.Error as e:
+        raise click.ClickException(f"Could not generate thumbnails: {e}")
+    click.echo(f'Generated image variants for {updated} products.')
+
+@click.command('gc-images')
+@click.option('--dry-run', is_flag=True, help='Only report what would be removed.')
+@click.option('--min-age', type=int, default=None,
+              help='Keep files modified less than this many seconds ago (default IMAGE_GC_GRACE_SECONDS).')
+@with_appcontext
+def gc_images_command(dry_run, min_age):
+    """Flask CLI command to delete image files in static/product_images that nothing refers to."""
+    try:
+        removed, freed = gc_images(dry_run=dry_run, min_age=min_age)
+    except sqlite3.Error as e:
+        raise click.ClickException(f"Could not collect images: {e}")
+    verb = 'Would remove' if dry_run else 'Removed'
+    click.echo(f'{verb} {removed} unreferenced image files ({freed / 1024 / 1024:.1f} MiB).')
+
+
+def init_app(app):
+    """Register the image template helpers and CLI command with the Flask app."""
+    app.add_template_global(image_src)
+    app.add_template_global(image_srcset)
+    app.cli.add_command(generate_thumbnails_command)
+    app.cli.add_command(gc_images_command)
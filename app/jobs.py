@@ -0,0 +1,240 @@
+# app/jobs.py
+import json
+import logging
+import sqlite3
+import threading
+import time
+import click
+from flask import current_app, g
+from flask.cli import AppGroup
+
+from db.db import get_db, get_read_db, run_sql_script
+from .metrics import JOBS
+
+logger = logging.getLogger(__name__)
+
+# Handlers by job kind, filled in by the @job decorator
+_handlers = {}
+
+
+def job(kind):
+    """Registers a function as the handler for jobs of the given kind.
+
+    Handlers are called with the job's payload as keyword arguments inside an
+    app context. Raising an exception makes the job retry with backoff.
+    """
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+def enqueue(db, kind, **payload):
+    """Queues a job in db's current transaction; workers see it once the caller commits.
+
+    With JOBS_SYNC set (for tests) the handler runs immediately instead, on the
+    same request, so enqueue after the rows it depends on are written.
+    """
+    if kind not in _handlers:
+        raise KeyError(f'No handler registered for job kind {kind!r}')
+    if current_app.config['JOBS_SYNC']:
+        _handlers[kind](**payload)
+        return None
+    now = time.time()
+    cursor = db.execute(
+        'INSERT INTO jobs (kind, payload, run_after, updated_at) VALUES (?, ?, ?, ?)',
+        (kind, json.dumps(payload), now, now)
+    )
+    g.jobs_enqueued = True
+    return cursor.lastrowid
+
+def claim_next_job(include_delayed=False):
+    """Marks the oldest due job as running and returns it, or None if nothing is due.
+
+    include_delayed also claims jobs still waiting out a retry backoff.
+    """
+    db = get_db()
+    now = time.time()
+    rows = db.execute(
+        '''
+        UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ?
+        WHERE id = (
+            SELECT id FROM jobs WHERE status = 'queued' AND run_after <= ?
+            ORDER BY run_after, id LIMIT 1
+        )
+        RETURNING id, kind, payload, attempts
+        ''',
+        (now, float('inf') if include_delayed else now)
+    ).fetchall()
+    db.commit()
+    return rows[0] if rows else None
+
+def run_job(job_row):
+    """Runs a claimed job; deletes it on success, otherwise schedules a retry or marks it failed.
+
+    Returns True if the job succeeded.
+    """
+    config = current_app.config
+    db = get_db()
+    try:
+        handler = _handlers.get(job_row['kind'])
+        if handler is None:
+            raise LookupError(f"No handler registered for job kind {job_row['kind']!r}")
+        handler(**json.loads(job_row['payload']))
+    except Exception as e:
+        if db.in_transaction:
+            db.rollback()
+        attempts = job_row['attempts']
+        if attempts >= config['JOBS_MAX_ATTEMPTS']:
+            status, run_after = 'failed', time.time()
+        else:
+            status, run_after = 'queued', time.time() + config['JOBS_RETRY_BASE_SECONDS'] * 2 ** (attempts - 1)
+        logger.warning('Job failed: %s', e, extra={'job_id': job_row['id'], 'kind': job_row['kind'], 'attempt': attempts,
+                                                  'retry': status == 'queued'})
+        db.execute(
+            'UPDATE jobs SET status = ?, run_after = ?, last_error = ?, updated_at = ? WHERE id = ?',
+            (status, run_after, f'{type(e).__name__}: {e}', time.time(), job_row['id'])
+        )
+        db.commit()
+        JOBS.inc(1, job_row['kind'], 'failed' if status == 'failed' else 'retried')
+        return False
+    db.execute('DELETE FROM jobs WHERE id = ?', (job_row['id'],))
+    db.commit()
+    JOBS.inc(1, job_row['kind'], 'done')
+    return True
+
+def requeue_stale_jobs():
+    """Puts jobs left 'running' by a worker that died back in the queue."""
+    db = get_db()
+    cutoff = time.time() - current_app.config['JOBS_STALE_AFTER_SECONDS']
+    cursor = db.execute(
+        "UPDATE jobs SET status = 'queued' WHERE status = 'running' AND updated_at < ?", (cutoff,)
+    )
+    db.commit()
+    return cursor.rowcount
+
+
+class JobRunner:
+    """Pool of daemon worker threads that process the jobs table for one app.
+
+    Each job is claimed and run in its own app context, so a worker only holds
+    the writer connection while it is actually writing.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.workers = app.config['JOBS_WORKERS']
+        self.poll_interval = app.config['JOBS_POLL_INTERVAL']
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        with self.app.app_context():
+            try:
+                requeue_stale_jobs()
+            except sqlite3.Error:
+                logger.exception('Could not requeue stale jobs')
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True).start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _work(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    job_row = claim_next_job()
+                if job_row is not None:
+                    with self.app.app_context():
+                        run_job(job_row)
+                    continue
+            except Exception:
+                logger.exception('Job worker error')
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+
+def _runner(app):
+    return app.extensions.get('job_runner')
+
+def _start_workers():
+    runner = _runner(current_app)
+    if runner is not None:
+        runner.start()
+
+def _wake_workers(e=None):
+    runner = _runner(current_app)
+    if runner is not None and g.pop('jobs_enqueued', False):
+        runner.wake()
+
+def _ensure_jobs_table():
+    db = get_db()
+    run_sql_script(db, 'jobs.sql')
+    return db
+
+
+jobs_cli = AppGroup('jobs', help='Inspect and run background jobs.')
+
+@jobs_cli.command('list')
+@click.option('--limit', default=20, show_default=True, help='Number of jobs to show.')
+def list_jobs_command(limit):
+    """Show queue counts and the oldest pending or failed jobs."""
+    _ensure_jobs_table()
+    db = get_read_db()
+    counts = {row['status']: row['n'] for row in db.execute('SELECT status, COUNT(*) AS n FROM jobs GROUP BY status')}
+    click.echo(', '.join(f'{status}: {counts.get(status, 0)}' for status in ('queued', 'running', 'failed')))
+    now = time.time()
+    for row in db.execute('SELECT * FROM jobs ORDER BY id LIMIT ?', (limit,)):
+        due = f'due in {row["run_after"] - now:.0f}s' if row['run_after'] > now else 'due'
+        click.echo(f"#{row['id']} {row['kind']} [{row['status']}] attempts={row['attempts']} {due} {row['payload']}")
+        if row['last_error']:
+            click.echo(f"    last error: {row['last_error']}")
+
+def _run_jobs(include_delayed):
+    _ensure_jobs_table()
+    requeue_stale_jobs()
+    succeeded = failed = 0
+    while True:
+        job_row = claim_next_job(include_delayed=include_delayed)
+        if job_row is None:
+            break
+        if run_job(job_row):
+            succeeded += 1
+        else:
+            failed += 1
+    click.echo(f'Ran {succeeded + failed} jobs: {succeeded} succeeded, {failed} failed or rescheduled.')
+
+@jobs_cli.command('run')
+def run_jobs_command():
+    """Run every job that is due now, in this process."""
+    _run_jobs(include_delayed=False)
+
+@jobs_cli.command('drain')
+def drain_jobs_command():
+    """Run every queued job, ignoring retry backoff, until the queue is empty."""
+    _run_jobs(include_delayed=True)
+
+@jobs_cli.command('retry')
+def retry_jobs_command():
+    """Put failed jobs back in the queue with a fresh set of attempts."""
+    db = _ensure_jobs_table()
+    cursor = db.execute(
+        "UPDATE jobs SET status = 'queued', attempts = 0, run_after = ?, updated_at = ? WHERE status = 'failed'",
+        (time.time(), time.time())
+    )
+    db.commit()
+    click.echo(f'Requeued {cursor.rowcount} failed jobs.')
+
+
+def init_app(app):
+    """Set up the job workers (started by the first request) and the `flask jobs` commands."""
+    if not app.config['JOBS_SYNC'] and app.config['JOBS_WORKERS'] > 0:
+        app.extensions['job_runner'] = JobRunner(app)
+        app.before_request(_start_workers)
+        app.teardown_appcontext(_wake_workers)
+    app.cli.add_command(jobs_cli)
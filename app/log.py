@@ -0,0 +1,142 @@
+# app/log.py
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import uuid
+from flask import current_app, g, has_request_context, request
+
+# Attributes every LogRecord has; anything else on a record came from extra={...}
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'request_id'}
+
+# An incoming X-Request-ID is reused if it looks like an id, so one id follows a request across services
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{8,64}$')
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request_id and any extra={...} fields."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+                  .isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        elif record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps records with the current request id and drops debug records of unsampled requests.
+
+    Runs in the thread that logs, before the record is queued, since that is
+    where the request context is.
+    """
+
+    def __init__(self, debug_sample_rate):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            sampled = g.get('log_debug_sampled', True)
+        else:
+            record.request_id = None
+            sampled = None
+        if record.levelno <= logging.DEBUG:
+            if sampled is None: # Outside a request (jobs, CLI): sample each record on its own
+                sampled = random.random() < self.debug_sample_rate
+            return sampled
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the caller: when the queue is full the record is dropped and counted."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge args and render the traceback here, but leave JSON formatting to the listener thread
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+
+def configure_logging(config):
+    """Sends all logging through a bounded queue to one stderr writer thread.
+
+    Installed on the root logger once per process; later calls (another app
+    in the same process) only change the level.
+    """
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(config['LOG_LEVEL'].upper())
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stderr)
+    if config['LOG_FORMAT'] == 'json':
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter(TEXT_FORMAT))
+    log_queue = queue.Queue(maxsize=config['LOG_QUEUE_SIZE'])
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(RequestContextFilter(config['LOG_DEBUG_SAMPLE_RATE']))
+
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop) # Flushes what is still queued
+
+
+def _assign_request_id():
+    incoming = request.headers.get('X-Request-ID', '')
+    g.request_id = incoming if _REQUEST_ID.match(incoming) else uuid.uuid4().hex
+    # Debug records are kept or dropped for a whole request, so a sampled request has its full trace
+    g.log_debug_sampled = random.random() < current_app.config['LOG_DEBUG_SAMPLE_RATE']
+
+def _echo_request_id(response):
+    request_id = g.get('request_id')
+    if request_id:
+        response.headers['X-Request-ID'] = request_id
+    return response
+
+def init_app(app):
+    """Configure logging from LOG_LEVEL/LOG_FORMAT and give every request an id."""
+    configure_logging(app.config)
+    app.before_request(_assign_request_id)
+    app.after_request(_echo_request_id)
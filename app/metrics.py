@@ -0,0 +1,226 @@
+# app/metrics.py
+import bisect
+import threading
+import time
+from flask import current_app, g, request
+
+from db.db import get_pool
+
+# Latency buckets in seconds, the usual Prometheus defaults
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+# Retired threads' values are folded into one total once this many shards exist
+_MAX_SHARDS = 64
+
+
+class _Shards:
+    """Metric values kept in one dict per thread.
+
+    Recording only touches the calling thread's dict, so it never takes a
+    lock or contends with other threads. A scrape copies every dict and adds
+    them up. Dicts of threads that have exited are folded into a single
+    retired total, so a server that starts a thread per request does not
+    grow the list without bound.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock() # Only for adding/folding shards, never for recording
+        self._shards = [] # (thread, values)
+        self._retired = {}
+
+    def values(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), values))
+                if len(self._shards) > _MAX_SHARDS:
+                    self._fold_retired()
+            return values
+
+    def _fold_retired(self):
+        live = []
+        for thread, values in self._shards:
+            if thread.is_alive():
+                live.append((thread, values))
+            else:
+                _merge(self._retired, values)
+        self._shards = live
+
+    def collect(self):
+        """Sum of every thread's values, as {(metric, labels): value}."""
+        with self._lock:
+            self._fold_retired()
+            totals = _merge({}, self._retired)
+            shards = [values for _, values in self._shards]
+        for values in shards:
+            _merge(totals, dict(values)) # dict() copies atomically while the owner keeps writing
+        return totals
+
+def _merge(totals, values):
+    for key, value in values.items():
+        if isinstance(value, list):
+            current = totals.get(key)
+            if current is None:
+                totals[key] = list(value)
+            else:
+                for i, v in enumerate(value):
+                    current[i] += v
+        else:
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+_shards = _Shards()
+_registry = []
+
+
+class Counter:
+    """A monotonically increasing total per label combination; inc(amount, *label_values)."""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        _registry.append(self)
+
+    def inc(self, amount=1, *labels):
+        values = _shards.values()
+        key = (self.name, labels)
+        values[key] = values.get(key, 0) + amount
+
+    def render(self, totals, lines):
+        lines.append(f'# HELP {self.name} {self.help}')
+        lines.append(f'# TYPE {self.name} counter')
+        for (name, labels), value in sorted(totals.items()):
+            if name == self.name:
+                lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}')
+
+
+class Histogram:
+    """Bucketed counts and sum of observed values per label combination; observe(value, *label_values)."""
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        values = _shards.values()
+        key = (self.name, labels)
+        counts = values.get(key)
+        if counts is None:
+            # One slot per bucket, one for +Inf, then the sum of observed values
+            counts = values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def render(self, totals, lines):
+        lines.append(f'# HELP {self.name} {self.help}')
+        lines.append(f'# TYPE {self.name} histogram')
+        for (name, labels), counts in sorted(totals.items()):
+            if name != self.name:
+                continue
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames + ("le",), labels + (le,))} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(counts[-1])}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}')
+
+def _labels(names, values):
+    if not names:
+        return ''
+    escaped = (str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for v in values)
+    return '{' + ','.join(f'{n}="{v}"' for n, v in zip(names, escaped)) + '}'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REQUESTS = Counter('unibay_http_requests_total', 'HTTP requests by endpoint, method and status.',
+                   ('endpoint', 'method', 'status'))
+REQUEST_SECONDS = Histogram('unibay_http_request_duration_seconds', 'Time to produce a response.',
+                            ('endpoint',))
+DB_QUERIES = Counter('unibay_db_queries_total', 'SQL statements run, by endpoint (needs SQL_TRACE).',
+                     ('endpoint',))
+DB_SECONDS = Histogram('unibay_db_request_seconds', 'SQLite time per request (needs SQL_TRACE).',
+                       ('endpoint',), buckets=DB_BUCKETS)
+CACHE_LOOKUPS = Counter('unibay_cache_lookups_total', 'Lookups in the in-process caches by result.',
+                        ('cache', 'result'))
+UPLOAD_BYTES = Counter('unibay_upload_bytes_total', 'Bytes of accepted image uploads.')
+UPLOADS = Counter('unibay_uploads_total', 'Image uploads by outcome.', ('outcome',))
+IMAGE_PROCESSING_SECONDS = Histogram('unibay_image_processing_seconds', 'Time to create the variants of one image.')
+JOBS = Counter('unibay_jobs_total', 'Background jobs run, by kind and outcome.', ('kind', 'outcome'))
+WRITE_BATCH_SIZE = Histogram('unibay_write_batch_size', 'Writes committed together by the write batcher.',
+                             buckets=BATCH_SIZE_BUCKETS)
+WRITE_BATCH_SECONDS = Histogram('unibay_write_batch_seconds', 'Time to apply and commit one batch of writes.',
+                                buckets=DB_BUCKETS)
+BATCHED_WRITES = Counter('unibay_batched_writes_total', 'Writes run by the write batcher, by kind and outcome.',
+                         ('kind', 'outcome'))
+
+
+def cache_lookup(cache, hit):
+    """Counts a hit or miss of one of the named in-process caches."""
+    CACHE_LOOKUPS.inc(1, cache, 'hit' if hit else 'miss')
+
+
+def _pool_lines(app, lines):
+    lines.append('# HELP unibay_db_pool_connections SQLite connections per pool and state.')
+    lines.append('# TYPE unibay_db_pool_connections gauge')
+    stats = {name: get_pool(app, read_only=(name == 'read')).stats() for name in ('read', 'write')}
+    for name, pool in stats.items():
+        for state in ('open', 'idle', 'in_use', 'size'):
+            lines.append(f'unibay_db_pool_connections{{pool="{name}",state="{state}"}} {pool[state]}')
+    for key in ('created', 'reused', 'waited', 'discarded'):
+        lines.append(f'# HELP unibay_db_pool_{key}_total Connections {key}, see db.db.ConnectionPool.')
+        lines.append(f'# TYPE unibay_db_pool_{key}_total counter')
+        for name, pool in stats.items():
+            lines.append(f'unibay_db_pool_{key}_total{{pool="{name}"}} {pool[key]}')
+
+def render_metrics(app):
+    """The metrics of this process in the Prometheus text exposition format."""
+    totals = _shards.collect()
+    lines = []
+    for metric in _registry:
+        metric.render(totals, lines)
+    _pool_lines(app, lines)
+    return '\n'.join(lines) + '\n'
+
+def metrics_view():
+    return current_app.response_class(
+        render_metrics(current_app._get_current_object()),
+        mimetype='text/plain; version=0.0.4',
+        headers={'Cache-Control': 'no-store'},
+    )
+
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+
+def _record_request(response):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    endpoint = request.endpoint or 'unmatched' # Keeps 404 scans from creating a series per URL
+    REQUESTS.inc(1, endpoint, request.method, str(response.status_code))
+    REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint)
+    stats = g.get('query_stats')
+    if stats is not None:
+        DB_QUERIES.inc(stats.count, endpoint)
+        DB_SECONDS.observe(stats.seconds, endpoint)
+    return response
+
+def init_app(app):
+    """Add /metrics and the hooks that time every request, if METRICS_ENABLED."""
+    if not app.config['METRICS_ENABLED']:
+        return
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -1,8 +1,28 @@
-from flask_login import UserMixin
-from db.db import get_db
+import logging
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from db.db import get_read_db
 import sqlite3
 
-class User(UserMixin):
+from .metrics import cache_lookup
+
+logger = logging.getLogger(__name__)
+
+class User:
+    """The logged-in user as seen by Flask-Login.
+
+    Implements the Flask-Login user interface directly rather than through
+    UserMixin, which has no __slots__ and would give every instance a __dict__
+    anyway; with slots the objects held in the UserCache stay small.
+    """
+    __slots__ = ('id', 'name', 'email', 'profile_info', 'campus_id')
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
     def __init__(self, id, name, email, profile_info=None, campus_id=None):
         self.id = id
         self.name = name
@@ -13,16 +33,105 @@ class User(UserMixin):
     def get_id(self):
         return str(self.id)
 
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.get_id() == other.get_id()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.get_id())
+
     @staticmethod
     def get(user_id):
+        cache = _user_cache()
+        user = cache.get(user_id)
+        cache_lookup('user', user is not None)
+        if user is not None:
+            return user
         try:
-            db = get_db()
+            db = get_read_db()
             user_row = db.execute(
                 'SELECT id, name, email, profile_info, campus_id FROM users WHERE id = ?', (user_id,)
             ).fetchone()
             if user_row:
-                return User(id=user_row['id'], name=user_row['name'], email=user_row['email'], profile_info=user_row['profile_info'], campus_id=user_row['campus_id'])
+                user = User(id=user_row['id'], name=user_row['name'], email=user_row['email'], profile_info=user_row['profile_info'], campus_id=user_row['campus_id'])
+                cache.put(user)
+                return user
+            return None
+        except sqlite3.Error:
+            logger.exception('DB error fetching user', extra={'user_id': user_id})
             return None
-        except sqlite3.Error as e:
-            print(f"Database error fetching user {user_id}: {e}")
-            return None
\ No newline at end of file
+
+    @staticmethod
+    def invalidate(user_id):
+        """Drops a user from the cache after their row changed or was deleted."""
+        _user_cache().invalidate(user_id)
+
+class UserCache:
+    """Per-process LRU cache of User objects keyed by id; entries expire after ttl seconds.
+
+    The TTL bounds how stale an entry can be when another app instance changes
+    the user; changes made through this process invalidate the entry directly.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        key = str(user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def put(self, user):
+        if self.max_size <= 0:
+            return
+        key = user.get_id()
+        with self._lock:
+            self._entries[key] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def _user_cache():
+    cache = current_app.extensions.get('user_cache')
+    if cache is None:
+        cache = current_app.extensions.setdefault(
+            'user_cache',
+            UserCache(current_app.config['USER_CACHE_SIZE'], current_app.config['USER_CACHE_TTL'])
+        )
+    return cache
+
+def liked_product_ids(user_id, product_ids):
+    """Returns the subset of product_ids that user_id has liked."""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return set()
+    placeholders = ', '.join('?' * len(product_ids))
+    try:
+        rows = get_read_db().execute(
+            f'SELECT product_id FROM likes WHERE user_id = ? AND product_id IN ({placeholders})',
+            (user_id, *product_ids)
+        ).fetchall()
+        return {row['product_id'] for row in rows}
+    except sqlite3.Error:
+        logger.exception('DB error fetching likes', extra={'user_id': user_id})
+        return set()
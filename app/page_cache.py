@@ -0,0 +1,279 @@
+# app/page_cache.py
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+
+from .metrics import cache_lookup
+from .reference import reference_data
+
+logger = logging.getLogger(__name__)
+
+
+class CachedPage:
+    __slots__ = ('body', 'content_type', 'etag', 'last_modified', 'expires_at')
+
+    def __init__(self, body, content_type, etag, last_modified, expires_at):
+        self.body = body
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+
+
+class MemoryBackend:
+    """LRU of rendered pages held in this process."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def get(self, key):
+        with self._lock:
+            page = self._entries.get(key)
+            if page is None:
+                return None
+            if page.expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return page
+
+    def set(self, key, page):
+        with self._lock:
+            self._entries[key] = page
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generation(self):
+        return self._generation
+
+    def new_generation(self):
+        # Entries of older generations are never hit again and age out of the LRU
+        with self._lock:
+            self._generation += 1
+
+
+class FileBackend:
+    """Rendered pages stored as files, shared by every process on the host.
+
+    Each file is a JSON header line followed by the raw body, written to a
+    temporary name and renamed into place so readers never see half a page.
+    The current generation is a token in a GENERATION file, so a new one
+    started by any process applies to all of them. Files of older generations
+    are deleted by a background thread, at most once per SWEEP_INTERVAL.
+    """
+
+    SWEEP_INTERVAL = 5 # Seconds
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._generation_path = os.path.join(directory, 'GENERATION')
+        self._sweep_requested = threading.Event()
+        self._sweeper_lock = threading.Lock()
+        self._sweeper_started = False
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.page')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                header = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        if header['expires_at'] < time.time():
+            return None
+        return CachedPage(body, header['content_type'], header['etag'],
+                          header['last_modified'], header['expires_at'])
+
+    def set(self, key, page):
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        header = {
+            'content_type': page.content_type,
+            'etag': page.etag,
+            'last_modified': page.last_modified,
+            'expires_at': page.expires_at,
+        }
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(json.dumps(header).encode() + b'\n')
+                f.write(page.body)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning('Could not write page cache entry %s: %s', path, e)
+
+    def generation(self):
+        try:
+            with open(self._generation_path) as f:
+                return f.read()
+        except OSError:
+            return ''
+
+    def new_generation(self):
+        tmp_path = f'{self._generation_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(os.urandom(8).hex())
+            os.replace(tmp_path, self._generation_path)
+        except OSError as e:
+            logger.warning('Could not start a new page cache generation: %s', e)
+            return
+        self._request_sweep()
+
+    def _request_sweep(self):
+        with self._sweeper_lock:
+            if not self._sweeper_started:
+                self._sweeper_started = True
+                threading.Thread(target=self._sweep_forever, name='page-cache-sweeper', daemon=True).start()
+        self._sweep_requested.set()
+
+    def _sweep_forever(self):
+        while True:
+            self._sweep_requested.wait()
+            self._sweep_requested.clear()
+            try:
+                self._sweep()
+            except OSError as e:
+                logger.warning('Could not sweep the page cache: %s', e)
+            # A burst of invalidations costs one sweep
+            time.sleep(self.SWEEP_INTERVAL)
+
+    def _sweep(self):
+        """Deletes the pages written before the current generation started."""
+        started = os.stat(self._generation_path).st_mtime_ns
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.page'):
+                    continue
+                try:
+                    if entry.stat().st_mtime_ns < started:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+
+
+class PageCache:
+    """Full-page cache for anonymous GET requests, see cached_page()."""
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def get(self, key):
+        page = self.backend.get(key)
+        self._count('hits' if page is not None else 'misses')
+        cache_lookup('page', page is not None)
+        return page
+
+    def set(self, key, page):
+        self.backend.set(key, page)
+
+    def generation(self):
+        """Part of every key; a page stored under an older generation is never served."""
+        return self.backend.generation()
+
+    def clear(self):
+        """Makes every cached page stale by starting a new generation, without touching the entries."""
+        self.backend.new_generation()
+        self._count('invalidations')
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+def _create_backend(config):
+    backend = config['PAGE_CACHE_BACKEND']
+    if backend == 'memory':
+        return MemoryBackend(config['PAGE_CACHE_SIZE'])
+    if backend == 'file':
+        return FileBackend(config['PAGE_CACHE_DIR'])
+    if backend == 'none':
+        return None
+    raise ValueError(f"Unknown PAGE_CACHE_BACKEND: {backend!r}")
+
+def page_cache():
+    """The current app's PageCache, or None when caching is disabled."""
+    return current_app.extensions.get('page_cache')
+
+def invalidate_pages():
+    """Makes every cached page stale. Call after any change that shows up in a cached listing."""
+    cache = page_cache()
+    if cache is not None:
+        cache.clear()
+
+def _cache_key(cache):
+    # Reference data (category names) is rendered into the pages, so its version is part of the key
+    args = urlencode(sorted(request.args.items(multi=True)))
+    return f'{cache.generation()}:{reference_data().version}:{request.endpoint}:{request.path}?{args}'
+
+def _wants_cached_page():
+    # Pending flash messages would be rendered into the page, and logged-in users see their own like state
+    return (request.method == 'GET'
+            and not current_user.is_authenticated
+            and '_flashes' not in session)
+
+def cached_page(view):
+    """Serves a view from the page cache for anonymous visitors.
+
+    Cached responses carry an ETag and Last-Modified and answer conditional
+    requests with 304. Responses that are not 200, or that flashed a message
+    (e.g. a database error), are never stored.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        cache = page_cache()
+        if cache is None or not _wants_cached_page():
+            return view(*args, **kwargs)
+
+        # Taken before rendering, so a page that races an invalidation is stored under the old generation
+        key = _cache_key(cache)
+        page = cache.get(key)
+        if page is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or '_flashes' in session:
+                return response
+            body = response.get_data()
+            now = time.time()
+            page = CachedPage(
+                body=body,
+                content_type=response.content_type,
+                etag=hashlib.sha1(body).hexdigest(),
+                last_modified=int(now),
+                expires_at=now + cache.ttl,
+            )
+            cache.set(key, page)
+
+        response = current_app.response_class(page.body, content_type=page.content_type)
+        response.set_etag(page.etag)
+        response.last_modified = page.last_modified
+        response.cache_control.no_cache = True # Browsers may keep it, but must revalidate
+        response.vary.add('Cookie')
+        return response.make_conditional(request)
+    return wrapper
+
+def init_app(app):
+    """Create the page cache configured by PAGE_CACHE_BACKEND."""
+    backend = _create_backend(app.config)
+    if backend is not None:
+        app.extensions['page_cache'] = PageCache(backend, app.config['PAGE_CACHE_TTL'])
@@ -0,0 +1,70 @@
+# app/pagination.py
+import base64
+import binascii
+import json
+from flask import current_app, request, url_for
+
+
+def encode_cursor(sort_value, row_id):
+    """Packs the sort key of the last row on a page into an opaque URL-safe token."""
+    raw = json.dumps([sort_value, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token):
+    """Unpacks a token from encode_cursor into (sort_value, row_id).
+
+    Returns None for a missing or tampered token so the route just serves the first page.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        sort_value, row_id = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    # JSON true/false decode to bools, which are ints to isinstance
+    if (not isinstance(row_id, int) or isinstance(row_id, bool)
+            or not isinstance(sort_value, (str, int, float)) or isinstance(sort_value, bool)):
+        return None
+    return sort_value, row_id
+
+def request_cursor(arg='cursor'):
+    """The decoded ?cursor= argument (or another one, for a second list on the page) of the current request, or None."""
+    return decode_cursor(request.args.get(arg))
+
+def page_size():
+    return current_app.config['PRODUCTS_PER_PAGE']
+
+def date_sort_key(row):
+    """Cursor key for listings ordered by (date_posted DESC, id DESC)."""
+    return str(row['date_posted']), row['id']
+
+def rank_sort_key(row):
+    """Cursor key for keyword searches ordered by (rank ASC, id ASC)."""
+    return row['rank'], row['id']
+
+def timestamp_sort_key(row):
+    """Cursor key for comments and reviews ordered by (timestamp DESC, id DESC)."""
+    return str(row['timestamp']), row['id']
+
+def split_page(rows, per_page, sort_key=date_sort_key):
+    """Trims rows fetched with LIMIT per_page + 1 down to one page.
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if len(rows) <= per_page:
+        return rows, None
+    rows = rows[:per_page]
+    return rows, encode_cursor(*sort_key(rows[-1]))
+
+def page_url(cursor=None, arg='cursor'):
+    """URL of the current view with the same query arguments but a different cursor in arg."""
+    args = request.args.to_dict()
+    args.pop(arg, None)
+    if cursor:
+        args[arg] = cursor
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+def init_app(app):
+    """Make page_url available to templates."""
+    app.add_template_global(page_url)
@@ -1,34 +1,49 @@
 # app/product.py
-import os
+import logging
 from flask import (
-    Blueprint, render_template, flash, redirect, url_for, request, current_app
+    Blueprint, render_template, flash, redirect, url_for, request, current_app, jsonify
 )
 from flask_login import login_required, current_user
-from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
 import sqlite3
 from datetime import datetime
 
 from .forms import ProductForm
-from db.db import get_db
+from .models import liked_product_ids
+from .images import InvalidImage, store_upload, remove_variants, image_variants
+from .jobs import enqueue
+from .page_cache import cached_page, invalidate_pages
+from .product_detail import invalidate_product_detail, load_product_detail, product_comments
+from .reference import get_category
+from .write_batch import run_write
+from .pagination import page_size, request_cursor, split_page, rank_sort_key
+from db.db import get_db, get_read_db, fts_match_query, FTS_RANK
+
+logger = logging.getLogger(__name__)
 
 bp = Blueprint('product', __name__, url_prefix='/product')
 
 def save_image(form_image):
+    """Stores an uploaded image (see images.store_upload) and returns its path relative to static/.
+
+    Uploading the same photo again reuses the stored file. Raises InvalidImage.
+    """
     if not form_image.data:
         return None
-
-    random_hex = os.urandom(8).hex()
-    _, file_ext = os.path.splitext(form_image.data.filename)
-    filename = random_hex + file_ext
-
-    upload_dir = os.path.join(current_app.root_path, 'static', 'product_images')
-    if not os.path.exists(upload_dir):
-        os.makedirs(upload_dir)
-
-    file_path = os.path.join(upload_dir, filename)
-    form_image.data.save(file_path)
-
-    return f'product_images/{filename}'
+    return store_upload(form_image.data.stream)
+
+@bp.app_errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    # Raised before the body is read when it is over MAX_CONTENT_LENGTH, see config.Config.
+    # Only the listing forms are sent back to with a flash; anything else gets a plain 413.
+    limit = current_app.config['MAX_CONTENT_LENGTH'] / 1024 / 1024
+    message = f'That upload is too large; the limit is {limit:.0f} MB.'
+    if request.endpoint in ('product.create', 'product.edit'):
+        flash(message, 'danger')
+        return redirect(request.url)
+    if request.blueprint == 'api' or not request.accept_mimetypes.accept_html:
+        return jsonify(error=message), 413
+    return e
 
 @bp.route('/create', methods=['GET', 'POST'])
 @login_required
@@ -41,9 +56,13 @@ def create():
         category_id = form.category.data
         condition = form.condition.data
 
-        image_path = save_image(form.image) if form.image.data else None
-        print(f"title: {title}, description: {description}, price: {price}, category_id: {category_id}, condition: {condition}, image_path: {image_path}")
-        print
+        try:
+            image_path = save_image(form.image)
+        except InvalidImage as e:
+            form.image.errors.append(str(e))
+            return render_template('product/create.html', title='', form=form)
+        logger.debug('Creating listing', extra={'title': title, 'price': price, 'category_id': category_id,
+                                                'condition': condition, 'image_path': image_path})
 
         db = get_db()
         try:
@@ -52,7 +71,10 @@ def create():
                 'VALUES (?, ?, ?, ?, ?, ?, ?)',
                 (title, description, price, category_id, condition, image_path, current_user.id)
             )
+            if image_path:
+                enqueue(db, 'process_image', product_id=cursor.lastrowid, image_path=image_path)
             db.commit()
+            invalidate_pages()
             product_id = cursor.lastrowid
 
             flash('Your listing has been created!', 'success')
@@ -61,82 +83,45 @@ def create():
         except sqlite3.Error as e:
             db.rollback()
             flash(f'An error occurred while creating your listing: {e}', 'danger')
-            print(f"DB Error on product creation: {e}")
+            logger.exception('DB error on product creation')
 
     return render_template('product/create.html', title='', form=form)
 
 @bp.route('/<int:product_id>')
 @login_required
 def product_view(product_id):
-    db = get_db()
-    product = None
-    comments = []
-    user_liked = False
-
     try:
-        product_data = db.execute(
-            '''
-            SELECT
-                p.*,
-                u.name AS seller_name,
-                u.email AS seller_email,
-                c.name AS category_name,
-                (SELECT COUNT(*) FROM likes WHERE likes.product_id = p.id) AS like_count,
-                (SELECT COUNT(*) FROM comments WHERE comments.product_id = p.id) AS comment_count
-            FROM products p
-            JOIN users u ON p.seller_id = u.id
-            JOIN categories c ON p.category_id = c.id
-            WHERE p.id = ?
-            ''',
-            (product_id,)
-        ).fetchone()
+        detail, user_liked = load_product_detail(product_id, current_user.id)
 
-        if product_data is None:
+        if detail is None:
             flash("Product not found.", "warning")
             return redirect(url_for('main.index'))
 
-        product = dict(product_data)
-
-        comments_data = db.execute(
-            '''
-            SELECT
-                com.text,
-                com.timestamp,
-                u.name AS commenter_name
-            FROM comments com
-            JOIN users u ON com.user_id = u.id
-            WHERE com.product_id = ?
-            ORDER BY com.timestamp DESC
-            ''',
-            (product_id,)
-        ).fetchall()
-        comments = [dict(row) for row in comments_data]
-
-        if current_user.is_authenticated:
-            like_exists = db.execute(
-                'SELECT 1 FROM likes WHERE user_id = ? AND product_id = ? LIMIT 1',
-                (current_user.id, product_id)
-            ).fetchone()
-            if like_exists:
-                user_liked = True
+        comments, next_cursor = detail['comments'], detail['next_cursor']
+        cursor = request_cursor()
+        if cursor and isinstance(cursor[0], str): # Older comments; only the first page is cached
+            comments, next_cursor = product_comments(product_id, cursor)
 
         return render_template('product/view.html',
-                               product=product,
+                               product=detail['product'],
+                               variants=detail['variants'],
                                comments=comments,
+                               next_cursor=next_cursor,
                                user_liked=user_liked)
 
-    except sqlite3.Error as e:
-        print(f"Database Error in product_view (product_id: {product_id}): {e}")
+    except sqlite3.Error:
+        logger.exception('DB error in product_view', extra={'product_id': product_id})
         flash("An error occurred while retrieving product details. Please try again.", "danger")
         return redirect(url_for('main.index'))
 
 @bp.route('/edit/<int:product_id>', methods=['GET', 'POST'])
 @login_required
 def edit(product_id):
-    db = get_db()
+    db = None
 
     try:
-        product = db.execute(
+        # Read and render on a reader; the writer is only taken for the UPDATE, after the upload is stored
+        product = get_read_db().execute(
             'SELECT * FROM products WHERE id = ?', (product_id,)
         ).fetchone()
 
@@ -164,31 +149,45 @@ def edit(product_id):
             category_id = form.category.data
             condition = form.condition.data
 
+            image_path = product['image_path']
+            new_image = False
             if form.image.data:
+                try:
+                    image_path = save_image(form.image)
+                except InvalidImage as e:
+                    form.image.errors.append(str(e))
+                    return render_template('product/edit.html', title='Edit Listing', form=form, product=product,
+                                           variants=image_variants([product_id]).get(product_id, {}))
+                new_image = image_path != product['image_path'] # Re-uploading the same photo changes nothing
+            db = get_db()
+            old_files = []
+            if new_image:
+                old_files = remove_variants(db, product_id)
                 if product['image_path']:
-                    old_image_path = os.path.join(current_app.root_path, 'static', product['image_path'])
-                    if os.path.exists(old_image_path):
-                        os.remove(old_image_path)
-
-                image_path = save_image(form.image)
-            else:
-                image_path = product['image_path']
+                    old_files.append(product['image_path'])
 
             db.execute(
                 'UPDATE products SET title = ?, description = ?, price = ?, '
                 'category_id = ?, condition = ?, image_path = ? WHERE id = ?',
                 (title, description, price, category_id, condition, image_path, product_id)
             )
+            if new_image:
+                enqueue(db, 'delete_files', paths=old_files)
+                enqueue(db, 'process_image', product_id=product_id, image_path=image_path)
             db.commit()
+            invalidate_pages()
+            invalidate_product_detail(product_id)
 
             flash('Your listing has been updated!', 'success')
             return redirect(url_for('product.product_view', product_id=product_id))
 
-        return render_template('product/edit.html', title='Edit Listing', form=form, product=product)
+        return render_template('product/edit.html', title='Edit Listing', form=form, product=product,
+                               variants=image_variants([product_id]).get(product_id, {}))
 
-    except sqlite3.Error as e:
-        db.rollback()
-        print(f"DB Error on product edit: {e}")
+    except sqlite3.Error:
+        if db is not None:
+            db.rollback()
+        logger.exception('DB error on product edit', extra={'product_id': product_id})
         flash('An error occurred while updating your listing.', 'danger')
         return redirect(url_for('product.product_view', product_id=product_id))
 
@@ -210,28 +209,33 @@ def delete(product_id):
             flash('You do not have permission to delete this listing.', 'danger')
             return redirect(url_for('product.product_view', product_id=product_id))
 
+        old_files = remove_variants(db, product_id)
         if product['image_path']:
-            image_path = os.path.join(current_app.root_path, 'static', product['image_path'])
-            if os.path.exists(image_path):
-                os.remove(image_path)
+            old_files.append(product['image_path'])
 
         db.execute('DELETE FROM products WHERE id = ?', (product_id,))
+        enqueue(db, 'delete_files', paths=old_files)
         db.commit()
+        invalidate_pages()
+        invalidate_product_detail(product_id)
 
         flash('Your listing has been deleted.', 'success')
         return redirect(url_for('main.index'))
 
-    except sqlite3.Error as e:
+    except sqlite3.Error:
         db.rollback()
-        print(f"DB Error on product deletion: {e}")
+        logger.exception('DB error on product deletion', extra={'product_id': product_id})
         flash('An error occurred while deleting your listing.', 'danger')
         return redirect(url_for('product.product_view', product_id=product_id))
 
 @bp.route('/category/<int:category_id>')
+@cached_page
 def by_category(category_id):
-    db = get_db()
+    db = get_read_db()
+    per_page = page_size()
+    cursor = request_cursor()
     try:
-        category = db.execute('SELECT * FROM categories WHERE id = ?', (category_id,)).fetchone()
+        category = get_category(category_id)
 
         if not category:
             flash('Category not found.', 'warning')
@@ -242,19 +246,29 @@ def by_category(category_id):
             'FROM products p '
             'JOIN users u ON p.seller_id = u.id '
             'WHERE p.category_id = ? AND p.is_sold = 0 '
-            'ORDER BY p.date_posted DESC',
-            (category_id,)
+            + ('AND (p.date_posted, p.id) < (?, ?) ' if cursor else '') +
+            'ORDER BY p.date_posted DESC, p.id DESC '
+            'LIMIT ?',
+            (category_id, *(cursor or ()), per_page + 1)
         ).fetchall()
+        products, next_cursor = split_page(products, per_page)
+
+        user_liked_ids = set()
+        if current_user.is_authenticated:
+            user_liked_ids = liked_product_ids(current_user.id, (row['id'] for row in products))
 
         return render_template(
             'product/category.html',
             title=f"{category['name']} Listings",
             category=category,
-            products=products
+            products=products,
+            variants=image_variants(row['id'] for row in products),
+            user_liked_ids=user_liked_ids,
+            next_cursor=next_cursor
         )
 
-    except sqlite3.Error as e:
-        print(f"DB Error on category view: {e}")
+    except sqlite3.Error:
+        logger.exception('DB error on category view', extra={'category_id': category_id})
         flash('An error occurred while retrieving category listings.', 'danger')
         return redirect(url_for('main.index'))
 
@@ -265,28 +279,47 @@ def search():
     if not query:
         return redirect(url_for('main.index'))
 
-    db = get_db()
+    match_query = fts_match_query(query)
+    if not match_query:
+        return redirect(url_for('main.index'))
+
+    per_page = page_size()
+    cursor = request_cursor()
+    if cursor and isinstance(cursor[0], str):
+        cursor = None
+
+    db = get_read_db()
     try:
-        search_term = f"%{query}%"
         products = db.execute(
-            'SELECT p.*, u.name as seller_name, c.name as category_name '
-            'FROM products p '
+            f'SELECT p.*, u.name as seller_name, c.name as category_name, {FTS_RANK} AS rank '
+            'FROM products_fts '
+            'JOIN products p ON p.id = products_fts.rowid '
             'JOIN users u ON p.seller_id = u.id '
             'JOIN categories c ON p.category_id = c.id '
-            'WHERE (p.title LIKE ? OR p.description LIKE ?) AND p.is_sold = 0 '
-            'ORDER BY p.date_posted DESC',
-            (search_term, search_term)
+            'WHERE products_fts MATCH ? AND p.is_sold = 0 '
+            + (f'AND ({FTS_RANK}, p.id) > (?, ?) ' if cursor else '') +
+            'ORDER BY rank, p.id '
+            'LIMIT ?',
+            (match_query, *(cursor or ()), per_page + 1)
         ).fetchall()
+        products, next_cursor = split_page(products, per_page, rank_sort_key)
+
+        user_liked_ids = set()
+        if current_user.is_authenticated:
+            user_liked_ids = liked_product_ids(current_user.id, (row['id'] for row in products))
 
         return render_template(
             'product/search.html',
             title=f'Search Results for "{query}"',
             query=query,
-            products=products
+            products=products,
+            variants=image_variants(row['id'] for row in products),
+            user_liked_ids=user_liked_ids,
+            next_cursor=next_cursor
         )
 
-    except sqlite3.Error as e:
-        print(f"DB Error on search: {e}")
+    except sqlite3.Error:
+        logger.exception('DB error on search')
         flash('An error occurred while searching for products.', 'danger')
         return redirect(url_for('main.index'))
 
@@ -311,56 +344,104 @@ def toggle_sold(product_id):
         new_status = 1 if product['is_sold'] == 0 else 0
         db.execute('UPDATE products SET is_sold = ? WHERE id = ?', (new_status, product_id))
         db.commit()
+        invalidate_pages()
+        invalidate_product_detail(product_id)
 
         status_msg = 'marked as sold' if new_status == 1 else 'marked as available'
         flash(f'Your listing has been {status_msg}.', 'success')
         return redirect(url_for('product.product_view', product_id=product_id))
 
-    except sqlite3.Error as e:
+    except sqlite3.Error:
         db.rollback()
-        print(f"DB Error on toggle sold status: {e}")
+        logger.exception('DB error on toggle sold status', extra={'product_id': product_id})
         flash('An error occurred while updating your listing status.', 'danger')
         return redirect(url_for('product.product_view', product_id=product_id))
 
+def _write_like(db, product_id, user_id, liked):
+    # One INSERT OR IGNORE, plus a DELETE when that inserted nothing and the like should go
+    try:
+        inserted = liked is not False and db.execute(
+            'INSERT OR IGNORE INTO likes (user_id, product_id, timestamp) VALUES (?, ?, ?)',
+            (user_id, product_id, datetime.now())
+        ).rowcount == 1
+    except sqlite3.IntegrityError: # The likes.product_id foreign key: no such product
+        return None
+    if inserted:
+        liked = True
+    elif liked is not True:
+        db.execute('DELETE FROM likes WHERE user_id = ? AND product_id = ?', (user_id, product_id))
+        liked = False
+    product = db.execute('SELECT like_count FROM products WHERE id = ?', (product_id,)).fetchone()
+    if product is None:
+        return None
+    return liked, product['like_count']
+
+def set_like(product_id, user_id, liked=None):
+    """Likes or unlikes a product for a user and returns (liked, like_count), or None if there is no such product.
+
+    With liked=None the like is toggled; with True or False it is set, so a
+    retried request leaves the same state. The write goes through the write
+    batcher (see app.write_batch), whose BEGIN IMMEDIATE transaction holds the
+    writer lock from reading the state to changing it.
+    """
+    result = run_write('like', _write_like, product_id, user_id, liked)
+    if result is None:
+        return None
+    logger.debug('Liked product' if result[0] else 'Unliked product',
+                 extra={'product_id': product_id, 'user_id': user_id})
+    invalidate_pages()
+    invalidate_product_detail(product_id)
+    return result
+
+def _requested_like_state():
+    """The like state a request asks for: True/False from its liked field, None (toggle) if absent."""
+    value = request.form.get('liked', '').lower()
+    if value in ('1', 'true', 'yes'):
+        return True
+    if value in ('0', 'false', 'no'):
+        return False
+    return None
+
 @bp.route('/like/<int:product_id>', methods=['POST'])
 @login_required
 def like(product_id):
-    db = get_db()
-    user_id = current_user.id
-    print(f"User ID: {user_id}, Product ID: {product_id}")
-
     try:
-        existing_like = db.execute(
-            'SELECT 1 FROM likes WHERE user_id = ? AND product_id = ? LIMIT 1',
-            (user_id, product_id)
-        ).fetchone()
-
-        if existing_like:
-            db.execute(
-                'DELETE FROM likes WHERE user_id = ? AND product_id = ?',
-                (user_id, product_id)
-            )
-            db.commit()
-            print(f"Unliked product {product_id} by user {user_id}")
-        else:
-            db.execute(
-                'INSERT INTO likes (user_id, product_id, timestamp) VALUES (?, ?, ?)',
-                (user_id, product_id, datetime.now())
-            )
-            db.commit()
-            print(f"Liked product {product_id} by user {user_id}")
-
-    except sqlite3.Error as e:
-        db.rollback()
-        print(f"DB Error on toggling like for product {product_id} by user {user_id}: {e}")
+        if set_like(product_id, current_user.id, _requested_like_state()) is None:
+            flash('Product not found.', 'warning')
+            return redirect(url_for('main.index'))
+    except sqlite3.Error:
+        logger.exception('DB error on toggling like', extra={'product_id': product_id, 'user_id': current_user.id})
         flash('An error occurred. Please try again.', 'danger')
 
     return redirect(url_for('product.product_view', product_id=product_id))
 
+@bp.route('/like/<int:product_id>.json', methods=['POST'])
+@login_required
+def like_json(product_id):
+    """The like endpoint for likes.js: same as like, but answers with the new state instead of a page."""
+    try:
+        result = set_like(product_id, current_user.id, _requested_like_state())
+    except sqlite3.Error:
+        logger.exception('DB error on toggling like', extra={'product_id': product_id, 'user_id': current_user.id})
+        return jsonify(error='An error occurred. Please try again.'), 500
+    if result is None:
+        return jsonify(error='Product not found.'), 404
+    liked, like_count = result
+    return jsonify(product_id=product_id, liked=liked, like_count=like_count)
+
+def _write_comment(db, product_id, user_id, text):
+    try:
+        db.execute(
+            'INSERT INTO comments (user_id, product_id, text, timestamp) VALUES (?, ?, ?, ?)',
+            (user_id, product_id, text, datetime.now())
+        )
+    except sqlite3.IntegrityError: # The comments.product_id foreign key: no such product
+        return False
+    return True
+
 @bp.route('/comment/<int:product_id>', methods=['POST'])
 @login_required
 def comment(product_id):
-    db = get_db()
     text = request.form.get('text')
     user_id = current_user.id
 
@@ -369,16 +450,15 @@ def comment(product_id):
         return redirect(url_for('product.product_view', product_id=product_id, _anchor='comments'))
 
     try:
-        db.execute(
-            'INSERT INTO comments (user_id, product_id, text, timestamp) VALUES (?, ?, ?, ?)',
-            (user_id, product_id, text.strip(), datetime.now())
-        )
-        db.commit()
+        posted = run_write('comment', _write_comment, product_id, user_id, text.strip())
+        if not posted:
+            flash('Product not found.', 'warning')
+            return redirect(url_for('main.index'))
+        invalidate_product_detail(product_id)
         flash('Your comment has been posted!', 'success')
 
-    except sqlite3.Error as e:
-        db.rollback()
-        print(f"DB Error on commenting for product {product_id} by user {user_id}: {e}")
+    except sqlite3.Error:
+        logger.exception('DB error on commenting', extra={'product_id': product_id, 'user_id': user_id})
         flash('An error occurred while posting your comment.', 'danger')
 
-    return redirect(url_for('product.product_view', product_id=product_id, _anchor='comments'))
\ No newline at end of file
+    return redirect(url_for('product.product_view', product_id=product_id, _anchor='comments'))
@@ -0,0 +1,170 @@
+# app/product_detail.py
+import json
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+from db.db import get_read_db
+from .metrics import cache_lookup
+from .pagination import timestamp_sort_key, split_page
+from .reference import get_category
+
+
+class ProductDetailCache:
+    """Per-process LRU of assembled product pages (product, variants, first page of comments).
+
+    Entries hold nothing viewer-specific, so one entry serves every visitor.
+    Changes made through this process invalidate the product's entry directly;
+    the TTL bounds how stale an entry can be after a change made by another
+    app instance.
+
+    A page is loaded outside the lock, so an invalidation can land while it is
+    being built. Callers take version() before loading and hand it to put(),
+    which drops the page if the product was invalidated in between.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0 # Bumped by clear()
+        self._versions = {} # product_id -> invalidations since the last clear()
+
+    def get(self, product_id):
+        with self._lock:
+            entry = self._entries.get(product_id)
+            if entry is None:
+                return None
+            detail, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[product_id]
+                return None
+            self._entries.move_to_end(product_id)
+            return detail
+
+    def version(self, product_id):
+        with self._lock:
+            return self._generation, self._versions.get(product_id, 0)
+
+    def put(self, product_id, detail, version):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if version != (self._generation, self._versions.get(product_id, 0)):
+                return # Invalidated while it was loading
+            self._entries[product_id] = (detail, time.monotonic() + self.ttl)
+            self._entries.move_to_end(product_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, product_id):
+        with self._lock:
+            self._entries.pop(product_id, None)
+            self._versions[product_id] = self._versions.get(product_id, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._versions.clear()
+
+def _detail_cache():
+    cache = current_app.extensions.get('product_detail_cache')
+    if cache is None:
+        cache = current_app.extensions.setdefault(
+            'product_detail_cache',
+            ProductDetailCache(current_app.config['PRODUCT_CACHE_SIZE'], current_app.config['PRODUCT_CACHE_TTL'])
+        )
+    return cache
+
+def invalidate_product_detail(product_id=None):
+    """Drops a product's cached page, or every product's when product_id is None.
+
+    Call after anything shown on the product page changes: the listing, its
+    likes or comments, its images, or the seller's or a commenter's name.
+    """
+    cache = _detail_cache()
+    if product_id is None:
+        cache.clear()
+    else:
+        cache.invalidate(product_id)
+
+
+def product_comments(product_id, cursor=None):
+    """One page of a product's comments, newest first. Returns (comments, next_cursor)."""
+    per_page = current_app.config['COMMENTS_PER_PAGE']
+    parameters = [product_id]
+    after = ''
+    if cursor is not None:
+        after = 'AND (com.timestamp, com.id) < (?, ?)'
+        parameters.extend(cursor)
+    # Walks idx_comments_product_time backwards; the index ends in the rowid, so the id tiebreak is free
+    rows = get_read_db().execute(
+        f'''
+        SELECT com.id, com.text, com.timestamp, u.name AS commenter_name
+        FROM comments com
+        JOIN users u ON com.user_id = u.id
+        WHERE com.product_id = ? {after}
+        ORDER BY com.timestamp DESC, com.id DESC
+        LIMIT ?
+        ''',
+        (*parameters, per_page + 1)
+    ).fetchall()
+    rows, next_cursor = split_page(rows, per_page, sort_key=timestamp_sort_key)
+    return [dict(row) for row in rows], next_cursor
+
+
+def _load(product_id, viewer_id):
+    # The product, its counters, its image variants and whether the viewer likes it, in one statement
+    row = get_read_db().execute(
+        '''
+        SELECT
+            p.id, p.title, p.description, p.price, p.condition, p.image_path, p.date_posted,
+            p.category_id, p.seller_id, p.is_sold, p.like_count, p.comment_count,
+            u.name AS seller_name,
+            u.email AS seller_email,
+            (SELECT json_group_array(json_object(
+                        'variant', variant, 'image_url', image_url, 'width', width, 'height', height))
+             FROM product_images WHERE product_id = p.id) AS variants_json,
+            EXISTS (SELECT 1 FROM likes WHERE user_id = ? AND product_id = p.id) AS viewer_liked
+        FROM products p
+        JOIN users u ON p.seller_id = u.id
+        WHERE p.id = ?
+        ''',
+        (viewer_id, product_id)
+    ).fetchone()
+    if row is None:
+        return None, False
+    product = dict(row)
+    viewer_liked = bool(product.pop('viewer_liked'))
+    variants = {v['variant']: v for v in json.loads(product.pop('variants_json'))}
+    category = get_category(product['category_id'])
+    product['category_name'] = category['name'] if category else None
+    comments, next_cursor = product_comments(product_id)
+    detail = {'product': product, 'variants': variants, 'comments': comments, 'next_cursor': next_cursor}
+    return detail, viewer_liked
+
+def load_product_detail(product_id, viewer_id=None):
+    """The product page's view model and whether viewer_id likes the product.
+
+    Returns (detail, viewer_liked), or (None, False) if there is no such product.
+    detail is a dict with product, variants, comments (the first page) and
+    next_cursor, shared between viewers through the ProductDetailCache. A
+    cached page costs no query for anonymous visitors and one primary key
+    lookup of the like for a logged-in viewer.
+    """
+    cache = _detail_cache()
+    detail = cache.get(product_id)
+    cache_lookup('product', detail is not None)
+    if detail is None:
+        version = cache.version(product_id)
+        detail, viewer_liked = _load(product_id, viewer_id)
+        if detail is not None:
+            cache.put(product_id, detail, version)
+        return detail, viewer_liked
+    viewer_liked = viewer_id is not None and get_read_db().execute(
+        'SELECT 1 FROM likes WHERE user_id = ? AND product_id = ?', (viewer_id, product_id)
+    ).fetchone() is not None
+    return detail, viewer_liked
@@ -0,0 +1,141 @@
+# app/reference.py
+import hashlib
+import sqlite3
+import threading
+import time
+import click
+from flask import current_app, g
+from flask.cli import with_appcontext
+
+from db.db import get_db, get_read_db, run_sql_script
+from .metrics import cache_lookup
+
+
+class ReferenceData:
+    """In-process cache of the categories and campuses tables.
+
+    Both tables are tiny and almost never change, so they are loaded together
+    once and served from memory until invalidate() is called, the entry is
+    older than REFERENCE_CACHE_TTL seconds, or the shared stamp in the
+    reference_version table (see db/reference_version.sql) changes. The stamp
+    is read once per app context, so a change made by any process is picked up
+    by the others on their next request. `version` is a short hash of the
+    loaded rows, so it is the same in every process that holds the same data
+    and can be used in cache keys and ETags.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = None
+        self._loaded_at = 0.0
+        self._stamp = None
+
+    def _load(self):
+        db = get_read_db()
+        categories = tuple(dict(row) for row in db.execute(
+            'SELECT id, name, description FROM categories ORDER BY name'
+        ))
+        campuses = tuple(dict(row) for row in db.execute(
+            'SELECT id, name, city, state FROM campuses ORDER BY name'
+        ))
+        digest = hashlib.sha1(repr((categories, campuses)).encode()).hexdigest()[:12]
+        return {
+            'categories': categories,
+            'categories_by_id': {row['id']: row for row in categories},
+            'campuses': campuses,
+            'version': digest,
+        }
+
+    def _current_stamp(self):
+        if 'reference_stamp' not in g:
+            try:
+                row = get_read_db().execute('SELECT version FROM reference_version WHERE id = 1').fetchone()
+            except sqlite3.OperationalError:
+                row = None # A database from before reference_version.sql; only the TTL applies
+            g.reference_stamp = row['version'] if row else None
+        return g.reference_stamp
+
+    def _get(self):
+        stamp = self._current_stamp()
+        with self._lock:
+            stale = (self._data is None or stamp != self._stamp
+                     or time.monotonic() - self._loaded_at > self.ttl)
+            cache_lookup('reference', not stale)
+            if stale:
+                self._data = self._load()
+                self._loaded_at = time.monotonic()
+                self._stamp = stamp
+            return self._data
+
+    def invalidate(self):
+        with self._lock:
+            self._data = None
+
+    @property
+    def categories(self):
+        return self._get()['categories']
+
+    @property
+    def categories_by_id(self):
+        return self._get()['categories_by_id']
+
+    @property
+    def campuses(self):
+        return self._get()['campuses']
+
+    @property
+    def version(self):
+        return self._get()['version']
+
+
+def reference_data():
+    """Returns the current app's ReferenceData cache."""
+    cache = current_app.extensions.get('reference_data')
+    if cache is None:
+        cache = current_app.extensions.setdefault(
+            'reference_data', ReferenceData(current_app.config['REFERENCE_CACHE_TTL'])
+        )
+    return cache
+
+def get_categories():
+    """All categories ordered by name, as dicts with id, name and description."""
+    return reference_data().categories
+
+def get_category(category_id):
+    """A single category dict, or None if there is no such category."""
+    return reference_data().categories_by_id.get(category_id)
+
+def get_campuses():
+    """All campuses ordered by name, as dicts with id, name, city and state."""
+    return reference_data().campuses
+
+def invalidate_reference_data():
+    """Call after changing categories or campuses so this process reloads them.
+
+    Other processes see the change through the reference_version triggers.
+    """
+    reference_data().invalidate()
+    g.pop('reference_stamp', None)
+
+
+@click.command('refresh-reference-data')
+@with_appcontext
+def refresh_reference_data_command():
+    """Flask CLI command to make every running server reload categories/campuses, and print the version."""
+    try:
+        db = get_db()
+        run_sql_script(db, 'reference_version.sql')
+        db.execute('UPDATE reference_version SET version = version + 1')
+        db.commit()
+    except sqlite3.Error as e:
+        raise click.ClickException(f"Could not refresh reference data: {e}")
+    invalidate_reference_data()
+    cache = reference_data()
+    click.echo(f'Loaded {len(cache.categories)} categories and {len(cache.campuses)} campuses '
+               f'(version {cache.version}).')
+
+
+def init_app(app):
+    """Register the reference data CLI command with the Flask app."""
+    app.cli.add_command(refresh_reference_data_command)
@@ -1,64 +1,82 @@
 # app/routes.py
-from datetime import datetime
-from flask import Blueprint, redirect, render_template, abort, flash, request, url_for
-from flask_login import current_user, login_required
+import logging
+from datetime import datetime, timedelta
+from flask import Blueprint, current_app, render_template, abort, flash, request
+from flask_login import current_user
 import sqlite3
-from db.db import get_db
+from db.db import get_read_db, fts_match_query, FTS_RANK
+from .models import liked_product_ids
+from .images import image_variants
+from .page_cache import cached_page
+from .reference import get_campuses, get_categories
+from .pagination import page_size, request_cursor, split_page, rank_sort_key, timestamp_sort_key
+
+logger = logging.getLogger(__name__)
 
 bp = Blueprint('main', __name__)
 
 @bp.route('/')
 @bp.route('/index')
+@cached_page
 def index():
-    db = get_db()
+    db = get_read_db()
+    per_page = page_size()
+    cursor = request_cursor()
     user_liked_ids = set()
 
-    if current_user.is_authenticated:
-        try:
-            likes_data = db.execute(
-                'SELECT product_id FROM likes WHERE user_id = ?',
-                (current_user.id,)
-            ).fetchall()
-            user_liked_ids = {row['product_id'] for row in likes_data}
-        except sqlite3.Error as e:
-             print(f"DB Error fetching user likes: {e}")
-             flash("Could not load your liked items status.", "warning")
+    sql_conditions = ['p.is_sold = 0']
+    parameters = []
+    if cursor:
+        sql_conditions.append('(p.date_posted, p.id) < (?, ?)')
+        parameters.extend(cursor)
 
     try:
         products = db.execute(
-            '''
+            f'''
             SELECT
-                p.id, p.title, p.price, p.image_path, p.is_sold, p.date_posted,
+                p.id, p.title, p.price, p.image_path, p.is_sold, p.date_posted, p.like_count,
                 u.name AS seller_name,
-                c.name AS category_name,
-                (SELECT COUNT(*) FROM likes WHERE likes.product_id = p.id) AS like_count
+                c.name AS category_name
             FROM products p
             JOIN users u ON p.seller_id = u.id
             JOIN categories c ON p.category_id = c.id
-            WHERE p.is_sold = 0
-            ORDER BY p.date_posted DESC
-            LIMIT 24
-            '''
+            WHERE {' AND '.join(sql_conditions)}
+            ORDER BY p.date_posted DESC, p.id DESC
+            LIMIT ?
+            ''',
+            (*parameters, per_page + 1)
         ).fetchall()
-        return render_template('index.html', title="Home", products=products, user_liked_ids=user_liked_ids)
-    except sqlite3.Error as e:
-        print(f"DB Error fetching index products: {e}")
+        products, next_cursor = split_page(products, per_page)
+
+        if current_user.is_authenticated:
+            user_liked_ids = liked_product_ids(current_user.id, (row['id'] for row in products))
+
+        return render_template('index.html', title="Home", products=products, user_liked_ids=user_liked_ids,
+                               variants=image_variants(row['id'] for row in products), next_cursor=next_cursor)
+    except sqlite3.Error:
+        logger.exception('DB error fetching index products')
         flash("Could not retrieve products.", "danger")
         return render_template('index.html', title="Home", products=[], user_liked_ids=user_liked_ids)
 
 
 @bp.route('/profile/<int:user_id>')
-@login_required
 def profile(user_id):
-    db = get_db()
+    db = get_read_db()
+    per_page = page_size()
+    cursor = request_cursor()
+    reviews_cursor = request_cursor('reviews_cursor')
     try:
+        # Review and listing figures come precomputed from user_stats (see db/user_stats.sql)
         user_row = db.execute(
             '''
             SELECT
                 u.id, u.name, u.email, u.join_date, u.profile_info,
-                c.name AS campus_name
+                c.name AS campus_name,
+                s.review_count, s.rating_sum, s.rating_1, s.rating_2, s.rating_3, s.rating_4, s.rating_5,
+                s.available_count, s.sold_count, s.last_active
             FROM users u
             LEFT JOIN campuses c ON u.campus_id = c.id
+            LEFT JOIN user_stats s ON s.user_id = u.id
             WHERE u.id = ?
             ''',
             (user_id,)
@@ -67,102 +85,195 @@ def profile(user_id):
         if not user_row:
             abort(404)
 
+        listing_filter = 'AND (date_posted, id) < (?, ?)' if cursor else ''
         user_products_rows = db.execute(
-            '''
-            SELECT id, title, price, is_sold, image_path
+            f'''
+            SELECT id, title, price, is_sold, image_path, date_posted
             FROM products
-            WHERE seller_id = ?
-            ORDER BY date_posted DESC
+            WHERE seller_id = ? {listing_filter}
+            ORDER BY date_posted DESC, id DESC
+            LIMIT ?
             ''',
-            (user_id,)
+            (user_id, *(cursor or ()), per_page + 1)
         ).fetchall()
+        user_products_rows, next_cursor = split_page(user_products_rows, per_page)
 
+        reviews_per_page = current_app.config['REVIEWS_PER_PAGE']
+        review_filter = 'AND (r.timestamp, r.id) < (?, ?)' if reviews_cursor else ''
         reviews_rows = db.execute(
-            '''
+            f'''
             SELECT
-                r.comment,
+                r.id,
+                r.comment AS text,
                 r.rating,
                 r.timestamp,
                 u.name AS reviewer_name
             FROM reviews r
             JOIN users u ON r.reviewer_id = u.id
-            WHERE r.reviewed_user_id = ?
-            ORDER BY r.timestamp DESC
+            WHERE r.reviewed_user_id = ? {review_filter}
+            ORDER BY r.timestamp DESC, r.id DESC
+            LIMIT ?
             ''',
-            (user_id,)
+            (user_id, *(reviews_cursor or ()), reviews_per_page + 1)
         ).fetchall()
+        reviews_rows, next_reviews_cursor = split_page(reviews_rows, reviews_per_page, timestamp_sort_key)
 
-        avg_rating_row = db.execute(
-             "SELECT AVG(rating) as average_rating FROM reviews WHERE reviewed_user_id = ?",
-             (user_id,)
-         ).fetchone()
-        avg_rating = avg_rating_row['average_rating'] if avg_rating_row and avg_rating_row['average_rating'] is not None else None
+        review_count = user_row['review_count'] or 0
+        avg_rating = user_row['rating_sum'] / review_count if review_count else None
+        rating_distribution = [(stars, user_row[f'rating_{stars}'] or 0) for stars in range(5, 0, -1)]
 
         return render_template(
             'profile.html',
             title=f"{user_row['name']}'s Profile",
             user=user_row,
             user_products=user_products_rows,
+            next_cursor=next_cursor,
             reviews=reviews_rows,
-            average_rating=avg_rating
+            next_reviews_cursor=next_reviews_cursor,
+            review_count=review_count,
+            average_rating=avg_rating,
+            rating_distribution=rating_distribution
         )
 
-    except sqlite3.Error as e:
-        print(f"DB Error on profile view (user_id: {user_id}): {e}")
+    except sqlite3.Error:
+        logger.exception('DB error on profile view', extra={'user_id': user_id})
         flash("Could not retrieve complete profile information.", "danger")
         abort(500)
 
-@bp.route('/search')
-def search():
-    keyword = request.args.get('keyword', default='', type=str).strip()
-    category_id_str = request.args.get('category', default='', type=str)
-    min_price_str = request.args.get('min_price', default='', type=str)
-    max_price_str = request.args.get('max_price', default='', type=str)
-    condition = request.args.get('condition', default='', type=str)
-    status = request.args.get('status', default='available', type=str)
+SEARCH_CONDITIONS = ('new', 'like_new', 'good', 'fair', 'poor')
+SEARCH_STATUSES = ('available', 'sold', 'all')
 
-    category_id = None
-    if category_id_str.isdigit():
-        try:
-            category_id = int(category_id_str)
-        except ValueError:
-            category_id = None
+SEARCH_COLUMNS = """
+    p.id, p.title, p.price, p.image_path, p.is_sold, p.date_posted, p.like_count,
+    c.name as category_name, u.name as seller_name
+"""
 
-    min_price = None
+def _price_arg(args, name):
+    value = args.get(name, default='', type=str)
+    if not value:
+        return None
     try:
-        if min_price_str: min_price = float(min_price_str)
-        if min_price is not None and min_price < 0: min_price = 0.0
+        return max(float(value), 0.0)
     except ValueError:
-        min_price = None
+        return None
 
-    max_price = None
-    try:
-        if max_price_str: max_price = float(max_price_str)
-        if max_price is not None and max_price < 0: max_price = 0.0
-    except ValueError:
-        max_price = None
+def parse_search_filters(args):
+    """The search filters in a request's query arguments (main.search, api.search), validated.
 
+    Returns a dict with keyword, category_id, min_price, max_price, condition
+    and status. Invalid values are dropped rather than rejected: a bad price or
+    category is ignored, an unknown condition means any, an unknown status
+    means available, and a reversed price range is swapped.
+    """
+    category_id_str = args.get('category', default='', type=str)
+    min_price = _price_arg(args, 'min_price')
+    max_price = _price_arg(args, 'max_price')
     if min_price is not None and max_price is not None and min_price > max_price:
-         min_price, max_price = max_price, min_price
+        min_price, max_price = max_price, min_price
+    condition = args.get('condition', default='', type=str)
+    status = args.get('status', default='available', type=str)
+    return {
+        'keyword': args.get('keyword', default='', type=str).strip(),
+        'category_id': int(category_id_str) if category_id_str.isdigit() else None,
+        'min_price': min_price,
+        'max_price': max_price,
+        'condition': condition if condition in SEARCH_CONDITIONS else '',
+        'status': status if status in SEARCH_STATUSES else 'available',
+    }
 
-    allowed_conditions = ['new', 'like_new', 'good', 'fair', 'poor']
-    if condition not in allowed_conditions:
-        condition = ''
+def search_cursor(match_query, arg='cursor'):
+    """The request's cursor if it fits the search's sort order, else None.
 
-    allowed_statuses = ['available', 'sold', 'all']
-    if status not in allowed_statuses:
-        status = 'available'
+    Keyword searches are ordered by relevance, everything else by date, and the
+    cursor holds whichever sort value applies; one left over from the other
+    mode is dropped.
+    """
+    cursor = request_cursor(arg)
+    if cursor and isinstance(cursor[0], str) == bool(match_query):
+        return None
+    return cursor
 
-    filters_applied = False
-    if keyword or category_id is not None or min_price is not None or max_price is not None or condition or status != 'available':
-        filters_applied = True
-    if status == 'available' and not (keyword or category_id is not None or min_price is not None or max_price is not None or condition):
-         filters_applied = False
+def search_query(filters, match_query, cursor, limit, columns=SEARCH_COLUMNS):
+    """SQL and parameters for one page (limit rows) of products matching parse_search_filters' filters.
 
+    Products are joined with their category (c) and seller (u) for columns.
+    Keyword searches select the relevance as rank and sort on it (page them
+    with rank_sort_key); the rest sort by date.
+    """
+    query = f"SELECT {columns}"
+    if match_query:
+        query += f", {FTS_RANK} AS rank"
+    query += """
+        FROM products p
+        JOIN categories c ON p.category_id = c.id
+        JOIN users u ON p.seller_id = u.id
+    """
+    if match_query:
+        query += " JOIN products_fts ON products_fts.rowid = p.id"
+    sql_conditions = []
+    parameters = []
+
+    if filters['status'] == 'sold':
+         sql_conditions.append("p.is_sold = 1")
+    elif filters['status'] == 'available':
+         sql_conditions.append("p.is_sold = 0")
+
+    if match_query:
+        sql_conditions.append("products_fts MATCH ?")
+        parameters.append(match_query)
+
+    if filters['category_id'] is not None:
+        sql_conditions.append("p.category_id = ?")
+        parameters.append(filters['category_id'])
+
+    if filters['condition']:
+         sql_conditions.append("p.condition = ?")
+         parameters.append(filters['condition'])
+
+    if filters['min_price'] is not None:
+        sql_conditions.append("p.price >= ?")
+        parameters.append(filters['min_price'])
+    if filters['max_price'] is not None:
+        sql_conditions.append("p.price <= ?")
+        parameters.append(filters['max_price'])
+
+    if cursor and match_query:
+        sql_conditions.append(f"({FTS_RANK}, p.id) > (?, ?)")
+        parameters.extend(cursor)
+    elif cursor:
+        sql_conditions.append("(p.date_posted, p.id) < (?, ?)")
+        parameters.extend(cursor)
+
+    if sql_conditions:
+        query += " WHERE " + " AND ".join(sql_conditions)
+
+    if match_query:
+        query += " ORDER BY rank, p.id"
+    else:
+        query += " ORDER BY p.date_posted DESC, p.id DESC"
+    query += " LIMIT ?"
+    parameters.append(limit)
+    return query, parameters
 
-    db = get_db()
+@bp.route('/search')
+def search():
+    filters = parse_search_filters(request.args)
+    keyword = filters['keyword']
+    category_id = filters['category_id']
+    min_price_str = request.args.get('min_price', default='', type=str)
+    max_price_str = request.args.get('max_price', default='', type=str)
+    condition = filters['condition']
+    status = filters['status']
+
+    filters_applied = bool(keyword or category_id is not None or filters['min_price'] is not None
+                           or filters['max_price'] is not None or condition or status != 'available')
+
+    db = get_read_db()
     products = []
     categories = []
+    user_liked_ids = set()
+    next_cursor = None
+    per_page = page_size()
     condition_choices = [
         ('new', 'New (unused)'),
         ('like_new', 'Like New (barely used)'),
@@ -171,66 +282,26 @@ def search():
         ('poor', 'Poor (significant wear)')
     ]
 
-    try:
-        categories = db.execute("SELECT id, name FROM categories ORDER BY name").fetchall()
-
-        base_query = """
-            SELECT
-                p.id, p.title, p.price, p.image_path, p.is_sold, p.date_posted,
-                c.name as category_name, u.name as seller_name,
-                (SELECT COUNT(*) FROM likes WHERE likes.product_id = p.id) AS like_count
-            FROM products p
-            JOIN categories c ON p.category_id = c.id
-            JOIN users u ON p.seller_id = u.id
-        """
-        sql_conditions = []
-        parameters = []
-
-        if status == 'sold':
-             sql_conditions.append("p.is_sold = 1")
-        elif status == 'available':
-             sql_conditions.append("p.is_sold = 0")
-
-        if keyword:
-            sql_conditions.append("(p.title LIKE ? OR p.description LIKE ?)")
-            parameters.extend([f"%{keyword}%", f"%{keyword}%"])
+    match_query = fts_match_query(keyword)
+    cursor = search_cursor(match_query)
 
-        if category_id is not None:
-            sql_conditions.append("p.category_id = ?")
-            parameters.append(category_id)
-
-        if condition:
-             sql_conditions.append("p.condition = ?")
-             parameters.append(condition)
-
-        if min_price is not None:
-            sql_conditions.append("p.price >= ?")
-            parameters.append(min_price)
-        if max_price is not None:
-            sql_conditions.append("p.price <= ?")
-            parameters.append(max_price)
-
-        query = base_query
-        if sql_conditions:
-            query += " WHERE " + " AND ".join(sql_conditions)
-
-        query += " ORDER BY p.date_posted DESC"
+    try:
+        categories = get_categories()
 
-        # print(f"DEBUG Search SQL: {query}")
-        # print(f"DEBUG Search Params: {parameters}")
+        query, parameters = search_query(filters, match_query, cursor, per_page + 1)
+        logger.debug('Search query', extra={'sql': query, 'params': parameters})
 
         products = db.execute(query, parameters).fetchall()
+        if match_query:
+            products, next_cursor = split_page(products, per_page, rank_sort_key)
+        else:
+            products, next_cursor = split_page(products, per_page)
 
-        user_liked_ids = set()
         if current_user.is_authenticated:
-             try:
-                 likes_data = db.execute('SELECT product_id FROM likes WHERE user_id = ?', (current_user.id,)).fetchall()
-                 user_liked_ids = {row['product_id'] for row in likes_data}
-             except sqlite3.Error as like_e:
-                  print(f"Error fetching user likes during search: {like_e}")
-
-    except sqlite3.Error as e:
-        print(f"Error during database operation in search: {e}")
+            user_liked_ids = liked_product_ids(current_user.id, (row['id'] for row in products))
+
+    except sqlite3.Error:
+        logger.exception('DB error on search')
         flash("An error occurred while searching for products. Please check the criteria and try again.", "danger")
         products = []
 
@@ -246,29 +317,76 @@ def search():
     return render_template('search_results.html',
                            title='Search Results',
                            products=products,
+                           variants=image_variants(row['id'] for row in products),
                            categories=categories,
                            conditions=condition_choices,
                            search_params=search_params,
                            user_liked_ids=user_liked_ids,
+                           next_cursor=next_cursor,
                            filters_applied=filters_applied)
 
+# Days of listing activity shown on the stats page
+STATS_DAYS = 30
+
+def _stats_row(name, row):
+    """Display figures for one group of stats rows (row may be None for an empty group)."""
+    available, sold = (row['available'], row['sold']) if row else (0, 0)
+    listings = available + sold
+    return {
+        'name': name,
+        'listings': listings,
+        'available': available,
+        'sold': sold,
+        'average_price': row['price_sum'] / listings if listings else None,
+        'likes': row['likes'] if row else 0,
+    }
+
 @bp.route('/stats')
 def stats():
-    query = """
-        SELECT c.name, COUNT(p.id) as product_count
-        FROM categories c
-        LEFT JOIN products p ON c.id = p.category_id
-        GROUP BY c.id, c.name
-        ORDER BY product_count DESC, c.name;
+    """Marketplace statistics, read only from the stats summary tables (see db/stats.sql)."""
+    db = get_read_db()
+    totals_sql = """
+        SELECT {key} AS key, SUM(available_count) AS available, SUM(sold_count) AS sold,
+               SUM(price_sum) AS price_sum, SUM(like_count) AS likes
+        FROM {table} {where}
+        GROUP BY {key}
     """
-    db = get_db()
-    category_counts = []
+    category_stats, campus_stats, daily_stats, overall = [], [], [], None
     try:
-        category_counts = db.execute(query).fetchall()
-    except sqlite3.Error as e:
-        print(f"An error occurred fetching stats: {e}")
+        # All-time figures come from stats_totals, one row per category and campus
+        by_category = {row['key']: row for row in db.execute(
+            totals_sql.format(key='category_id', table='stats_totals', where=''))}
+        by_campus = {row['key']: row for row in db.execute(
+            totals_sql.format(key='campus_id', table='stats_totals', where=''))}
+        by_day = db.execute(
+            totals_sql.format(key='day', table='stats', where='WHERE day >= ?') + ' ORDER BY day DESC',
+            ((datetime.now() - timedelta(days=STATS_DAYS - 1)).strftime('%Y-%m-%d'),)
+        ).fetchall()
+
+        category_stats = sorted(
+            (_stats_row(cat['name'], by_category.get(cat['id'])) for cat in get_categories()),
+            key=lambda row: (-row['listings'], row['name'])
+        )
+        campus_names = {campus['id']: campus['name'] for campus in get_campuses()}
+        campus_names[0] = 'No campus'
+        campus_stats = sorted(
+            (_stats_row(campus_names.get(key, f'Campus {key}'), row) for key, row in by_campus.items()),
+            key=lambda row: (-row['listings'], row['name'])
+        )
+        campus_stats = [row for row in campus_stats if row['listings']]
+        daily_stats = [row for row in (_stats_row(day['key'], day) for day in by_day) if row['listings']]
+        overall = _stats_row('All listings', {
+            field: sum(row[field] for row in by_category.values())
+            for field in ('available', 'sold', 'price_sum', 'likes')
+        })
+    except sqlite3.Error:
+        logger.exception('DB error fetching stats')
         flash("Could not retrieve statistics.", "danger")
 
     return render_template('stats.html',
                            title='Marketplace Statistics',
-                           category_counts=category_counts)
\ No newline at end of file
+                           overall=overall,
+                           category_stats=category_stats,
+                           campus_stats=campus_stats,
+                           daily_stats=daily_stats,
+                           stats_days=STATS_DAYS)
@@ -0,0 +1,48 @@
+// Like buttons without a page reload. A form.like-form posts to its
+// data-like-url (product.like_json) and updates its button in place from the
+// answer; its hidden "liked" field asks for the new state rather than a toggle,
+// so a double click or a retried request cannot undo itself. Without JavaScript,
+// or if the request fails, the form submits normally to product.like.
+document.addEventListener("submit", function (event) {
+  var form = event.target.closest("form.like-form[data-like-url]");
+  if (!form) {
+    return;
+  }
+  event.preventDefault();
+  if (form.dataset.pending) {
+    return;
+  }
+  form.dataset.pending = "1";
+
+  fetch(form.dataset.likeUrl, {
+    method: "POST",
+    body: new FormData(form),
+    headers: { Accept: "application/json" },
+    credentials: "same-origin",
+  })
+    .then(function (response) {
+      var type = response.headers.get("Content-Type") || "";
+      if (!response.ok || type.indexOf("application/json") === -1) {
+        throw new Error("Like request failed: " + response.status);
+      }
+      return response.json();
+    })
+    .then(function (data) {
+      var button = form.querySelector("button");
+      button.classList.toggle("liked", data.liked);
+      form.querySelector('input[name="liked"]').value = data.liked ? "0" : "1";
+      form.querySelectorAll("[data-like-icon]").forEach(function (el) {
+        el.textContent = data.liked ? "♥" : "♡";
+      });
+      form.querySelectorAll("[data-like-text]").forEach(function (el) {
+        el.textContent = data.liked ? "Liked" : "Like";
+      });
+      form.querySelectorAll("[data-like-count]").forEach(function (el) {
+        el.textContent = data.like_count;
+      });
+      delete form.dataset.pending;
+    })
+    .catch(function () {
+      form.submit(); // Fall back to the full-page round trip (e.g. a logged-out session)
+    });
+});
@@ -0,0 +1,155 @@
+# app/write_batch.py
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from flask import current_app, g
+
+from db.db import get_db
+from .metrics import BATCHED_WRITES, WRITE_BATCH_SECONDS, WRITE_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class _Write:
+    __slots__ = ('kind', 'func', 'args', 'future')
+
+    def __init__(self, kind, func, args):
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.future = Future()
+
+
+def _apply_writes(db, writes):
+    """Runs writes in one BEGIN IMMEDIATE transaction on db and commits them together.
+
+    Each write runs in its own savepoint, so one that raises is rolled back and
+    gets the exception on its future while the rest still commit. Futures are
+    only resolved after the commit, so a result means the write is durable.
+    """
+    started = time.perf_counter()
+    outcomes = []
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        for write in writes:
+            db.execute('SAVEPOINT batched_write')
+            try:
+                outcomes.append((write, write.func(db, *write.args), None))
+            except Exception as e:
+                db.execute('ROLLBACK TO batched_write')
+                outcomes.append((write, None, e))
+            db.execute('RELEASE batched_write')
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    WRITE_BATCH_SIZE.observe(len(writes))
+    WRITE_BATCH_SECONDS.observe(time.perf_counter() - started)
+    for write, result, error in outcomes:
+        if error is None:
+            BATCHED_WRITES.inc(1, write.kind, 'ok')
+            write.future.set_result(result)
+        else:
+            BATCHED_WRITES.inc(1, write.kind, 'error')
+            write.future.set_exception(error)
+
+
+class WriteBatcher:
+    """Group commit for small, frequent writes (likes and comments).
+
+    Request threads hand their writes to a single writer thread and wait on a
+    future. The writer takes the first queued write, gathers whatever else
+    arrives within WRITE_BATCH_INTERVAL_MS up to WRITE_BATCH_SIZE writes, and
+    commits them in one transaction, so a burst pays for one commit and one
+    round on the writer lock instead of one per request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.max_size = app.config['WRITE_BATCH_SIZE']
+        self.interval = app.config['WRITE_BATCH_INTERVAL_MS'] / 1000
+        # Generous: a write waits for its batch, and the batch may wait busy_timeout for the lock
+        self.timeout = app.config['DB_BUSY_TIMEOUT_MS'] / 1000 * 2
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._work, name='write-batcher', daemon=True).start()
+
+    def submit(self, kind, func, *args):
+        """Queues func(db, *args) for the next batch and returns its Future."""
+        self.start()
+        write = _Write(kind, func, args)
+        self._queue.put(write)
+        return write.future
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.max_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                # One app context per batch, so the writer connection goes back to the pool in between
+                with self.app.app_context():
+                    _apply_writes(get_db(), batch)
+            except Exception as e:
+                logger.exception('Write batch failed', extra={'batch_size': len(batch)})
+                for write in batch:
+                    if not write.future.done():
+                        BATCHED_WRITES.inc(1, write.kind, 'error')
+                        write.future.set_exception(e)
+
+
+def run_write(kind, func, *args):
+    """Runs func(db, *args) on the writer connection and returns its result once committed.
+
+    func must not commit; kind labels the write in the metrics. With the batcher
+    enabled the write is committed by the writer thread together with others,
+    otherwise in its own transaction on this request's connection. Raises what
+    func raised, or sqlite3.Error if the write could not be committed in time.
+
+    The writer thread needs the writer connection, so a request must not be
+    holding it (get_db()) while it waits here, and without the batcher the
+    connection must not have a transaction open. Either raises RuntimeError
+    rather than waiting out the timeout or failing inside BEGIN.
+    """
+    batcher = current_app.extensions.get('write_batcher')
+    if batcher is None:
+        db = get_db()
+        if db.in_transaction:
+            raise RuntimeError(f'The {kind} write needs its own transaction, but the writer connection '
+                               'already has one open; commit or roll it back first')
+        write = _Write(kind, func, args)
+        _apply_writes(db, [write])
+        return write.future.result()
+    if 'db' in g:
+        raise RuntimeError(f'The {kind} write would wait for the writer connection, which this app context '
+                           'holds (get_db()); batched writes must be made without it')
+    future = batcher.submit(kind, func, *args)
+    try:
+        return future.result(timeout=batcher.timeout)
+    except TimeoutError:
+        # The write may still commit later; the caller just cannot wait for it
+        raise sqlite3.OperationalError(f'Timed out waiting for the {kind} write to commit')
+
+def init_app(app):
+    """Set up the write batcher when WRITE_BATCH_SIZE allows more than one write per commit."""
+    if app.config['WRITE_BATCH_SIZE'] > 1:
+        app.extensions['write_batcher'] = WriteBatcher(app)
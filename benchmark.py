@@ -0,0 +1,371 @@
+"""Benchmarks the hot routes against a seeded database through the Flask test client.
+
+    python benchmark.py                                  # ~2k listings, compare to the baseline
+    python benchmark.py --users 5000 --products-per-user 15 25 --requests 500
+    python benchmark.py --save-baseline                  # Record this run as the baseline
+    python benchmark.py -k search                        # Only scenarios whose name contains "search"
+
+Seeded databases and each run's results are kept in instance/benchmarks/, the
+databases keyed by their size and seed, so later runs of the same size skip
+seeding (--reseed forces it). Results are compared scenario by scenario with
+the baseline in benchmarks/baseline.json, which is committed so every checkout
+has one to compare against;
+--fail-on-regression exits with status 1 when a scenario's --metric (p50 by
+default; the tail percentiles are noisy on shared machines) got slower than
+--tolerance.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from config import Config
+from db.db import ConnectionPool
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_DIR = os.path.join(BASE_DIR, 'instance', 'benchmarks') # Seeded databases and per-run results
+BASELINE_PATH = os.path.join(BASE_DIR, 'benchmarks', 'baseline.json') # Tracked in git
+
+# Statements counted as queries; the rest (PRAGMA, BEGIN, COMMIT, trigger bodies) are bookkeeping
+_QUERY_PREFIXES = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+SEARCH_KEYWORDS = ('textbook', 'laptop', 'used', 'chair', 'nike', 'guitar', 'ticket', 'tutoring')
+
+
+class QueryCounter:
+    """Counts the SQL statements run by the app's pooled connections."""
+
+    def __init__(self):
+        self.count = 0
+
+    def trace(self, statement):
+        if statement.lstrip().upper().startswith(_QUERY_PREFIXES):
+            self.count += 1
+
+
+class CountingPool(ConnectionPool):
+    def __init__(self, config, counter, read_only=False):
+        super().__init__(config, read_only=read_only)
+        self.counter = counter
+
+    def _connect(self):
+        conn = super()._connect()
+        conn.set_trace_callback(self.counter.trace)
+        return conn
+
+
+def schema_version():
+    """Short hash of the schema scripts, so a schema change never reuses an older seed."""
+    from db.db import SCHEMA_SCRIPTS
+    digest = hashlib.sha1()
+    for script in SCHEMA_SCRIPTS:
+        with open(os.path.join(BASE_DIR, 'db', script), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:8]
+
+def seeded_database(args):
+    """Path of a database seeded to the requested size, seeding it first if needed."""
+    name = (f'bench_u{args.users}_p{args.products_per_user[0]}-{args.products_per_user[1]}_s{args.seed}'
+            f'_{schema_version()}.sqlite')
+    path = os.path.join(BENCH_DIR, name)
+    if os.path.exists(path) and not args.reseed:
+        print(f"Using seeded database {path}")
+        return path
+
+    # Seeded under a temporary name so an interrupted run is never mistaken for a finished one
+    partial = path + '.partial'
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(partial + suffix):
+            os.remove(partial + suffix)
+
+    from app import create_app
+    from db.db import init_db, get_pool
+    app = create_app(bench_config(partial))
+    with app.app_context():
+        init_db()
+    get_pool(app).close_all() # Let the seeder switch the journal mode
+
+    import seeder
+    seeder.DB_PATH = partial
+    random.seed(args.seed)
+    seeder.fake.seed_instance(args.seed)
+    conn = seeder.get_db_connection()
+    state = seeder.begin_bulk_load(conn)
+    try:
+        campus_map = seeder.seed_campuses(conn)
+        category_map = seeder.seed_categories(conn)
+        user_ids = seeder.seed_users(conn, args.users, campus_map)
+        product_id_map = seeder.seed_products(conn, user_ids, category_map, args.products_per_user,
+                                              workers=args.workers)
+        product_ids = list(product_id_map.keys())
+        seeder.seed_comments(conn, user_ids, product_ids, seeder.NUM_COMMENTS_PER_PRODUCT_RANGE)
+        seeder.seed_likes(conn, user_ids, product_ids, seeder.LIKE_PROBABILITY)
+        seeder.seed_reviews(conn, user_ids, product_id_map, seeder.NUM_REVIEWS_PER_USER_RANGE)
+    finally:
+        seeder.end_bulk_load(conn, state)
+        conn.close()
+    os.replace(partial, path)
+    return path
+
+def bench_config(database):
+    class BenchConfig(Config):
+        DATABASE = database
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        JOBS_SYNC = True # No worker threads competing with the measured requests
+        PAGE_CACHE_BACKEND = 'memory'
+        LOG_LEVEL = 'WARNING' # Slow-query and N+1 warnings still show
+    return BenchConfig
+
+
+def search_scenarios(rng, category_ids):
+    """One main.search scenario per combination of its filters."""
+    filters = {
+        'keyword': lambda: {'keyword': rng.choice(SEARCH_KEYWORDS)},
+        'category': lambda: {'category': rng.choice(category_ids)},
+        'price': lambda: {'min_price': rng.choice((0, 10, 25)), 'max_price': rng.choice((50, 100, 300))},
+        'condition': lambda: {'condition': rng.choice(('new', 'like_new', 'good', 'fair', 'poor'))},
+        'status': lambda: {'status': rng.choice(('sold', 'all'))},
+    }
+    scenarios = []
+    for size in range(len(filters) + 1):
+        for combo in itertools.combinations(filters, size):
+            def params(combo=combo):
+                args = {}
+                for name in combo:
+                    args.update(filters[name]())
+                return args
+            label = '+'.join(combo) or 'no filters'
+            scenarios.append((f'main.search [{label}]', 'GET', lambda params=params: ('/search', params(), None)))
+    return scenarios
+
+def build_scenarios(db_path, rng):
+    """(name, method, request factory) for every benchmarked route.
+
+    A factory returns (path, query args, form data) for one request, picking
+    random but reproducible ids from the seeded database.
+    """
+    db = sqlite3.connect(db_path)
+    product_ids = [row[0] for row in db.execute('SELECT id FROM products')]
+    category_ids = [row[0] for row in db.execute('SELECT id FROM categories')]
+    seller_ids = [row[0] for row in db.execute('SELECT DISTINCT seller_id FROM products')]
+    db.close()
+
+    scenarios = [
+        ('main.index', 'GET', lambda: ('/', {}, None)),
+        ('main.search (no args)', 'GET', lambda: ('/search', {}, None)),
+    ]
+    scenarios += search_scenarios(rng, category_ids)
+    scenarios += [
+        ('product.product_view', 'GET', lambda: (f'/product/{rng.choice(product_ids)}', {}, None)),
+        ('product.by_category', 'GET', lambda: (f'/product/category/{rng.choice(category_ids)}', {}, None)),
+        ('main.profile', 'GET', lambda: (f'/profile/{rng.choice(seller_ids)}', {}, None)),
+        ('main.stats', 'GET', lambda: ('/stats', {}, None)),
+        ('product.like (POST)', 'POST', lambda: (f'/product/like/{rng.choice(product_ids)}', {}, {})),
+        ('product.comment (POST)', 'POST',
+         lambda: (f'/product/comment/{rng.choice(product_ids)}', {}, {'text': 'Is this still available?'})),
+    ]
+    return scenarios
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+class ScenarioStats:
+    """Timings and query counts collected for one scenario across all rounds."""
+
+    def __init__(self):
+        self.timings = []
+        self.queries = []
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def summary(self):
+        timings = sorted(self.timings)
+        return {
+            'requests': len(timings),
+            'errors': self.errors,
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'queries_per_request': round(statistics.fmean(self.queries), 2),
+            'throughput_rps': round(len(timings) / self.elapsed, 1),
+        }
+
+def run_scenario(client, counter, method, make_request, requests, warmup, stats):
+    for i in range(warmup + requests):
+        path, query_args, data = make_request()
+        counter.count = 0
+        t0 = time.perf_counter()
+        if method == 'GET':
+            response = client.get(path, query_string=query_args)
+        else:
+            response = client.post(path, query_string=query_args, data=data)
+        elapsed = time.perf_counter() - t0
+        if i < warmup:
+            continue
+        if response.status_code >= 400:
+            stats.errors += 1
+        stats.timings.append(elapsed * 1000)
+        stats.queries.append(counter.count)
+        stats.elapsed += elapsed
+
+def run_benchmarks(args, db_path):
+    from app import create_app
+    app = create_app(bench_config(db_path))
+    counter = QueryCounter()
+    app.extensions['db_read_pool'] = CountingPool(app.config, counter, read_only=True)
+    app.extensions['db_write_pool'] = CountingPool(app.config, counter)
+
+    with sqlite3.connect(db_path) as db:
+        email = db.execute('SELECT email FROM users ORDER BY id LIMIT 1').fetchone()[0]
+    client = app.test_client()
+    response = client.post('/auth/login', data={'email': email, 'password': 'password'})
+    if response.status_code != 302:
+        raise SystemExit(f'Could not log in as {email} (status {response.status_code})')
+
+    rng = random.Random(args.seed)
+    scenarios = [s for s in build_scenarios(db_path, rng) if not args.k or args.k in s[0]]
+    stats = {name: ScenarioStats() for name, _, _ in scenarios}
+    # Scenarios take turns over several rounds, so drift in machine load over the run
+    # is spread across all of them instead of landing on whichever ran at the time
+    per_round = max(1, args.requests // args.rounds)
+    for round_number in range(args.rounds):
+        for name, method, make_request in scenarios:
+            run_scenario(client, counter, method, make_request, per_round,
+                         args.warmup if round_number == 0 else 0, stats[name])
+
+    results = {}
+    for name, _, _ in scenarios:
+        r = results[name] = stats[name].summary()
+        print(f"{name:<55} p50 {r['p50_ms']:8.2f} ms  p95 {r['p95_ms']:8.2f} ms  p99 {r['p99_ms']:8.2f} ms  "
+              f"{r['queries_per_request']:5.1f} q/req  {r['throughput_rps']:7.1f} req/s"
+              + (f"  {r['errors']} errors" if r['errors'] else ''))
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def table_sizes(db_path):
+    with sqlite3.connect(db_path) as db:
+        return {table: db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('users', 'products', 'comments', 'likes', 'reviews')}
+
+def compare(results, baseline, tolerance, metric='p50'):
+    """Prints p50/p95 changes against the baseline. Returns the names of scenarios whose metric regressed."""
+    regressions = []
+    print(f"\nCompared with baseline from {baseline['meta'].get('timestamp')} "
+          f"(revision {baseline['meta'].get('revision')}):")
+    for name, r in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f"  {name:<55} (new scenario)")
+            continue
+        changes = {
+            pct: r[f'{pct}_ms'] / base[f'{pct}_ms'] - 1 if base[f'{pct}_ms'] else 0.0
+            for pct in ('p50', 'p95', 'p99')
+        }
+        p50_change, p95_change = changes['p50'], changes['p95']
+        query_change = r['queries_per_request'] - base['queries_per_request']
+        flag = ''
+        if changes[metric] > tolerance:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"  {name:<55} p50 {p50_change:+7.1%}  p95 {p95_change:+7.1%}  queries {query_change:+.1f}{flag}")
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the hot routes against a seeded database.")
+    parser.add_argument('--users', type=int, default=400, help="Users to seed (default: %(default)s)")
+    parser.add_argument('--products-per-user', type=int, nargs=2, metavar=('MIN', 'MAX'), default=(2, 8),
+                        help="Listings per user (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=1, help="Seed for the data set and request mix (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=1, help="Seeder processes (default: %(default)s)")
+    parser.add_argument('--reseed', action='store_true', help="Seed a new database even if one of this size exists")
+    parser.add_argument('--requests', type=int, default=200, help="Measured requests per scenario (default: %(default)s)")
+    parser.add_argument('--rounds', type=int, default=5,
+                        help="Rounds the requests are split over, interleaving the scenarios (default: %(default)s)")
+    parser.add_argument('--warmup', type=int, default=20, help="Unmeasured requests per scenario (default: %(default)s)")
+    parser.add_argument('-k', metavar='TEXT', help="Only run scenarios whose name contains TEXT")
+    parser.add_argument('--output', default=os.path.join(BENCH_DIR, 'results.json'),
+                        help="Where to write the results (default: %(default)s)")
+    parser.add_argument('--baseline', default=BASELINE_PATH,
+                        help="Baseline to compare with (default: %(default)s)")
+    parser.add_argument('--save-baseline', action='store_true', help="Also store these results as the baseline")
+    parser.add_argument('--metric', choices=('p50', 'p95', 'p99'), default='p50',
+                        help="Latency percentile checked for regressions (default: %(default)s)")
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help="Slowdown reported as a regression, as a fraction (default: %(default)s)")
+    parser.add_argument('--fail-on-regression', action='store_true', help="Exit with status 1 on a regression")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    seeded_path = seeded_database(args)
+    # The POST scenarios write, so every run starts from a fresh copy of the seeded data
+    db_path = seeded_path + '.run'
+    shutil.copyfile(seeded_path, db_path)
+    print(f"\nBenchmarking {args.requests} requests per scenario...")
+    try:
+        results = run_benchmarks(args, db_path)
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'requests_per_scenario': args.requests,
+            'seed': args.seed,
+            'tables': table_sizes(seeded_path),
+        },
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('tables') != report['meta']['tables']:
+            print("Warning: the baseline was measured on a database of a different size.")
+        regressions = compare(results, baseline, args.tolerance, args.metric)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved as baseline {args.baseline}")
+
+    if regressions and args.fail_on_regression:
+        print(f"\n{len(regressions)} scenarios regressed by more than {args.tolerance:.0%} at {args.metric}.")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,6 +8,80 @@ load_dotenv(os.path.join(basedir, '.env'))
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
     DATABASE = os.path.join(basedir, os.environ.get('DATABASE_URL') or 'instance/default.sqlite')
+
+    # SQLite connection pools, see db.db.ConnectionPool. There is always a single
+    # writer connection; DB_POOL_SIZE is the number of pooled read-only connections.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 8)
+    DB_JOURNAL_MODE = os.environ.get('DB_JOURNAL_MODE') or 'WAL'
+    DB_SYNCHRONOUS = os.environ.get('DB_SYNCHRONOUS') or 'NORMAL'
+    DB_CACHE_SIZE_KIB = int(os.environ.get('DB_CACHE_SIZE_KIB') or 16384) # Page cache per connection
+    DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE') or 128 * 1024 * 1024)
+    DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS') or 5000)
+
+    # Per-process cache of logged-in User objects, see app.models.UserCache
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE') or 1024)
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL') or 60) # Seconds
+
+    # Per-process cache of product page view models, see app.product_detail
+    PRODUCT_CACHE_SIZE = int(os.environ.get('PRODUCT_CACHE_SIZE') or 2048)
+    PRODUCT_CACHE_TTL = int(os.environ.get('PRODUCT_CACHE_TTL') or 30) # Seconds
+
+    REFERENCE_CACHE_TTL = int(os.environ.get('REFERENCE_CACHE_TTL') or 300) # Seconds, see app.reference
+
+    # Full-page cache for anonymous visitors, see app.page_cache. Backend: 'memory', 'file' or 'none'.
+    # The memory backend is per process and so is its invalidation: a change made through one worker
+    # does not reach the pages cached by another. Multi-process deployments must use 'file'.
+    PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND') or 'memory'
+    PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE') or 256) # Entries, memory backend only
+    PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL') or 60) # Seconds
+    PAGE_CACHE_DIR = os.path.join(basedir, 'instance', 'page_cache') # File backend only
+
+    # Background jobs, see app.jobs. JOBS_SYNC runs every job inline (for tests)
+    JOBS_SYNC = os.environ.get('JOBS_SYNC', '').lower() in ('1', 'true', 'yes')
+    JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS') or 2)
+    JOBS_POLL_INTERVAL = float(os.environ.get('JOBS_POLL_INTERVAL') or 1.0) # Seconds
+    JOBS_MAX_ATTEMPTS = int(os.environ.get('JOBS_MAX_ATTEMPTS') or 5)
+    JOBS_RETRY_BASE_SECONDS = float(os.environ.get('JOBS_RETRY_BASE_SECONDS') or 2.0) # Doubles on each retry
+    JOBS_STALE_AFTER_SECONDS = int(os.environ.get('JOBS_STALE_AFTER_SECONDS') or 300)
+
+    # Group commit for likes and comments, see app.write_batch. A size of 1 commits each write on its own request
+    WRITE_BATCH_SIZE = int(os.environ.get('WRITE_BATCH_SIZE') or 64) # Most writes per commit
+    WRITE_BATCH_INTERVAL_MS = float(os.environ.get('WRITE_BATCH_INTERVAL_MS') or 2) # How long a batch gathers writes
+
+    # Requests with a larger body are refused with 413 before it is read
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH') or 16 * 1024 * 1024)
+    MAX_IMAGE_UPLOAD_BYTES = int(os.environ.get('MAX_IMAGE_UPLOAD_BYTES') or 10 * 1024 * 1024)
+
+    # Stored image files younger than this are never deleted as unreferenced, see app.images
+    IMAGE_GC_GRACE_SECONDS = int(os.environ.get('IMAGE_GC_GRACE_SECONDS') or 300)
+
+    # Content hashes of static files for fingerprinted URLs, written by `flask build-assets`, see app.assets
+    ASSET_MANIFEST = os.path.join(basedir, 'instance', 'asset_manifest.json')
+
+    # Logging, see app.log. Records are queued and written to stderr by a background thread
+    LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
+    LOG_FORMAT = os.environ.get('LOG_FORMAT') or 'json' # 'json' (one object per line) or 'text'
+    LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE') or 0.01) # Share of requests whose debug records are kept
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE') or 10000) # Records beyond this are dropped, never waited on
+
+    # Per-request SQL timing, see db.tracing: X-DB-Queries/Server-Timing headers, a slow-query
+    # log with query plans and a warning when one statement runs N+1 times in a request
+    SQL_TRACE = os.environ.get('SQL_TRACE', 'true').lower() in ('1', 'true', 'yes')
+    SQL_SLOW_QUERY_MS = float(os.environ.get('SQL_SLOW_QUERY_MS') or 100)
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD') or 10) # Runs of one statement shape
+    SQL_DEBUG_FOOTER = os.environ.get('SQL_DEBUG_FOOTER', '').lower() in ('1', 'true', 'yes') # Table of queries on HTML pages
+
+    # Prometheus text-format /metrics for this process, see app.metrics
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+    PRODUCTS_PER_PAGE = int(os.environ.get('PRODUCTS_PER_PAGE') or 24) # Page size for keyset-paginated listings
+    COMMENTS_PER_PAGE = int(os.environ.get('COMMENTS_PER_PAGE') or 20) # Comments per page on the product page
+    REVIEWS_PER_PAGE = int(os.environ.get('REVIEWS_PER_PAGE') or 10) # Reviews per page on a profile
+
+    # JSON API, see app.api. ?limit= defaults to PRODUCTS_PER_PAGE and is capped here
+    API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE') or 100)
+    API_GZIP = os.environ.get('API_GZIP', 'true').lower() in ('1', 'true', 'yes') # For clients sending Accept-Encoding: gzip
+    API_GZIP_LEVEL = int(os.environ.get('API_GZIP_LEVEL') or 6)
     
     INSTANCE_FOLDER_PATH = os.path.join(basedir, 'instance')
     try:
@@ -0,0 +1,19 @@
+-- Denormalized like/comment counters on products.
+-- Applied by init-db after schema.sql, and re-applied by `flask repair-counters`,
+-- so every statement here must be safe to run against an existing database.
+
+CREATE TRIGGER IF NOT EXISTS likes_count_ai AFTER INSERT ON likes BEGIN
+    UPDATE products SET like_count = like_count + 1 WHERE id = new.product_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS likes_count_ad AFTER DELETE ON likes BEGIN
+    UPDATE products SET like_count = like_count - 1 WHERE id = old.product_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_count_ai AFTER INSERT ON comments BEGIN
+    UPDATE products SET comment_count = comment_count + 1 WHERE id = new.product_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_count_ad AFTER DELETE ON comments BEGIN
+    UPDATE products SET comment_count = comment_count - 1 WHERE id = old.product_id;
+END;
@@ -1,60 +1,465 @@
 import sqlite3
 import click
+import logging
 import os
+import pathlib
+import queue
+import re
+import threading
 from flask import current_app, g
 from flask.cli import with_appcontext
 
+from . import tracing
+from .tracing import explain_query_plan, traced, untraced
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """A small pool of configured SQLite connections shared by all requests of one app.
+
+    Connections are set up once (pragmas, row factory) and handed out LIFO so the
+    warmest page cache gets reused.
+
+    A read-only pool opens the file with mode=ro and query_only; when every pooled
+    connection is busy an extra one is opened rather than making the request wait,
+    and closed on release if the pool is already full.
+
+    A writer pool never grows past its size (1 in practice), so writes are
+    serialized in Python: a request waits up to busy_timeout for the writer instead
+    of piling onto SQLite's file lock.
+    """
+
+    def __init__(self, config, read_only=False):
+        self.database = config['DATABASE']
+        self.read_only = read_only
+        self.size = config['DB_POOL_SIZE'] if read_only else 1
+        self.busy_timeout_ms = config['DB_BUSY_TIMEOUT_MS']
+        if read_only:
+            # journal_mode/synchronous need write access; the writer sets WAL, which persists in the file
+            self.pragmas = ('PRAGMA query_only = ON',)
+        else:
+            self.pragmas = (
+                f"PRAGMA journal_mode = {config['DB_JOURNAL_MODE']}",
+                f"PRAGMA synchronous = {config['DB_SYNCHRONOUS']}",
+                'PRAGMA foreign_keys = ON',
+            )
+        self.pragmas += (
+            f"PRAGMA cache_size = -{int(config['DB_CACHE_SIZE_KIB'])}",
+            f"PRAGMA mmap_size = {int(config['DB_MMAP_SIZE'])}",
+            f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}',
+        )
+        self._idle = queue.LifoQueue(maxsize=self.size)
+        self._lock = threading.Lock()
+        self._open = 0
+        self._stats = {'created': 0, 'reused': 0, 'released': 0, 'discarded': 0, 'in_use': 0, 'waited': 0}
+
+    def _connect(self):
+        if self.read_only:
+            target, uri = pathlib.Path(self.database).resolve().as_uri() + '?mode=ro', True
+        else:
+            target, uri = self.database, False
+        conn = sqlite3.connect(
+            target,
+            uri=uri,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False # Handed between request threads, but only used by one at a time
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        return conn
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self._stats[key] += delta
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+            self._count(reused=1, in_use=1)
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            may_open = self.read_only or self._open < self.size
+            if may_open:
+                self._open += 1
+        if not may_open:
+            try:
+                conn = self._idle.get(timeout=self.busy_timeout_ms / 1000)
+            except queue.Empty:
+                raise sqlite3.OperationalError('timed out waiting for the database writer')
+            self._count(reused=1, in_use=1, waited=1)
+            return conn
+
+        try:
+            conn = self._connect()
+        except sqlite3.Error:
+            with self._lock:
+                self._open -= 1
+            raise
+        self._count(created=1, in_use=1)
+        return conn
+
+    def release(self, conn):
+        self._count(in_use=-1)
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+            self._count(released=1)
+        except (sqlite3.Error, queue.Full):
+            conn.close()
+            with self._lock:
+                self._open -= 1
+            self._count(discarded=1)
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._open -= 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['open'] = self._open
+        stats['idle'] = self._idle.qsize()
+        stats['size'] = self.size
+        return stats
+
+
+def get_pool(app=None, read_only=False):
+    """Returns the read-only or writer pool of the given (or current) app, creating it on first use."""
+    app = app or current_app._get_current_object()
+    key = 'db_read_pool' if read_only else 'db_write_pool'
+    pool = app.extensions.get(key)
+    if pool is None:
+        pool = app.extensions.setdefault(key, ConnectionPool(app.config, read_only=read_only))
+    return pool
+
+def get_pool_stats():
+    """Counters for the current app's pools, as {'read': {...}, 'write': {...}}."""
+    return {'read': get_pool(read_only=True).stats(), 'write': get_pool().stats()}
 
 def get_db():
     """Connects to the application's configured database.
     The connection is unique for each request and will be reused if called again.
+    This is the app's single writer connection: use it for anything that modifies
+    data, and get_read_db() for pure reads. It is held until teardown.
+    With SQL_TRACE on it is wrapped to time and count statements, see db.tracing.
     """
     if 'db' not in g:
         try:
-            db_path = current_app.config['DATABASE']
-            g.db = sqlite3.connect(
-                db_path,
-                detect_types=sqlite3.PARSE_DECLTYPES
-            )
-            g.db.row_factory = sqlite3.Row 
-            print(f"Database connection established to: {db_path}")
-        except sqlite3.Error as e:
-            print(f"Database connection error: {e}")
-            raise 
+            g.db = traced(get_pool().acquire())
+        except sqlite3.Error:
+            logger.exception('Could not open the writer connection')
+            raise
     return g.db
 
+def get_read_db():
+    """Returns a read-only connection for the current request (mode=ro, query_only).
+
+    Readers never wait on the writer; under WAL they see the last committed data.
+    """
+    if 'read_db' not in g:
+        try:
+            g.read_db = traced(get_pool(read_only=True).acquire())
+        except sqlite3.Error:
+            logger.exception('Could not open a read connection')
+            raise
+    return g.read_db
+
 def close_db(e=None):
-    """Closes the database again at the end of the request."""
+    """Returns the request's connections to their pools at the end of the request."""
     db = g.pop('db', None)
     if db is not None:
-        db.close()
-        print("Database connection closed.")
+        get_pool().release(untraced(db))
+    read_db = g.pop('read_db', None)
+    if read_db is not None:
+        get_pool(read_only=True).release(untraced(read_db))
+
+def run_sql_script(db, filename):
+    """Executes one of the .sql files that live next to this module."""
+    script_path = os.path.join(os.path.dirname(__file__), filename)
+    with current_app.open_resource(script_path, 'rt') as f:
+        db.executescript(f.read())
+
+# Scripts init-db runs, in order. Everything after schema.sql is idempotent and
+# can be re-applied to an existing database by its own repair command.
+SCHEMA_SCRIPTS = ('schema.sql', 'indexes.sql', 'search_index.sql', 'counters.sql', 'jobs.sql', 'image_refs.sql',
+                  'stats.sql', 'user_stats.sql', 'reference_version.sql')
 
 def init_db():
     """Clear existing data and create new tables."""
     db = get_db()
-    schema_path = os.path.join(os.path.dirname(__file__), 'schema.sql')
     try:
-        with current_app.open_resource(schema_path, 'rt') as f: 
-            db.executescript(f.read())
-        print("Initialized the database schema.")
-    except FileNotFoundError:
-        print(f"Schema file not found at expected location based on app context: {schema_path}")
-    except sqlite3.Error as e:
-        print(f"Error executing schema: {e}")
+        for script in SCHEMA_SCRIPTS:
+            run_sql_script(db, script)
+        logger.info('Initialized the database schema.')
+    except FileNotFoundError as e:
+        logger.error('Schema file not found at expected location based on app context: %s', e.filename)
+    except sqlite3.Error:
+        logger.exception('Error executing schema')
+
+def rebuild_search_index():
+    """Creates the product full-text index if missing and repopulates it from products."""
+    db = get_db()
+    run_sql_script(db, 'search_index.sql')
+    db.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+    db.execute("INSERT INTO products_fts (products_fts) VALUES ('optimize')")
+    db.commit()
+    return db.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+
+def add_missing_columns(db, table, columns):
+    """Adds any of columns ({name: definition}) that table lacks. The caller commits."""
+    existing = {row['name'] for row in db.execute(f'PRAGMA table_info({table})')}
+    for name, definition in columns.items():
+        if name not in existing:
+            db.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+
+def repair_counters():
+    """Adds the product counter columns/triggers if missing and recomputes every count.
+
+    Returns the number of products whose stored counts were wrong.
+    """
+    db = get_db()
+    add_missing_columns(db, 'products', {
+        'like_count': 'INTEGER NOT NULL DEFAULT 0',
+        'comment_count': 'INTEGER NOT NULL DEFAULT 0',
+    })
+    run_sql_script(db, 'counters.sql')
+    cursor = db.execute(
+        '''
+        UPDATE products SET
+            like_count = (SELECT COUNT(*) FROM likes WHERE likes.product_id = products.id),
+            comment_count = (SELECT COUNT(*) FROM comments WHERE comments.product_id = products.id)
+        WHERE like_count != (SELECT COUNT(*) FROM likes WHERE likes.product_id = products.id)
+           OR comment_count != (SELECT COUNT(*) FROM comments WHERE comments.product_id = products.id)
+        '''
+    )
+    db.commit()
+    return cursor.rowcount
+
+# Recompute the stats tables (see stats.sql) from products. stats_totals is
+# refilled by its triggers as the stats rows go in.
+STATS_REBUILD_STATEMENTS = (
+    'DELETE FROM stats_totals',
+    'DELETE FROM stats',
+    '''
+    INSERT INTO stats (category_id, campus_id, day, available_count, sold_count, price_sum, like_count)
+    SELECT p.category_id, COALESCE(u.campus_id, 0), date(p.date_posted),
+           SUM(p.is_sold = 0), SUM(p.is_sold != 0), SUM(p.price), SUM(p.like_count)
+    FROM products p LEFT JOIN users u ON u.id = p.seller_id
+    GROUP BY p.category_id, COALESCE(u.campus_id, 0), date(p.date_posted)
+    ''',
+)
+
+def rebuild_stats():
+    """Creates the stats tables/triggers if missing and recomputes every row from products.
+
+    Returns the number of category/campus/day rows written.
+    """
+    db = get_db()
+    run_sql_script(db, 'stats.sql')
+    for statement in STATS_REBUILD_STATEMENTS:
+        cursor = db.execute(statement)
+    db.commit()
+    return cursor.rowcount
+
+# Recompute user_stats (see user_stats.sql) from reviews and products. Marking a
+# listing sold or available leaves no timestamp behind, so a rebuilt last_active
+# only reflects listings posted and reviews written.
+USER_STATS_REBUILD_STATEMENTS = (
+    'DELETE FROM user_stats',
+    '''
+    INSERT INTO user_stats (user_id, review_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5,
+                            available_count, sold_count, last_active)
+    SELECT u.id,
+           COALESCE(r.review_count, 0), COALESCE(r.rating_sum, 0),
+           COALESCE(r.rating_1, 0), COALESCE(r.rating_2, 0), COALESCE(r.rating_3, 0),
+           COALESCE(r.rating_4, 0), COALESCE(r.rating_5, 0),
+           COALESCE(p.available_count, 0), COALESCE(p.sold_count, 0),
+           NULLIF(max(COALESCE(p.last_posted, ''), COALESCE(w.last_reviewed, '')), '')
+    FROM users u
+    LEFT JOIN (
+        SELECT reviewed_user_id, COUNT(*) AS review_count, SUM(rating) AS rating_sum,
+               SUM(rating = 1) AS rating_1, SUM(rating = 2) AS rating_2, SUM(rating = 3) AS rating_3,
+               SUM(rating = 4) AS rating_4, SUM(rating = 5) AS rating_5
+        FROM reviews GROUP BY reviewed_user_id
+    ) r ON r.reviewed_user_id = u.id
+    LEFT JOIN (
+        SELECT seller_id, SUM(is_sold = 0) AS available_count, SUM(is_sold != 0) AS sold_count,
+               MAX(date_posted) AS last_posted
+        FROM products GROUP BY seller_id
+    ) p ON p.seller_id = u.id
+    LEFT JOIN (
+        SELECT reviewer_id, MAX(timestamp) AS last_reviewed FROM reviews GROUP BY reviewer_id
+    ) w ON w.reviewer_id = u.id
+    WHERE r.reviewed_user_id IS NOT NULL OR p.seller_id IS NOT NULL OR w.reviewer_id IS NOT NULL
+    ''',
+)
+
+def rebuild_user_stats():
+    """Creates the user_stats table/triggers if missing and recomputes every row.
+
+    Returns the number of users with a row.
+    """
+    db = get_db()
+    run_sql_script(db, 'user_stats.sql')
+    for statement in USER_STATS_REBUILD_STATEMENTS:
+        cursor = db.execute(statement)
+    db.commit()
+    return cursor.rowcount
+
+# Representative forms of the route queries that indexes.sql is meant to serve,
+# used by migrate-indexes to show the query plans before and after.
+INDEXED_ROUTE_QUERIES = {
+    'main.index': (
+        'SELECT p.id FROM products p JOIN users u ON p.seller_id = u.id '
+        'JOIN categories c ON p.category_id = c.id '
+        'WHERE p.is_sold = 0 ORDER BY p.date_posted DESC LIMIT 24',
+        ()
+    ),
+    'product.by_category': (
+        'SELECT p.id FROM products p JOIN users u ON p.seller_id = u.id '
+        'WHERE p.category_id = ? AND p.is_sold = 0 ORDER BY p.date_posted DESC',
+        (1,)
+    ),
+    'main.search': (
+        'SELECT p.id FROM products p JOIN categories c ON p.category_id = c.id '
+        'JOIN users u ON p.seller_id = u.id '
+        'WHERE p.is_sold = 0 AND p.price >= ? ORDER BY p.date_posted DESC',
+        (0,)
+    ),
+    'main.profile (listings)': (
+        'SELECT id FROM products WHERE seller_id = ? ORDER BY date_posted DESC',
+        (1,)
+    ),
+    'main.profile (reviews)': (
+        'SELECT r.rating FROM reviews r JOIN users u ON r.reviewer_id = u.id '
+        'WHERE r.reviewed_user_id = ? ORDER BY r.timestamp DESC',
+        (1,)
+    ),
+    'product.product_view (comments)': (
+        'SELECT com.text FROM comments com JOIN users u ON com.user_id = u.id '
+        'WHERE com.product_id = ? ORDER BY com.timestamp DESC',
+        (1,)
+    ),
+}
+
+def migrate_indexes():
+    """Applies indexes.sql to the current database and refreshes planner statistics."""
+    db = get_db()
+    run_sql_script(db, 'indexes.sql')
+    db.execute('ANALYZE')
+    db.commit()
+
+# bm25 ranking for products_fts; a hit in the title counts ten times a hit in the description.
+# Lower scores are better matches, so sort ascending.
+FTS_RANK = 'bm25(products_fts, 10.0, 1.0)'
+
+def fts_match_query(text):
+    """Turns free-form search text into a safe FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term, so user input can never be parsed as
+    FTS syntax and "text" still finds "textbook". Returns None if there are no words.
+    """
+    terms = re.findall(r'\w+', text or '')
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
 
 
 @click.command('init-db')
 @with_appcontext
 def init_db_command():
     """Flask CLI command to initialize the database."""
-    import os 
-    print("Attempting to initialize database...")
+    click.echo('Attempting to initialize database...')
     init_db()
     click.echo('Initialized the database.')
 
 
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Flask CLI command to (re)build the product full-text search index."""
+    try:
+        indexed = rebuild_search_index()
+    except sqlite3.Error as e:
+        raise click.ClickException(f"Could not rebuild search index: {e}")
+    click.echo(f'Rebuilt search index for {indexed} products.')
+
+
+@click.command('migrate-indexes')
+@with_appcontext
+def migrate_indexes_command():
+    """Flask CLI command to apply indexes.sql, showing route query plans before and after."""
+    db = get_db()
+    before = {name: explain_query_plan(db, sql, params)
+              for name, (sql, params) in INDEXED_ROUTE_QUERIES.items()}
+    try:
+        migrate_indexes()
+    except sqlite3.Error as e:
+        raise click.ClickException(f"Could not apply indexes: {e}")
+    for name, (sql, params) in INDEXED_ROUTE_QUERIES.items():
+        click.echo(f'\n{name}')
+        click.echo('  before:')
+        for line in before[name]:
+            click.echo(f'  {line}')
+        click.echo('  after:')
+        for line in explain_query_plan(db, sql, params):
+            click.echo(f'  {line}')
+    click.echo('\nIndexes applied.')
+
+
+@click.command('repair-counters')
+@with_appcontext
+def repair_counters_command():
+    """Flask CLI command to backfill/repair products.like_count and comment_count."""
+    try:
+        fixed = repair_counters()
+    except sqlite3.Error as e:
+        raise click.ClickException(f"Could not repair counters: {e}")
+    click.echo(f'Repaired like/comment counts on {fixed} products.')
+
+
+@click.command('rebuild-stats')
+@with_appcontext
+def rebuild_stats_command():
+    """Flask CLI command to (re)build the stats summary table from products."""
+    try:
+        rows = rebuild_stats()
+    except sqlite3.Error as e:
+        raise click.ClickException(f"Could not rebuild stats: {e}")
+    click.echo(f'Rebuilt stats: {rows} category/campus/day rows.')
+
+
+@click.command('rebuild-user-stats')
+@with_appcontext
+def rebuild_user_stats_command():
+    """Flask CLI command to (re)build the per-user profile aggregates from reviews and products."""
+    try:
+        rows = rebuild_user_stats()
+    except sqlite3.Error as e:
+        raise click.ClickException(f"Could not rebuild user stats: {e}")
+    click.echo(f'Rebuilt user stats for {rows} users.')
+
+
 def init_app(app):
     """Register database functions with the Flask app."""
     app.teardown_appcontext(close_db)
-    app.cli.add_command(init_db_command)
\ No newline at end of file
+    tracing.init_app(app)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(repair_counters_command)
+    app.cli.add_command(migrate_indexes_command)
+    app.cli.add_command(rebuild_stats_command)
+    app.cli.add_command(rebuild_user_stats_command)
@@ -0,0 +1,37 @@
+-- Reference counts for stored image files (see app/images.py).
+-- Uploads are content-addressed, so several products can point at one file; a
+-- file may only be deleted once its refcount is 0. Applied by init-db after
+-- schema.sql and re-applied by `flask gc-images`, so every statement here must
+-- be safe to run against an existing database.
+
+CREATE TABLE IF NOT EXISTS image_files (
+    path TEXT PRIMARY KEY, -- Relative to static/, as in products.image_path and product_images.image_url
+    refcount INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS image_refs_products_ai AFTER INSERT ON products
+WHEN new.image_path IS NOT NULL BEGIN
+    INSERT INTO image_files (path, refcount) VALUES (new.image_path, 1)
+    ON CONFLICT (path) DO UPDATE SET refcount = refcount + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS image_refs_products_ad AFTER DELETE ON products
+WHEN old.image_path IS NOT NULL BEGIN
+    UPDATE image_files SET refcount = refcount - 1 WHERE path = old.image_path;
+END;
+
+CREATE TRIGGER IF NOT EXISTS image_refs_products_au AFTER UPDATE OF image_path ON products
+WHEN old.image_path IS NOT new.image_path BEGIN
+    UPDATE image_files SET refcount = refcount - 1 WHERE path = old.image_path;
+    INSERT INTO image_files (path, refcount) SELECT new.image_path, 1 WHERE new.image_path IS NOT NULL
+    ON CONFLICT (path) DO UPDATE SET refcount = refcount + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS image_refs_product_images_ai AFTER INSERT ON product_images BEGIN
+    INSERT INTO image_files (path, refcount) VALUES (new.image_url, 1)
+    ON CONFLICT (path) DO UPDATE SET refcount = refcount + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS image_refs_product_images_ad AFTER DELETE ON product_images BEGIN
+    UPDATE image_files SET refcount = refcount - 1 WHERE path = old.image_url;
+END;
@@ -0,0 +1,24 @@
+-- Indexes for the hot listing queries.
+-- Applied by init-db after schema.sql, and re-applied to existing databases by
+-- `flask migrate-indexes`, so every statement here must be safe to re-run.
+
+-- Superseded by the composite indexes below, which share the same leading column
+DROP INDEX IF EXISTS idx_products_seller;
+DROP INDEX IF EXISTS idx_products_category;
+DROP INDEX IF EXISTS idx_comments_product;
+DROP INDEX IF EXISTS idx_reviews_reviewed_user;
+
+-- main.index and main.search: WHERE is_sold = ? ORDER BY date_posted DESC
+CREATE INDEX IF NOT EXISTS idx_products_sold_date ON products (is_sold, date_posted);
+-- product.by_category and main.search with a category filter
+CREATE INDEX IF NOT EXISTS idx_products_category_sold_date ON products (category_id, is_sold, date_posted);
+-- main.profile listings: WHERE seller_id = ? ORDER BY date_posted DESC
+CREATE INDEX IF NOT EXISTS idx_products_seller_date ON products (seller_id, date_posted);
+-- product.product_view comments: WHERE product_id = ? ORDER BY timestamp DESC
+CREATE INDEX IF NOT EXISTS idx_comments_product_time ON comments (product_id, timestamp);
+-- main.profile reviews: WHERE reviewed_user_id = ? ORDER BY timestamp DESC
+CREATE INDEX IF NOT EXISTS idx_reviews_reviewed_user_time ON reviews (reviewed_user_id, timestamp);
+-- Image variants for the products on a listing page
+CREATE INDEX IF NOT EXISTS idx_product_images_product ON product_images (product_id);
+-- Per-product like lookups (the primary key covers per-user lookups)
+CREATE INDEX IF NOT EXISTS idx_likes_product ON likes (product_id);
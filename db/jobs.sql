@@ -0,0 +1,18 @@
+-- Persistent queue for background jobs (see app/jobs.py).
+-- Applied by init-db after schema.sql and by the `flask jobs` commands,
+-- so every statement here must be safe to run against an existing database.
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL, -- Name of a handler registered with app.jobs.job
+    payload TEXT NOT NULL, -- JSON keyword arguments for the handler
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'failed')), -- Finished jobs are deleted
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after REAL NOT NULL, -- Unix time; pushed back on each retry
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at REAL NOT NULL -- Unix time of the last status change
+);
+
+-- Workers claim the oldest due job
+CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs (status, run_after);
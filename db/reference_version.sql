@@ -0,0 +1,37 @@
+-- A version stamp for the categories and campuses tables, shared by every
+-- process: app.reference reloads its in-process copy when the stamp differs
+-- from the one it loaded with. Bumped by the triggers below on any change to
+-- either table and by `flask refresh-reference-data`. Applied by init-db after
+-- schema.sql and re-applied by refresh-reference-data, so every statement here
+-- must be safe to run against an existing database.
+
+CREATE TABLE IF NOT EXISTS reference_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1), -- A single row
+    version INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO reference_version (id, version) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS reference_version_categories_ai AFTER INSERT ON categories BEGIN
+    UPDATE reference_version SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS reference_version_categories_au AFTER UPDATE ON categories BEGIN
+    UPDATE reference_version SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS reference_version_categories_ad AFTER DELETE ON categories BEGIN
+    UPDATE reference_version SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS reference_version_campuses_ai AFTER INSERT ON campuses BEGIN
+    UPDATE reference_version SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS reference_version_campuses_au AFTER UPDATE ON campuses BEGIN
+    UPDATE reference_version SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS reference_version_campuses_ad AFTER DELETE ON campuses BEGIN
+    UPDATE reference_version SET version = version + 1;
+END;
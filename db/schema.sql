@@ -1,4 +1,10 @@
 -- Drop tables in reverse order of dependency to avoid foreign key errors
+DROP TABLE IF EXISTS user_stats; -- Profile aggregates, recreated from user_stats.sql
+DROP TABLE IF EXISTS stats_totals; -- Marketplace statistics, recreated from stats.sql
+DROP TABLE IF EXISTS stats;
+DROP TABLE IF EXISTS jobs; -- Background job queue, recreated from jobs.sql
+DROP TABLE IF EXISTS image_files; -- Image reference counts, recreated from image_refs.sql
+DROP TABLE IF EXISTS products_fts; -- Full-text index, recreated from search_index.sql
 DROP TABLE IF EXISTS likes;
 DROP TABLE IF EXISTS reviews;
 DROP TABLE IF EXISTS comments;
@@ -45,16 +51,21 @@ CREATE TABLE products (
     category_id INTEGER NOT NULL,
     seller_id INTEGER NOT NULL,
     is_sold BOOLEAN NOT NULL DEFAULT 0,
+    like_count INTEGER NOT NULL DEFAULT 0, -- Maintained by triggers in counters.sql
+    comment_count INTEGER NOT NULL DEFAULT 0, -- Maintained by triggers in counters.sql
     FOREIGN KEY (category_id) REFERENCES categories (id),
-    FOREIGN KEY (seller_id) REFERENCES users (id)
     FOREIGN KEY (seller_id) REFERENCES users (id) ON DELETE CASCADE
 );
 
 CREATE TABLE product_images (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     product_id INTEGER NOT NULL,
-    image_url TEXT NOT NULL, -- Path to the uploaded image file
+    image_url TEXT NOT NULL, -- Path to the image file, relative to static/
     upload_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    variant TEXT NOT NULL DEFAULT 'original', -- Resized copy: thumb, card or full (see app/images.py)
+    width INTEGER,
+    height INTEGER,
+    mime_type TEXT,
     FOREIGN KEY (product_id) REFERENCES products (id) ON DELETE CASCADE -- Delete images if product is deleted
 );
 
@@ -91,12 +102,10 @@ CREATE TABLE likes (
     FOREIGN KEY (product_id) REFERENCES products (id) ON DELETE CASCADE
 );
 
--- Optional: Add Indexes for faster lookups on frequently queried columns
-CREATE INDEX idx_products_seller ON products (seller_id);
-CREATE INDEX idx_products_category ON products (category_id);
-CREATE INDEX idx_comments_product ON comments (product_id);
-CREATE INDEX idx_reviews_reviewed_user ON reviews (reviewed_user_id);
-CREATE INDEX idx_likes_product ON likes (product_id);
+-- Indexes live in indexes.sql, keyword search uses the products_fts virtual table
+-- defined in search_index.sql, and products.like_count/comment_count are kept
+-- current by counters.sql. init-db applies these and the other scripts listed in
+-- db.db.SCHEMA_SCRIPTS right after this file.
 
 INSERT OR IGNORE INTO categories (name, description) VALUES
 ('Textbooks', 'Course textbooks and study materials'),
@@ -0,0 +1,29 @@
+-- Full-text search index over product titles and descriptions.
+-- Applied by init-db after schema.sql, and re-applied by `flask rebuild-search-index`,
+-- so every statement here must be safe to run against an existing database.
+
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    title,
+    description,
+    content='products', -- External content: the text lives in products, FTS only stores the index
+    content_rowid='id',
+    tokenize='porter unicode61 remove_diacritics 2'
+);
+
+-- Keep the index in sync with products
+CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+    INSERT INTO products_fts (rowid, title, description)
+    VALUES (new.id, new.title, new.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+    INSERT INTO products_fts (products_fts, rowid, title, description)
+    VALUES ('delete', old.id, old.title, old.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF title, description ON products BEGIN
+    INSERT INTO products_fts (products_fts, rowid, title, description)
+    VALUES ('delete', old.id, old.title, old.description);
+    INSERT INTO products_fts (rowid, title, description)
+    VALUES (new.id, new.title, new.description);
+END;
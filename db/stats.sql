@@ -0,0 +1,137 @@
+-- Marketplace statistics for main.stats: one row per category, seller campus and day
+-- posted in stats, and the same figures over all time per category and campus in
+-- stats_totals (a few hundred rows however long the history). Kept current by the
+-- triggers below, so the stats page never scans products; `flask rebuild-stats`
+-- recomputes every row from products. Applied by init-db after schema.sql and
+-- re-applied by rebuild-stats, so every statement here must be safe to run
+-- against an existing database.
+--
+-- Rows are never deleted by the triggers: a bucket whose listings are all gone
+-- just sums to zero, and rebuild-stats drops it.
+
+CREATE TABLE IF NOT EXISTS stats (
+    category_id INTEGER NOT NULL,
+    campus_id INTEGER NOT NULL, -- The seller's campus, 0 if they have none
+    day TEXT NOT NULL, -- date(products.date_posted)
+    available_count INTEGER NOT NULL DEFAULT 0,
+    sold_count INTEGER NOT NULL DEFAULT 0,
+    price_sum REAL NOT NULL DEFAULT 0, -- Of all listings; the average divides by available + sold
+    like_count INTEGER NOT NULL DEFAULT 0, -- Sum of products.like_count
+    PRIMARY KEY (day, category_id, campus_id) -- Day first: the stats page reads a range of recent days
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS stats_totals (
+    category_id INTEGER NOT NULL,
+    campus_id INTEGER NOT NULL,
+    available_count INTEGER NOT NULL DEFAULT 0,
+    sold_count INTEGER NOT NULL DEFAULT 0,
+    price_sum REAL NOT NULL DEFAULT 0,
+    like_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (category_id, campus_id)
+) WITHOUT ROWID;
+
+-- stats_totals follows every change to stats. The product triggers below only
+-- upsert into stats (whose DO UPDATE fires stats_totals_au), and stats rows are
+-- only deleted by rebuild-stats, which clears both tables.
+CREATE TRIGGER IF NOT EXISTS stats_totals_ai AFTER INSERT ON stats BEGIN
+    INSERT INTO stats_totals (category_id, campus_id, available_count, sold_count, price_sum, like_count)
+    VALUES (new.category_id, new.campus_id, new.available_count, new.sold_count, new.price_sum, new.like_count)
+    ON CONFLICT (category_id, campus_id) DO UPDATE SET
+        available_count = available_count + excluded.available_count,
+        sold_count = sold_count + excluded.sold_count,
+        price_sum = price_sum + excluded.price_sum,
+        like_count = like_count + excluded.like_count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS stats_totals_au AFTER UPDATE ON stats BEGIN
+    UPDATE stats_totals SET
+        available_count = available_count + new.available_count - old.available_count,
+        sold_count = sold_count + new.sold_count - old.sold_count,
+        price_sum = price_sum + new.price_sum - old.price_sum,
+        like_count = like_count + new.like_count - old.like_count
+    WHERE category_id = new.category_id AND campus_id = new.campus_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS stats_products_ai AFTER INSERT ON products BEGIN
+    INSERT INTO stats (category_id, campus_id, day, available_count, sold_count, price_sum, like_count)
+    VALUES (new.category_id, COALESCE((SELECT campus_id FROM users WHERE id = new.seller_id), 0),
+            date(new.date_posted), new.is_sold = 0, new.is_sold != 0, new.price, new.like_count)
+    ON CONFLICT (day, category_id, campus_id) DO UPDATE SET
+        available_count = available_count + excluded.available_count,
+        sold_count = sold_count + excluded.sold_count,
+        price_sum = price_sum + excluded.price_sum,
+        like_count = like_count + excluded.like_count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS stats_products_ad AFTER DELETE ON products BEGIN
+    UPDATE stats SET
+        available_count = available_count - (old.is_sold = 0),
+        sold_count = sold_count - (old.is_sold != 0),
+        price_sum = price_sum - old.price,
+        like_count = like_count - old.like_count
+    WHERE category_id = old.category_id
+      AND campus_id = COALESCE((SELECT campus_id FROM users WHERE id = old.seller_id), 0)
+      AND day = date(old.date_posted);
+END;
+
+-- Moves a listing whose bucket or figures changed. Its likes move at their old
+-- count; a change of like_count itself is added by stats_products_likes_au, so
+-- an UPDATE that sets both is counted once whichever trigger runs first.
+CREATE TRIGGER IF NOT EXISTS stats_products_au
+AFTER UPDATE OF is_sold, price, category_id, date_posted, seller_id ON products BEGIN
+    UPDATE stats SET
+        available_count = available_count - (old.is_sold = 0),
+        sold_count = sold_count - (old.is_sold != 0),
+        price_sum = price_sum - old.price,
+        like_count = like_count - old.like_count
+    WHERE category_id = old.category_id
+      AND campus_id = COALESCE((SELECT campus_id FROM users WHERE id = old.seller_id), 0)
+      AND day = date(old.date_posted);
+    INSERT INTO stats (category_id, campus_id, day, available_count, sold_count, price_sum, like_count)
+    VALUES (new.category_id, COALESCE((SELECT campus_id FROM users WHERE id = new.seller_id), 0),
+            date(new.date_posted), new.is_sold = 0, new.is_sold != 0, new.price, old.like_count)
+    ON CONFLICT (day, category_id, campus_id) DO UPDATE SET
+        available_count = available_count + excluded.available_count,
+        sold_count = sold_count + excluded.sold_count,
+        price_sum = price_sum + excluded.price_sum,
+        like_count = like_count + excluded.like_count;
+END;
+
+-- The like/unlike path (counters.sql updates like_count alone): one upsert of the difference
+CREATE TRIGGER IF NOT EXISTS stats_products_likes_au AFTER UPDATE OF like_count ON products
+WHEN new.like_count != old.like_count BEGIN
+    INSERT INTO stats (category_id, campus_id, day, like_count)
+    VALUES (new.category_id, COALESCE((SELECT campus_id FROM users WHERE id = new.seller_id), 0),
+            date(new.date_posted), new.like_count - old.like_count)
+    ON CONFLICT (day, category_id, campus_id) DO UPDATE SET
+        like_count = like_count + excluded.like_count;
+END;
+
+-- A seller changing campus takes their listings along
+CREATE TRIGGER IF NOT EXISTS stats_users_campus_au AFTER UPDATE OF campus_id ON users
+WHEN old.campus_id IS NOT new.campus_id BEGIN
+    INSERT INTO stats (category_id, campus_id, day, available_count, sold_count, price_sum, like_count)
+    SELECT category_id, COALESCE(old.campus_id, 0), date(date_posted),
+           -SUM(is_sold = 0), -SUM(is_sold != 0), -SUM(price), -SUM(like_count)
+    FROM products WHERE seller_id = new.id GROUP BY category_id, date(date_posted)
+    ON CONFLICT (day, category_id, campus_id) DO UPDATE SET
+        available_count = available_count + excluded.available_count,
+        sold_count = sold_count + excluded.sold_count,
+        price_sum = price_sum + excluded.price_sum,
+        like_count = like_count + excluded.like_count;
+    INSERT INTO stats (category_id, campus_id, day, available_count, sold_count, price_sum, like_count)
+    SELECT category_id, COALESCE(new.campus_id, 0), date(date_posted),
+           SUM(is_sold = 0), SUM(is_sold != 0), SUM(price), SUM(like_count)
+    FROM products WHERE seller_id = new.id GROUP BY category_id, date(date_posted)
+    ON CONFLICT (day, category_id, campus_id) DO UPDATE SET
+        available_count = available_count + excluded.available_count,
+        sold_count = sold_count + excluded.sold_count,
+        price_sum = price_sum + excluded.price_sum,
+        like_count = like_count + excluded.like_count;
+END;
+
+-- Removes a deleted user's listings while the user row (and so their campus) is
+-- still there; the ON DELETE CASCADE would otherwise run after it is gone.
+CREATE TRIGGER IF NOT EXISTS stats_users_bd BEFORE DELETE ON users BEGIN
+    DELETE FROM products WHERE seller_id = old.id;
+END;
@@ -0,0 +1,216 @@
+import functools
+import html
+import logging
+import re
+import time
+from collections import Counter
+from flask import current_app, g, request
+
+
+logger = logging.getLogger(__name__)
+
+# Statement shape: literals and IN lists collapsed so the same query with other values counts as one
+_WHITESPACE = re.compile(r'\s+')
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+@functools.lru_cache(maxsize=1024)
+def statement_shape(sql):
+    """sql with whitespace normalized and literal values replaced by ?, for grouping repeats."""
+    shape = _WHITESPACE.sub(' ', sql).strip()
+    shape = _STRING_LITERAL.sub('?', shape)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    return _IN_LIST.sub('(?...)', shape)
+
+def explain_query_plan(db, sql, params=()):
+    """Returns the EXPLAIN QUERY PLAN rows for a statement as indented text lines."""
+    rows = db.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    depth = {0: 0}
+    lines = []
+    for row in rows:
+        depth[row['id']] = depth.get(row['parent'], 0) + 1
+        lines.append('  ' * depth[row['id']] + row['detail'])
+    return lines
+
+
+class QueryStats:
+    """Statements run during one request (or app context): count, time and repeats per shape.
+
+    Time covers execute() and fetching the rows, since SQLite produces rows lazily.
+    """
+
+    def __init__(self, slow_ms):
+        self.slow_seconds = slow_ms / 1000
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+        self.shape_seconds = Counter()
+        self.slow = [] # (milliseconds, sql) of statements logged as slow
+
+    def statement(self, sql):
+        self.count += 1
+        self.shapes[statement_shape(sql)] += 1
+
+    def add_time(self, sql, seconds):
+        self.seconds += seconds
+        self.shape_seconds[statement_shape(sql)] += seconds
+
+    def repeated(self, threshold):
+        """(shape, times) of statements run at least threshold times, most repeated first."""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+class TracedCursor:
+    """Cursor proxy that adds the time spent executing and fetching to its QueryStats."""
+
+    def __init__(self, cursor, stats, sql, params):
+        self._cursor = cursor
+        self._stats = stats
+        self._sql = sql
+        self._params = params
+        self._seconds = 0.0
+        self._logged = False
+
+    def _add(self, seconds):
+        self._seconds += seconds
+        self._stats.add_time(self._sql, seconds)
+        if not self._logged and self._seconds >= self._stats.slow_seconds:
+            self._logged = True
+            self._log_slow()
+
+    def _log_slow(self):
+        ms = self._seconds * 1000
+        self._stats.slow.append((ms, self._sql))
+        try:
+            plan = explain_query_plan(self._cursor.connection, self._sql, self._params)
+        except Exception as e: # EXPLAIN of e.g. a script or PRAGMA; the timing is still worth logging
+            plan = [f'(no query plan: {e})']
+        logger.warning('Slow query (%.1f ms): %s\n%s', ms, statement_shape(self._sql), '\n'.join(plan),
+                       extra={'duration_ms': round(ms, 2)})
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._add(time.perf_counter() - start)
+
+    def fetchone(self):
+        return self._timed(self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed(self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed(self._cursor.fetchall)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self._timed(self._cursor.__next__)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class TracedConnection:
+    """Connection proxy handed out by get_db()/get_read_db() that times and counts every statement.
+
+    Everything other than execute/executemany/executescript goes straight to
+    the pooled connection, which is returned to its pool as `raw`.
+    """
+
+    def __init__(self, raw, stats):
+        self.raw = raw
+        self._stats = stats
+
+    def _run(self, method, sql, params):
+        self._stats.statement(sql)
+        start = time.perf_counter()
+        try:
+            cursor = method(sql, params)
+        except Exception:
+            self._stats.add_time(sql, time.perf_counter() - start)
+            raise
+        cursor = TracedCursor(cursor, self._stats, sql, params)
+        cursor._add(time.perf_counter() - start)
+        return cursor
+
+    def execute(self, sql, params=()):
+        return self._run(self.raw.execute, sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self._run(self.raw.executemany, sql, seq_of_params)
+
+    def executescript(self, script):
+        self._stats.statement(script)
+        start = time.perf_counter()
+        try:
+            return self.raw.executescript(script)
+        finally:
+            self._stats.add_time(script, time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+def query_stats():
+    """The QueryStats of the current request/app context, created on first use."""
+    if 'query_stats' not in g:
+        g.query_stats = QueryStats(current_app.config['SQL_SLOW_QUERY_MS'])
+    return g.query_stats
+
+def traced(conn):
+    """Wraps a pooled connection for the current context if SQL_TRACE is on."""
+    if not current_app.config['SQL_TRACE']:
+        return conn
+    return TracedConnection(conn, query_stats())
+
+def untraced(conn):
+    """The pooled connection behind a (possibly) traced one."""
+    return getattr(conn, 'raw', conn)
+
+
+def _debug_footer(stats, repeated):
+    rows = ''.join(
+        f'<tr><td>{stats.shapes[shape]}</td><td>{stats.shape_seconds[shape] * 1000:.2f}</td>'
+        f'<td><code>{html.escape(shape)}</code></td></tr>'
+        for shape, _ in stats.shape_seconds.most_common(10)
+    )
+    warning = ''.join(
+        f'<p><strong>Possible N+1:</strong> {n}&times; <code>{html.escape(shape)}</code></p>'
+        for shape, n in repeated
+    )
+    return (
+        '<div class="sql-debug container"><details>'
+        f'<summary>{stats.count} SQL queries, {stats.seconds * 1000:.2f} ms</summary>{warning}'
+        f'<table><tr><th>Runs</th><th>ms</th><th>Statement</th></tr>{rows}</table>'
+        '</details></div>'
+    )
+
+def _report_query_stats(response):
+    stats = g.get('query_stats')
+    if stats is None:
+        return response
+    response.headers['X-DB-Queries'] = str(stats.count)
+    response.headers['Server-Timing'] = f'db;desc="{stats.count} queries";dur={stats.seconds * 1000:.2f}'
+
+    repeated = stats.repeated(current_app.config['SQL_N_PLUS_ONE_THRESHOLD'])
+    for shape, n in repeated:
+        logger.warning('Possible N+1 in %s: statement ran %d times: %s', request.endpoint, n, shape,
+                       extra={'endpoint': request.endpoint, 'runs': n})
+
+    if (current_app.config['SQL_DEBUG_FOOTER'] and response.status_code == 200 and response.mimetype == 'text/html'
+            and not response.direct_passthrough):
+        body = response.get_data(as_text=True)
+        at = body.rfind('</body>')
+        if at != -1:
+            response.set_data(body[:at] + _debug_footer(stats, repeated) + body[at:])
+    return response
+
+def init_app(app):
+    """Report per-request SQL totals on responses when SQL_TRACE is on."""
+    if app.config['SQL_TRACE']:
+        app.after_request(_report_query_stats)
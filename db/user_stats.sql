@@ -0,0 +1,86 @@
+-- Per-user reputation and listing figures for main.profile: review count, rating
+-- sum and distribution, available/sold listing counts and last activity. Kept
+-- current by the triggers below, so a profile costs the same to render however
+-- many reviews and listings its user has; `flask rebuild-user-stats` recomputes
+-- every row. Applied by init-db after schema.sql and re-applied by
+-- rebuild-user-stats, so every statement here must be safe to run against an
+-- existing database.
+--
+-- A user gets a row with their first listing or review, given or received;
+-- main.profile reads a missing row as all zeros.
+
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id INTEGER PRIMARY KEY,
+    review_count INTEGER NOT NULL DEFAULT 0, -- Reviews received
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    rating_1 INTEGER NOT NULL DEFAULT 0, -- Reviews received with each rating
+    rating_2 INTEGER NOT NULL DEFAULT 0,
+    rating_3 INTEGER NOT NULL DEFAULT 0,
+    rating_4 INTEGER NOT NULL DEFAULT 0,
+    rating_5 INTEGER NOT NULL DEFAULT 0,
+    available_count INTEGER NOT NULL DEFAULT 0, -- Listings
+    sold_count INTEGER NOT NULL DEFAULT 0,
+    last_active TIMESTAMP, -- Latest listing posted, listing marked sold/available or review written
+    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+);
+
+CREATE TRIGGER IF NOT EXISTS user_stats_reviews_ai AFTER INSERT ON reviews BEGIN
+    INSERT INTO user_stats (user_id, review_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5)
+    VALUES (new.reviewed_user_id, 1, new.rating,
+            new.rating = 1, new.rating = 2, new.rating = 3, new.rating = 4, new.rating = 5)
+    ON CONFLICT (user_id) DO UPDATE SET
+        review_count = review_count + 1,
+        rating_sum = rating_sum + excluded.rating_sum,
+        rating_1 = rating_1 + excluded.rating_1,
+        rating_2 = rating_2 + excluded.rating_2,
+        rating_3 = rating_3 + excluded.rating_3,
+        rating_4 = rating_4 + excluded.rating_4,
+        rating_5 = rating_5 + excluded.rating_5;
+    INSERT INTO user_stats (user_id, last_active) VALUES (new.reviewer_id, new.timestamp)
+    ON CONFLICT (user_id) DO UPDATE SET
+        last_active = max(COALESCE(last_active, excluded.last_active), excluded.last_active);
+END;
+
+-- Reviews are only deleted by the ON DELETE CASCADE of a deleted reviewer
+CREATE TRIGGER IF NOT EXISTS user_stats_reviews_ad AFTER DELETE ON reviews BEGIN
+    UPDATE user_stats SET
+        review_count = review_count - 1,
+        rating_sum = rating_sum - old.rating,
+        rating_1 = rating_1 - (old.rating = 1),
+        rating_2 = rating_2 - (old.rating = 2),
+        rating_3 = rating_3 - (old.rating = 3),
+        rating_4 = rating_4 - (old.rating = 4),
+        rating_5 = rating_5 - (old.rating = 5)
+    WHERE user_id = old.reviewed_user_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_stats_products_ai AFTER INSERT ON products BEGIN
+    INSERT INTO user_stats (user_id, available_count, sold_count, last_active)
+    VALUES (new.seller_id, new.is_sold = 0, new.is_sold != 0, new.date_posted)
+    ON CONFLICT (user_id) DO UPDATE SET
+        available_count = available_count + excluded.available_count,
+        sold_count = sold_count + excluded.sold_count,
+        last_active = max(COALESCE(last_active, excluded.last_active), excluded.last_active);
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_stats_products_ad AFTER DELETE ON products BEGIN
+    UPDATE user_stats SET
+        available_count = available_count - (old.is_sold = 0),
+        sold_count = sold_count - (old.is_sold != 0)
+    WHERE user_id = old.seller_id;
+END;
+
+-- product.toggle_sold; seller_id never changes through the app but is handled for completeness
+CREATE TRIGGER IF NOT EXISTS user_stats_products_au AFTER UPDATE OF is_sold, seller_id ON products
+WHEN new.is_sold IS NOT old.is_sold OR new.seller_id != old.seller_id BEGIN
+    UPDATE user_stats SET
+        available_count = available_count - (old.is_sold = 0),
+        sold_count = sold_count - (old.is_sold != 0)
+    WHERE user_id = old.seller_id;
+    INSERT INTO user_stats (user_id, available_count, sold_count, last_active)
+    VALUES (new.seller_id, new.is_sold = 0, new.is_sold != 0, datetime('now', 'localtime'))
+    ON CONFLICT (user_id) DO UPDATE SET
+        available_count = available_count + excluded.available_count,
+        sold_count = sold_count + excluded.sold_count,
+        last_active = max(COALESCE(last_active, excluded.last_active), excluded.last_active);
+END;
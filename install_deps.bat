@@ -19,6 +19,12 @@ if %ERRORLEVEL% neq 0 (
     exit /b 1
 )
 
+echo Installing optional extras from requirements-optional.txt...
+pip install -r requirements-optional.txt
+if %ERRORLEVEL% neq 0 (
+    echo WARNING: Optional extras could not be installed; the app still runs without them.
+)
+
 echo.
 echo Dependencies installed successfully.
 echo You can now run the application (e.g., using 'flask run').
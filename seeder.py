@@ -1,11 +1,26 @@
+"""Fills the database with fake campuses, users, listings, comments, likes and reviews.
+
+    python seeder.py                       # Small demo data set
+    python seeder.py --users 50000 --products-per-user 15 25 --workers 4   # ~1M products
+
+Run `flask init-db` first. Rows are inserted with executemany in chunks of
+--chunk-size, one transaction per table, with durability pragmas relaxed and
+secondary indexes and the stats triggers dropped until the load is finished
+(see begin_bulk_load).
+"""
+import argparse
+import itertools
+import multiprocessing
 import sqlite3
 import os
 import random
 import re
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from faker import Faker
 from werkzeug.security import generate_password_hash
-import uuid
+
+from db.db import STATS_REBUILD_STATEMENTS, USER_STATS_REBUILD_STATEMENTS
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, 'instance', 'default.sqlite')
@@ -15,8 +30,30 @@ NUM_PRODUCTS_PER_USER_RANGE = (2, 7)
 NUM_COMMENTS_PER_PRODUCT_RANGE = (0, 6)
 NUM_REVIEWS_PER_USER_RANGE = (0, 5)
 LIKE_PROBABILITY = 0.35
+MAX_LIKES_PER_USER = 100 # Keeps likes linear in users rather than users x products
+
+DEFAULT_PASSWORD = 'password'
+CHUNK_SIZE = 10000 # Rows per executemany call
+
+CATEGORY_IMAGE_MAP = {
+    'Textbooks': 'textbooks.jpg',
+    'Electronics': 'electronics.jpg',
+    'Furniture': 'furniture.jpg',
+    'Clothing': 'clothing.jpg',
+    'School Supplies': 'school_supplies.jpg',
+    'Sports Equipment': 'sports_equipment.jpg',
+    'Musical Instruments': 'musical_instruments.jpg',
+    'Event Tickets': 'event_tickets.jpg',
+    'Services': 'services.jpg',
+    'Other': 'other.jpg'
+}
 
 fake = Faker()
+_NOW = datetime.now()
+
+def random_datetime(days_back):
+    """A uniformly random datetime in the last days_back days; much cheaper than fake.date_time_between."""
+    return _NOW - timedelta(seconds=random.random() * days_back * 86400)
 
 def get_db_connection():
     if not os.path.exists(os.path.dirname(DB_PATH)):
@@ -36,6 +73,77 @@ def get_db_connection():
         print(f"Database connection error: {e}")
         exit()
 
+def begin_bulk_load(conn):
+    """Speeds up a large load: relaxed durability, a bigger page cache, no secondary indexes
+    and no stats or user_stats triggers (those tables are rebuilt in one pass at the end).
+
+    Returns the state end_bulk_load needs to put things back. A crash during the
+    load can corrupt the database, which is fine for seed data.
+    """
+    journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    try:
+        conn.execute("PRAGMA journal_mode = MEMORY")
+    except sqlite3.OperationalError as e: # Another connection has the database open; keep WAL
+        print(f"Keeping journal mode {journal_mode}: {e}")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -262144") # 256 MiB
+    conn.execute("PRAGMA temp_store = MEMORY")
+    # Unique indexes stay, since INSERT OR IGNORE relies on them
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+        "AND sql NOT LIKE 'CREATE UNIQUE%'"
+    ).fetchall()
+    for index in indexes:
+        conn.execute(f'DROP INDEX "{index["name"]}"')
+    triggers = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' "
+        "AND (name LIKE 'stats\\_%' ESCAPE '\\' OR name LIKE 'user\\_stats\\_%' ESCAPE '\\')"
+    ).fetchall()
+    for trigger in triggers:
+        conn.execute(f'DROP TRIGGER "{trigger["name"]}"')
+    conn.commit()
+    print(f"Bulk load mode: dropped {len(indexes)} indexes and {len(triggers)} triggers until seeding is done.")
+    return journal_mode, [index['sql'] for index in indexes], [trigger['sql'] for trigger in triggers]
+
+def end_bulk_load(conn, state):
+    """Rebuilds the indexes and stats dropped by begin_bulk_load and restores the journal mode."""
+    journal_mode, index_sql, trigger_sql = state
+    print(f"Rebuilding {len(index_sql)} indexes...")
+    for sql in index_sql:
+        conn.execute(sql)
+    if trigger_sql:
+        print("Rebuilding stats...")
+        for sql in trigger_sql:
+            conn.execute(sql)
+        for statement in STATS_REBUILD_STATEMENTS + USER_STATS_REBUILD_STATEMENTS:
+            conn.execute(statement)
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+    conn.execute("PRAGMA synchronous = NORMAL")
+
+def _insert_chunks(conn, sql, rows, chunk_size, label=None):
+    """executemany()s rows in chunks of chunk_size without committing. Returns the row count."""
+    rows = iter(rows)
+    inserted = 0
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return inserted
+        conn.executemany(sql, chunk)
+        inserted += len(chunk)
+        if label and inserted // 100000 != (inserted - len(chunk)) // 100000:
+            print(f"  ... {inserted} {label}")
+
+@contextmanager
+def _chunk_results(func, tasks, workers):
+    """Yields func(task) for each task in order, computed by a pool of worker processes if workers > 1."""
+    if workers <= 1:
+        yield map(func, tasks)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        yield pool.imap(func, tasks)
+
 def get_existing_ids(conn, table_name):
     try:
         cursor = conn.cursor()
@@ -127,60 +235,61 @@ def seed_categories(conn):
         conn.rollback()
         return {}
 
-def seed_users(conn, num_users, campus_map):
+def seed_users(conn, num_users, campus_map, chunk_size=CHUNK_SIZE):
     print(f"Seeding {num_users} users...")
     if not campus_map:
         print("Warning: Cannot generate campus-specific emails without campus data.")
         return []
 
     campus_ids = list(campus_map.keys())
-    users_data = []
+    domains = {campus_id: generate_domain(name) for campus_id, name in campus_map.items()}
     generated_emails = set()
-
-    for i in range(num_users):
-        name = fake.name()
-        password = 'password'
-        hashed_password = generate_password_hash(password)
-        join_date = fake.date_time_between(start_date='-2y', end_date='now')
-        major = fake.random_element(elements=('Computer Science', 'Business Admin', 'Psychology', 'Engineering', 'Biology', 'Communications', 'Art History', 'Economics', 'Nursing'))
-        year = fake.random_element(elements=('Freshman', 'Sophomore', 'Junior', 'Senior', 'Grad Student'))
-        profile_info = f"{year} studying {major}. Looking to buy/sell {fake.random_element(elements=('textbooks', 'dorm stuff', 'electronics', 'clothing'))}. {fake.sentence(nb_words=random.randint(4, 8))}"
-
-        assigned_campus_id = random.choice(campus_ids)
-        campus_name = campus_map.get(assigned_campus_id, "Unknown Campus")
-
-        domain = generate_domain(campus_name)
-        username_base = fake.user_name()
-        email = f"{username_base}@{domain}"
-
-        if i == 0:
-            username_base = 'user1'
+    # Every seeded user shares one password, and hashing is deliberately slow, so hash it once
+    hashed_password = generate_password_hash(DEFAULT_PASSWORD)
+
+    def user_rows():
+        for i in range(num_users):
+            name = fake.name()
+            join_date = random_datetime(days_back=730)
+            major = random.choice(('Computer Science', 'Business Admin', 'Psychology', 'Engineering', 'Biology', 'Communications', 'Art History', 'Economics', 'Nursing'))
+            year = random.choice(('Freshman', 'Sophomore', 'Junior', 'Senior', 'Grad Student'))
+            profile_info = f"{year} studying {major}. Looking to buy/sell {random.choice(('textbooks', 'dorm stuff', 'electronics', 'clothing'))}. {fake.sentence(nb_words=random.randint(4, 8))}"
+
+            assigned_campus_id = random.choice(campus_ids)
+            domain = domains[assigned_campus_id]
+            username_base = fake.user_name()
             email = f"{username_base}@{domain}"
-        elif i == 1:
-            username_base = 'user2'
-            email = f"{username_base}@{domain}"
-
-        retry_count = 0
-        while email in generated_emails and retry_count < 5:
-            username_base = fake.user_name() + str(random.randint(1,99))
-            email = f"{username_base}@{domain}"
-            retry_count += 1
-        if email in generated_emails:
-             print(f"Warning: Could not generate unique email for domain {domain}. Skipping user.")
-             continue
 
-        generated_emails.add(email)
-        users_data.append((name, email, hashed_password, join_date, profile_info, assigned_campus_id))
+            if i == 0:
+                username_base = 'user1'
+                email = f"{username_base}@{domain}"
+            elif i == 1:
+                username_base = 'user2'
+                email = f"{username_base}@{domain}"
+
+            retry_count = 0
+            while email in generated_emails and retry_count < 5:
+                username_base = fake.user_name() + str(random.randint(1,99))
+                email = f"{username_base}@{domain}"
+                retry_count += 1
+            if email in generated_emails:
+                email = f"{username_base}.{i}@{domain}" # Fake user names run out long before 1M users
+            if email in generated_emails:
+                 print(f"Warning: Could not generate unique email for domain {domain}. Skipping user.")
+                 continue
+
+            generated_emails.add(email)
+            yield (name, email, hashed_password, join_date, profile_info, assigned_campus_id)
 
     try:
-        cursor = conn.cursor()
-        cursor.executemany("""
+        first_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0]
+        inserted = _insert_chunks(conn, """
             INSERT INTO users (name, email, password_hash, join_date, profile_info, campus_id)
             VALUES (?, ?, ?, ?, ?, ?)
-        """, users_data)
+        """, user_rows(), chunk_size, label='users')
         conn.commit()
-        print(f"Seeded {len(users_data)} users. Default password: 'password'. Check DB for test user emails.")
-        return get_existing_ids(conn, 'users')
+        print(f"Seeded {inserted} users. Default password: '{DEFAULT_PASSWORD}'. Check DB for test user emails.")
+        return [row['id'] for row in conn.execute("SELECT id FROM users WHERE id > ? ORDER BY id", (first_id,))]
     except sqlite3.Error as e:
         if "UNIQUE constraint failed: users.email" in str(e):
              print(f"Warning: Skipped duplicate email during seeding (DB constraint): {e}")
@@ -192,262 +301,254 @@ def seed_users(conn, num_users, campus_map):
             return []
 
 
-def seed_products(conn, user_ids, category_map, num_products_range):
+def generate_product(seller_id, category_id, category_name):
+    """A products row (title, description, price, condition, image_path, date_posted, category_id, seller_id, is_sold)."""
+    price = round(random.uniform(5.0, 500.0), 2)
+    condition = random.choice(['New', 'Used - Like New', 'Used - Good', 'Used - Fair', 'Used - Poor'])
+    date_posted = random_datetime(days_back=365)
+    is_sold = random.random() < 0.15
+
+    placeholder_filename = CATEGORY_IMAGE_MAP.get(category_name, 'other.jpg')
+    image_path = f"product_images/{placeholder_filename}"
+
+    title = f"{condition} {category_name} Item"
+    description = f"Selling a {category_name.lower()}. Condition: {condition}."
+
+    if category_name == 'Textbooks':
+        course = random.choice(('CS 101', 'MATH 210', 'BIO 150', 'ENG 102', 'HIST 205', 'CHEM 111', 'PSYC 100'))
+        adj = random.choice(('Gently Used', 'Like New', 'Acceptable Condition', 'Required'))
+        title = f"{adj} {course} Textbook ({random.randint(3, 9)}th Ed.)"
+        desc_detail = random.choice(('Some highlighting.', 'No writing inside.', 'Minimal wear on cover.', 'Access code likely used.', 'Needed for Prof. Smith\'s class.'))
+        description = f"Textbook for {course}. {desc_detail} Condition: {condition}. ISBN: {fake.isbn13()}."
+        price = round(random.uniform(15.0, 150.0), 2)
+    elif category_name == 'Electronics':
+        item = random.choice(('Laptop', 'Monitor', 'Headphones', 'Keyboard', 'Mouse', 'Calculator', 'Webcam', 'Tablet', 'Charger', 'Speaker'))
+        brand = random.choice(('Dell', 'HP', 'Logitech', 'Sony', 'Apple', 'Samsung', 'TI', 'Anker', 'Microsoft', 'Bose'))
+        title = f"{condition} {brand} {item}"
+        desc_detail = random.choice(('Works perfectly.', 'Used for about a year.', 'Minor cosmetic scratches.', 'Includes original charger/cable.', 'Selling because I upgraded.'))
+        description = f"Selling my {brand} {item}. {desc_detail} Condition: {condition}. Model: {fake.word().upper()}-{random.randint(100, 999)}."
+        price = round(random.uniform(10.0, 600.0), 2)
+    elif category_name == 'Furniture':
+        item = random.choice(('Desk Lamp', 'Mini Fridge', 'Bookshelf', 'Desk Chair', 'Futon Couch', 'Bedside Table', 'Floor Lamp', 'Storage Ottoman', 'Mirror'))
+        adj = random.choice(('Compact', 'Sturdy', 'IKEA', 'Used', 'Foldable', 'Adjustable'))
+        title = f"{adj} {item} - {condition}"
+        desc_detail = random.choice(('Perfect for dorm rooms.', 'Used for one semester.', 'Need gone ASAP - moving out.', 'Great for small spaces.', 'Smoke-free home.'))
+        description = f"{item} for sale. {desc_detail} Condition: {condition}. Approx Dimensions: {random.randint(10, 40)}x{random.randint(10, 30)} inches."
+        price = round(random.uniform(10.0, 200.0), 2)
+    elif category_name == 'Clothing':
+        item = random.choice(('Hoodie', 'Jacket', 'Sweater', 'T-Shirt', 'Jeans', 'Sneakers', 'Boots', 'Backpack', 'Dress Shirt', 'Shorts'))
+        brand = random.choice(('Nike', 'Adidas', 'North Face', 'Champion', 'University Brand', 'Levis', 'Vans', 'Patagonia', 'H&M', 'Zara'))
+        size = random.choice(('XS', 'S', 'M', 'L', 'XL', 'OS', 'W 7', 'M 10', 'Size 32', 'Size 8'))
+        title = f"{brand} {item} - Size {size} ({condition})"
+        desc_detail = random.choice(('Worn only a few times.', 'Doesn\'t fit me anymore.', 'Very comfortable.', 'Great condition.', 'Official campus apparel.'))
+        description = f"{brand} {item}, size {size}. {desc_detail} Condition: {condition}."
+        price = round(random.uniform(5.0, 80.0), 2)
+    elif category_name == 'School Supplies':
+         item = random.choice(('Binder', 'Notebook Pack', 'Pen Set', 'Highlighters', 'Backpack', 'Planner', 'Index Cards', 'Folder Assortment'))
+         brand = random.choice(('Five Star', 'Mead', 'Pilot', 'Sharpie', 'Jansport', 'Moleskine', 'Oxford'))
+         title = f"{brand} {item} - {condition}"
+         desc_detail = random.choice(('Barely used.', 'Left over from last semester.', 'Bought too many.', 'Great for organizing notes.'))
+         description = f"Selling {item}. {desc_detail} Condition: {condition}."
+         price = round(random.uniform(2.0, 30.0), 2)
+    elif category_name == 'Sports Equipment':
+         item = random.choice(('Basketball', 'Soccer Ball', 'Football', 'Tennis Racket', 'Yoga Mat', 'Dumbbell Set', 'Frisbee', 'Bike Helmet'))
+         brand = random.choice(('Spalding', 'Wilson', 'Nike', 'Adidas', 'Gaiam', 'CAP Barbell', 'Discraft', 'Giro'))
+         title = f"{brand} {item} ({condition})"
+         desc_detail = random.choice(('Used for intramurals.', 'Good condition, just don\'t use it.', 'Perfect for pickup games.', 'Great for staying active.'))
+         description = f"Selling {brand} {item}. {desc_detail} Condition: {condition}."
+         price = round(random.uniform(5.0, 75.0), 2)
+    elif category_name == 'Musical Instruments':
+         item = random.choice(('Acoustic Guitar', 'Keyboard', 'Ukulele', 'Practice Amp', 'Music Stand', 'Cajon Drum', 'Violin (Student)'))
+         brand = random.choice(('Fender', 'Yamaha', 'Casio', 'Lanikai', 'Hercules', 'Meinl', 'Cecilio'))
+         title = f"{brand} {item} - {condition}"
+         desc_detail = random.choice(('Great beginner instrument.', 'Includes case/accessories.', 'Selling due to lack of use.', 'Sounds good.'))
+         description = f"{brand} {item} for sale. {desc_detail} Condition: {condition}."
+         price = round(random.uniform(20.0, 300.0), 2)
+    elif category_name == 'Event Tickets':
+         event = random.choice(('Football Game', 'Basketball Game', 'Concert', 'Theater Performance', 'Guest Lecture', 'Campus Fest'))
+         artist_team = random.choice(('Homecoming Game', 'Rivalry Matchup', fake.name() + ' Band', 'Spring Musical', 'vs State', 'Famous Speaker Series'))
+         title = f"Ticket for {artist_team} {event} - {fake.date_this_month(after_today=True).strftime('%b %d')}"
+         desc_detail = random.choice(('Can\'t make it anymore.', 'Selling below face value!', 'Student section ticket.', 'Great seats!', 'Mobile transfer available.'))
+         description = f"Selling one ticket for the {artist_team} {event} on {title.split('- ')[-1]}. {desc_detail}"
+         price = round(random.uniform(10.0, 100.0), 2)
+         condition = 'N/A'
+    elif category_name == 'Services':
+         service = random.choice(('Tutoring', 'Moving Help', 'Computer Repair', 'Graphic Design', 'Photography Session', 'Cleaning Service'))
+         subject_area = random.choice(('Math/Stats', 'Writing/Editing', 'Science', 'Programming', 'General Help', 'Portraits', 'Events'))
+         title = f"{service} Available - {subject_area}"
+         desc_detail = random.choice(('Experienced tutor.', 'Strong student available to help move heavy items.', 'Affordable rates.', 'Quick turnaround.', 'Flexible hours.'))
+         description = f"Offering {service} for {subject_area.lower()}. {desc_detail} Contact me for rates and details."
+         price = round(random.uniform(15.0, 50.0), 2)
+         condition = 'N/A'
+    elif category_name == 'Other':
+         item = random.choice(('Wall Tapestry', 'Video Game', 'Board Game', 'Plant', 'Art Print', 'Kitchenware Set', 'Bike Lock'))
+         adj = random.choice(('Cool', 'Fun', 'Unused', 'Quirky', 'Handmade', 'Durable'))
+         title = f"{adj} {item} - {condition}"
+         desc_detail = random.choice(('Random item for sale.', 'Clearing out my room.', 'Maybe someone needs this?', 'Make an offer!'))
+         description = f"Selling: {item}. {desc_detail} Condition: {condition}."
+         price = round(random.uniform(1.0, 50.0), 2)
+
+    if category_name in ['Event Tickets', 'Services']:
+         condition = 'N/A'
+
+    return (
+        title, description, price, condition, image_path,
+        date_posted, category_id, seller_id, is_sold
+    )
+
+def _generate_product_chunk(task):
+    # Runs in a worker process when --workers > 1, so it gets its own seed
+    seller_ids, category_map, num_products_range, seed = task
+    random.seed(seed)
+    fake.seed_instance(seed)
+    category_ids = list(category_map.keys())
+    rows = []
+    for seller_id in seller_ids:
+        for _ in range(random.randint(num_products_range[0], num_products_range[1])):
+            category_id = random.choice(category_ids)
+            rows.append(generate_product(seller_id, category_id, category_map.get(category_id, 'Other')))
+    return rows
+
+def seed_products(conn, user_ids, category_map, num_products_range, chunk_size=CHUNK_SIZE, workers=1):
+    """Inserts num_products_range products per user, generating rows in `workers` processes.
+
+    Returns {product_id: seller_id} for the new products.
+    """
     print("Seeding products...")
     if not user_ids or not category_map:
         print("Cannot seed products without users and categories.")
-        return []
+        return {}
 
-    category_ids = list(category_map.keys())
-    products_data = []
-    product_id_map = {}
-
-    category_image_map = {
-        'Textbooks': 'textbooks.jpg',
-        'Electronics': 'electronics.jpg',
-        'Furniture': 'furniture.jpg',
-        'Clothing': 'clothing.jpg',
-        'School Supplies': 'school_supplies.jpg',
-        'Sports Equipment': 'sports_equipment.jpg',
-        'Musical Instruments': 'musical_instruments.jpg',
-        'Event Tickets': 'event_tickets.jpg',
-        'Services': 'services.jpg',
-        'Other': 'other.jpg'
-    }
-
-    for seller_id in user_ids:
-        num_products = random.randint(num_products_range[0], num_products_range[1])
-        for _ in range(num_products):
-            category_id = random.choice(category_ids)
-            category_name = category_map.get(category_id, 'Other')
-
-            price = round(random.uniform(5.0, 500.0), 2)
-            condition = random.choice(['New', 'Used - Like New', 'Used - Good', 'Used - Fair', 'Used - Poor'])
-            date_posted = fake.date_time_between(start_date='-1y', end_date='now')
-            is_sold = fake.boolean(chance_of_getting_true=15)
-
-            placeholder_filename = category_image_map.get(category_name, 'other.jpg')
-            image_path = f"product_images/{placeholder_filename}"
-
-            title = f"{condition} {category_name} Item"
-            description = f"Selling a {category_name.lower()}. Condition: {condition}."
-
-            if category_name == 'Textbooks':
-                course = fake.random_element(elements=('CS 101', 'MATH 210', 'BIO 150', 'ENG 102', 'HIST 205', 'CHEM 111', 'PSYC 100'))
-                adj = fake.random_element(elements=('Gently Used', 'Like New', 'Acceptable Condition', 'Required'))
-                title = f"{adj} {course} Textbook ({random.randint(3, 9)}th Ed.)"
-                desc_detail = fake.random_element(elements=('Some highlighting.', 'No writing inside.', 'Minimal wear on cover.', 'Access code likely used.', 'Needed for Prof. Smith\'s class.'))
-                description = f"Textbook for {course}. {desc_detail} Condition: {condition}. ISBN: {fake.isbn13()}."
-                price = round(random.uniform(15.0, 150.0), 2)
-            elif category_name == 'Electronics':
-                item = fake.random_element(elements=('Laptop', 'Monitor', 'Headphones', 'Keyboard', 'Mouse', 'Calculator', 'Webcam', 'Tablet', 'Charger', 'Speaker'))
-                brand = fake.random_element(elements=('Dell', 'HP', 'Logitech', 'Sony', 'Apple', 'Samsung', 'TI', 'Anker', 'Microsoft', 'Bose'))
-                title = f"{condition} {brand} {item}"
-                desc_detail = fake.random_element(elements=('Works perfectly.', 'Used for about a year.', 'Minor cosmetic scratches.', 'Includes original charger/cable.', 'Selling because I upgraded.'))
-                description = f"Selling my {brand} {item}. {desc_detail} Condition: {condition}. Model: {fake.word().upper()}-{random.randint(100, 999)}."
-                price = round(random.uniform(10.0, 600.0), 2)
-            elif category_name == 'Furniture':
-                item = fake.random_element(elements=('Desk Lamp', 'Mini Fridge', 'Bookshelf', 'Desk Chair', 'Futon Couch', 'Bedside Table', 'Floor Lamp', 'Storage Ottoman', 'Mirror'))
-                adj = fake.random_element(elements=('Compact', 'Sturdy', 'IKEA', 'Used', 'Foldable', 'Adjustable'))
-                title = f"{adj} {item} - {condition}"
-                desc_detail = fake.random_element(elements=('Perfect for dorm rooms.', 'Used for one semester.', 'Need gone ASAP - moving out.', 'Great for small spaces.', 'Smoke-free home.'))
-                description = f"{item} for sale. {desc_detail} Condition: {condition}. Approx Dimensions: {random.randint(10, 40)}x{random.randint(10, 30)} inches."
-                price = round(random.uniform(10.0, 200.0), 2)
-            elif category_name == 'Clothing':
-                item = fake.random_element(elements=('Hoodie', 'Jacket', 'Sweater', 'T-Shirt', 'Jeans', 'Sneakers', 'Boots', 'Backpack', 'Dress Shirt', 'Shorts'))
-                brand = fake.random_element(elements=('Nike', 'Adidas', 'North Face', 'Champion', 'University Brand', 'Levis', 'Vans', 'Patagonia', 'H&M', 'Zara'))
-                size = fake.random_element(elements=('XS', 'S', 'M', 'L', 'XL', 'OS', 'W 7', 'M 10', 'Size 32', 'Size 8'))
-                title = f"{brand} {item} - Size {size} ({condition})"
-                desc_detail = fake.random_element(elements=('Worn only a few times.', 'Doesn\'t fit me anymore.', 'Very comfortable.', 'Great condition.', 'Official campus apparel.'))
-                description = f"{brand} {item}, size {size}. {desc_detail} Condition: {condition}."
-                price = round(random.uniform(5.0, 80.0), 2)
-            elif category_name == 'School Supplies':
-                 item = fake.random_element(elements=('Binder', 'Notebook Pack', 'Pen Set', 'Highlighters', 'Backpack', 'Planner', 'Index Cards', 'Folder Assortment'))
-                 brand = fake.random_element(elements=('Five Star', 'Mead', 'Pilot', 'Sharpie', 'Jansport', 'Moleskine', 'Oxford'))
-                 title = f"{brand} {item} - {condition}"
-                 desc_detail = fake.random_element(elements=('Barely used.', 'Left over from last semester.', 'Bought too many.', 'Great for organizing notes.'))
-                 description = f"Selling {item}. {desc_detail} Condition: {condition}."
-                 price = round(random.uniform(2.0, 30.0), 2)
-            elif category_name == 'Sports Equipment':
-                 item = fake.random_element(elements=('Basketball', 'Soccer Ball', 'Football', 'Tennis Racket', 'Yoga Mat', 'Dumbbell Set', 'Frisbee', 'Bike Helmet'))
-                 brand = fake.random_element(elements=('Spalding', 'Wilson', 'Nike', 'Adidas', 'Gaiam', 'CAP Barbell', 'Discraft', 'Giro'))
-                 title = f"{brand} {item} ({condition})"
-                 desc_detail = fake.random_element(elements=('Used for intramurals.', 'Good condition, just don\'t use it.', 'Perfect for pickup games.', 'Great for staying active.'))
-                 description = f"Selling {brand} {item}. {desc_detail} Condition: {condition}."
-                 price = round(random.uniform(5.0, 75.0), 2)
-            elif category_name == 'Musical Instruments':
-                 item = fake.random_element(elements=('Acoustic Guitar', 'Keyboard', 'Ukulele', 'Practice Amp', 'Music Stand', 'Cajon Drum', 'Violin (Student)'))
-                 brand = fake.random_element(elements=('Fender', 'Yamaha', 'Casio', 'Lanikai', 'Hercules', 'Meinl', 'Cecilio'))
-                 title = f"{brand} {item} - {condition}"
-                 desc_detail = fake.random_element(elements=('Great beginner instrument.', 'Includes case/accessories.', 'Selling due to lack of use.', 'Sounds good.'))
-                 description = f"{brand} {item} for sale. {desc_detail} Condition: {condition}."
-                 price = round(random.uniform(20.0, 300.0), 2)
-            elif category_name == 'Event Tickets':
-                 event = fake.random_element(elements=('Football Game', 'Basketball Game', 'Concert', 'Theater Performance', 'Guest Lecture', 'Campus Fest'))
-                 artist_team = fake.random_element(elements=('Homecoming Game', 'Rivalry Matchup', fake.name() + ' Band', 'Spring Musical', 'vs State', 'Famous Speaker Series'))
-                 title = f"Ticket for {artist_team} {event} - {fake.date_this_month(after_today=True).strftime('%b %d')}"
-                 desc_detail = fake.random_element(elements=('Can\'t make it anymore.', 'Selling below face value!', 'Student section ticket.', 'Great seats!', 'Mobile transfer available.'))
-                 description = f"Selling one ticket for the {artist_team} {event} on {title.split('- ')[-1]}. {desc_detail}"
-                 price = round(random.uniform(10.0, 100.0), 2)
-                 condition = 'N/A'
-            elif category_name == 'Services':
-                 service = fake.random_element(elements=('Tutoring', 'Moving Help', 'Computer Repair', 'Graphic Design', 'Photography Session', 'Cleaning Service'))
-                 subject_area = fake.random_element(elements=('Math/Stats', 'Writing/Editing', 'Science', 'Programming', 'General Help', 'Portraits', 'Events'))
-                 title = f"{service} Available - {subject_area}"
-                 desc_detail = fake.random_element(elements=('Experienced tutor.', 'Strong student available to help move heavy items.', 'Affordable rates.', 'Quick turnaround.', 'Flexible hours.'))
-                 description = f"Offering {service} for {subject_area.lower()}. {desc_detail} Contact me for rates and details."
-                 price = round(random.uniform(15.0, 50.0), 2)
-                 condition = 'N/A'
-            elif category_name == 'Other':
-                 item = fake.random_element(elements=('Wall Tapestry', 'Video Game', 'Board Game', 'Plant', 'Art Print', 'Kitchenware Set', 'Bike Lock'))
-                 adj = fake.random_element(elements=('Cool', 'Fun', 'Unused', 'Quirky', 'Handmade', 'Durable'))
-                 title = f"{adj} {item} - {condition}"
-                 desc_detail = fake.random_element(elements=('Random item for sale.', 'Clearing out my room.', 'Maybe someone needs this?', 'Make an offer!'))
-                 description = f"Selling: {item}. {desc_detail} Condition: {condition}."
-                 price = round(random.uniform(1.0, 50.0), 2)
-
-            if category_name in ['Event Tickets', 'Services']:
-                 condition = 'N/A'
-
-            products_data.append((
-                title, description, price, condition, image_path,
-                date_posted, category_id, seller_id, is_sold
-            ))
+    # Split the sellers so each task generates about chunk_size rows
+    sellers_per_task = max(1, chunk_size * 2 // max(1, sum(num_products_range)))
+    base_seed = random.randrange(2 ** 32)
+    tasks = [
+        (user_ids[i:i + sellers_per_task], category_map, num_products_range, base_seed + i)
+        for i in range(0, len(user_ids), sellers_per_task)
+    ]
 
     try:
-        cursor = conn.cursor()
-        inserted_product_ids = []
-        for product in products_data:
-            cursor.execute("""
-                INSERT INTO products (title, description, price, condition, image_path,
-                                      date_posted, category_id, seller_id, is_sold)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, product)
-            last_id = cursor.lastrowid
-            inserted_product_ids.append(last_id)
-            product_id_map[last_id] = product[7]
-
+        first_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM products").fetchone()[0]
+        inserted = 0
+        with _chunk_results(_generate_product_chunk, tasks, workers) as chunks:
+            for rows in chunks:
+                inserted += _insert_chunks(conn, """
+                    INSERT INTO products (title, description, price, condition, image_path,
+                                          date_posted, category_id, seller_id, is_sold)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, rows, chunk_size)
+                if inserted // 100000 != (inserted - len(rows)) // 100000:
+                    print(f"  ... {inserted} products")
         conn.commit()
-        print(f"Seeded {len(inserted_product_ids)} products.")
-        return product_id_map
+        print(f"Seeded {inserted} products.")
+        return {row['id']: row['seller_id'] for row in conn.execute(
+            "SELECT id, seller_id FROM products WHERE id > ?", (first_id,)
+        )}
     except sqlite3.Error as e:
         print(f"Error seeding products: {e}")
         conn.rollback()
         return {}
 
-def seed_comments(conn, user_ids, product_ids, num_comments_range):
+def seed_comments(conn, user_ids, product_ids, num_comments_range, chunk_size=CHUNK_SIZE):
     if not user_ids or not product_ids:
         print("Cannot seed comments without users and products.")
         return
     print("Seeding comments...")
-    comments_data = []
     products_to_comment = random.sample(product_ids, k=min(len(product_ids), int(len(user_ids) * 1.5)))
 
-    for product_id in products_to_comment:
-        num_comments = random.randint(num_comments_range[0], num_comments_range[1])
-        possible_commenters = list(user_ids)
-        if not possible_commenters: continue
-
-        for _ in range(num_comments):
-             user_id = random.choice(possible_commenters)
-             text_options = [
-                "Is this still available?",
-                "Interested! Can we meet near the library?",
-                f"What's the condition like? ({random.choice(['Any scratches?', 'Any issues?', 'Used much?'])})",
-                f"Could you do ${round(random.uniform(5.0, 50.0), 2):.2f}?",
-                "Is the price firm?",
-                "Still for sale?",
-                "I'll take it! Sent you a PM.",
-                "Can I see it sometime this week?",
-                f"Is this the edition required for {fake.random_element(elements=('Dr. Evans', 'Prof. Lee', 'the Bio dept'))}?",
-                "Any chance you'd trade for [my item]?",
-             ]
-             text = random.choice(text_options)
-             timestamp = fake.date_time_between(start_date='-6m', end_date='now')
-             comments_data.append((user_id, product_id, text, timestamp))
-
-    if not comments_data:
-        print("No comments generated.")
-        return
+    def comment_rows():
+        for product_id in products_to_comment:
+            num_comments = random.randint(num_comments_range[0], num_comments_range[1])
+            for _ in range(num_comments):
+                 user_id = random.choice(user_ids)
+                 text_options = [
+                    "Is this still available?",
+                    "Interested! Can we meet near the library?",
+                    f"What's the condition like? ({random.choice(['Any scratches?', 'Any issues?', 'Used much?'])})",
+                    f"Could you do ${round(random.uniform(5.0, 50.0), 2):.2f}?",
+                    "Is the price firm?",
+                    "Still for sale?",
+                    "I'll take it! Sent you a PM.",
+                    "Can I see it sometime this week?",
+                    f"Is this the edition required for {random.choice(('Dr. Evans', 'Prof. Lee', 'the Bio dept'))}?",
+                    "Any chance you'd trade for [my item]?",
+                 ]
+                 text = random.choice(text_options)
+                 timestamp = random_datetime(days_back=182)
+                 yield (user_id, product_id, text, timestamp)
 
     try:
-        cursor = conn.cursor()
-        cursor.executemany("""
+        attempted = _insert_chunks(conn, """
             INSERT INTO comments (user_id, product_id, text, "timestamp")
             VALUES (?, ?, ?, ?)
-        """, comments_data)
+        """, comment_rows(), chunk_size, label='comments')
         conn.commit()
-        cursor.execute("SELECT COUNT(*) FROM comments")
-        comment_count = cursor.fetchone()[0]
-        print(f"Seeded comments. Total comments in DB: {comment_count}. (Attempted {len(comments_data)})")
+        if not attempted:
+            print("No comments generated.")
+            return
+        comment_count = conn.execute("SELECT COUNT(*) FROM comments").fetchone()[0]
+        print(f"Seeded comments. Total comments in DB: {comment_count}. (Attempted {attempted})")
 
     except sqlite3.Error as e:
         print(f"Error seeding comments: {e}")
         conn.rollback()
 
-def seed_reviews(conn, user_ids, product_id_map, num_reviews_range):
+def seed_reviews(conn, user_ids, product_id_map, num_reviews_range, chunk_size=CHUNK_SIZE):
     if not user_ids or len(user_ids) < 2 or not product_id_map:
         print("Cannot seed reviews without at least 2 users and products.")
         return
     print("Seeding reviews...")
-    reviews_data = []
-    sellers = list(set(product_id_map.values()))
-    potential_reviewers = list(user_ids)
-
-    for reviewed_user_id in sellers:
-        num_reviews = random.randint(num_reviews_range[0], num_reviews_range[1])
-        possible_reviewers = [r for r in potential_reviewers if r != reviewed_user_id]
-        if not possible_reviewers: continue
-
-        products_by_seller = [pid for pid, sid in product_id_map.items() if sid == reviewed_user_id]
-        num_reviews = min(num_reviews, len(possible_reviewers))
-        reviewers_for_this_seller = random.sample(possible_reviewers, k=num_reviews)
-
-        for reviewer_id in reviewers_for_this_seller:
-            product_id = random.choice(products_by_seller) if products_by_seller and random.random() < 0.7 else None
-            rating = random.randint(1, 5)
-            timestamp = fake.date_time_between(start_date='-6m', end_date='now')
-            comment = None
-            if random.random() < 0.8:
-                comment_options_positive = [
-                    "Great seller! Item was exactly as described. Easy pickup.",
-                    "Smooth transaction, very friendly and responsive.",
-                    "Quick meet up. Item in perfect condition. Highly recommend!",
-                    "Got a great deal on the textbook, super happy. Thanks!",
-                    "Excellent communication, would buy from again!",
-                ]
-                comment_options_neutral = [
-                    "Item was okay, transaction was fine.",
-                    "Met up eventually. Item as described.",
-                    "Standard transaction, no issues.",
-                ]
-                comment_options_negative = [
-                    "Item wasn't quite in the condition described. Disappointed.",
-                    "Seller was late and hard to reach.",
-                    "Difficult to coordinate pickup. Wouldn't recommend.",
-                    "Item had undisclosed damage.",
-                ]
-                if rating >= 4: comment = random.choice(comment_options_positive)
-                elif rating == 3: comment = random.choice(comment_options_neutral)
-                else: comment = random.choice(comment_options_negative)
-
-            if reviewer_id != reviewed_user_id:
-                reviews_data.append((reviewer_id, reviewed_user_id, product_id, rating, comment, timestamp))
-
-    if not reviews_data:
-        print("No reviews generated.")
-        return
+    products_by_seller = {}
+    for product_id, seller_id in product_id_map.items():
+        products_by_seller.setdefault(seller_id, []).append(product_id)
+
+    comment_options_positive = [
+        "Great seller! Item was exactly as described. Easy pickup.",
+        "Smooth transaction, very friendly and responsive.",
+        "Quick meet up. Item in perfect condition. Highly recommend!",
+        "Got a great deal on the textbook, super happy. Thanks!",
+        "Excellent communication, would buy from again!",
+    ]
+    comment_options_neutral = [
+        "Item was okay, transaction was fine.",
+        "Met up eventually. Item as described.",
+        "Standard transaction, no issues.",
+    ]
+    comment_options_negative = [
+        "Item wasn't quite in the condition described. Disappointed.",
+        "Seller was late and hard to reach.",
+        "Difficult to coordinate pickup. Wouldn't recommend.",
+        "Item had undisclosed damage.",
+    ]
+
+    def review_rows():
+        for reviewed_user_id, seller_products in products_by_seller.items():
+            num_reviews = min(random.randint(num_reviews_range[0], num_reviews_range[1]), len(user_ids) - 1)
+            # Sample one extra so the seller can be dropped without a second pass over every user
+            reviewers = [r for r in random.sample(user_ids, k=min(num_reviews + 1, len(user_ids))) if r != reviewed_user_id]
+
+            for reviewer_id in reviewers[:num_reviews]:
+                product_id = random.choice(seller_products) if random.random() < 0.7 else None
+                rating = random.randint(1, 5)
+                timestamp = random_datetime(days_back=182)
+                comment = None
+                if random.random() < 0.8:
+                    if rating >= 4: comment = random.choice(comment_options_positive)
+                    elif rating == 3: comment = random.choice(comment_options_neutral)
+                    else: comment = random.choice(comment_options_negative)
+                yield (reviewer_id, reviewed_user_id, product_id, rating, comment, timestamp)
 
     try:
-        cursor = conn.cursor()
-        cursor.executemany("""
+        attempted = _insert_chunks(conn, """
             INSERT INTO reviews (reviewer_id, reviewed_user_id, product_id, rating, comment, "timestamp")
             VALUES (?, ?, ?, ?, ?, ?)
-        """, reviews_data)
+        """, review_rows(), chunk_size, label='reviews')
         conn.commit()
-        cursor.execute("SELECT COUNT(*) FROM reviews")
-        review_count = cursor.fetchone()[0]
-        print(f"Seeded reviews. Total reviews in DB: {review_count}. (Attempted {len(reviews_data)})")
+        if not attempted:
+            print("No reviews generated.")
+            return
+        review_count = conn.execute("SELECT COUNT(*) FROM reviews").fetchone()[0]
+        print(f"Seeded reviews. Total reviews in DB: {review_count}. (Attempted {attempted})")
     except sqlite3.Error as e:
         if "UNIQUE constraint failed" in str(e):
              print(f"Skipped duplicate review: {e}")
@@ -456,38 +557,65 @@ def seed_reviews(conn, user_ids, product_id_map, num_reviews_range):
              print(f"Error seeding reviews: {e}")
              conn.rollback()
 
-def seed_likes(conn, user_ids, product_ids, like_probability):
+def seed_likes(conn, user_ids, product_ids, like_probability, max_likes_per_user=MAX_LIKES_PER_USER,
+               chunk_size=CHUNK_SIZE):
     if not user_ids or not product_ids:
         print("Cannot seed likes without users and products.")
         return
     print("Seeding likes...")
-    likes_data = []
-    for user_id in user_ids:
-        num_likes = int(len(product_ids) * like_probability * (random.random() + 0.5))
-        products_liked_by_user = random.sample(product_ids, k=min(num_likes, len(product_ids)))
-        for product_id in products_liked_by_user:
-                timestamp = fake.date_time_between(start_date='-6m', end_date='now')
-                likes_data.append((user_id, product_id, timestamp))
-
-    if not likes_data:
-        print("No likes generated.")
-        return
+
+    def like_rows():
+        for user_id in user_ids:
+            num_likes = int(len(product_ids) * like_probability * (random.random() + 0.5))
+            num_likes = min(num_likes, max_likes_per_user, len(product_ids))
+            for product_id in sorted(random.sample(product_ids, k=num_likes)): # Sorted for B-tree locality
+                    timestamp = random_datetime(days_back=182)
+                    yield (user_id, product_id, timestamp)
 
     try:
-        cursor = conn.cursor()
-        cursor.executemany("""
+        attempted = _insert_chunks(conn, """
             INSERT OR IGNORE INTO likes (user_id, product_id, "timestamp")
             VALUES (?, ?, ?)
-        """, likes_data)
+        """, like_rows(), chunk_size, label='likes')
         conn.commit()
-        cursor.execute("SELECT COUNT(*) FROM likes")
-        like_count = cursor.fetchone()[0]
-        print(f"Seeded likes. Total likes in DB: {like_count}. (Attempted {len(likes_data)}, duplicates ignored)")
+        if not attempted:
+            print("No likes generated.")
+            return
+        like_count = conn.execute("SELECT COUNT(*) FROM likes").fetchone()[0]
+        print(f"Seeded likes. Total likes in DB: {like_count}. (Attempted {attempted}, duplicates ignored)")
     except sqlite3.Error as e:
         print(f"Error seeding likes: {e}")
         conn.rollback()
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fill the database with fake marketplace data.")
+    parser.add_argument('--db', default=DB_PATH, help="SQLite database to seed (default: %(default)s)")
+    parser.add_argument('--users', type=int, default=NUM_USERS, help="Users to create (default: %(default)s)")
+    parser.add_argument('--products-per-user', type=int, nargs=2, metavar=('MIN', 'MAX'),
+                        default=NUM_PRODUCTS_PER_USER_RANGE, help="Listings per user (default: %(default)s)")
+    parser.add_argument('--comments-per-product', type=int, nargs=2, metavar=('MIN', 'MAX'),
+                        default=NUM_COMMENTS_PER_PRODUCT_RANGE, help="Comments per commented listing (default: %(default)s)")
+    parser.add_argument('--reviews-per-user', type=int, nargs=2, metavar=('MIN', 'MAX'),
+                        default=NUM_REVIEWS_PER_USER_RANGE, help="Reviews per seller (default: %(default)s)")
+    parser.add_argument('--like-probability', type=float, default=LIKE_PROBABILITY,
+                        help="Share of all listings each user likes (default: %(default)s)")
+    parser.add_argument('--max-likes-per-user', type=int, default=MAX_LIKES_PER_USER,
+                        help="Cap on likes per user (default: %(default)s)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help="Rows per executemany call (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Processes generating listings; 0 means one per CPU (default: %(default)s)")
+    parser.add_argument('--seed', type=int, help="Random seed, for a reproducible data set")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+     args = parse_args()
+     DB_PATH = args.db
+     workers = args.workers or os.cpu_count()
+     if args.seed is not None:
+         random.seed(args.seed)
+         fake.seed_instance(args.seed)
+
      print("\n--- IMPORTANT ---")
      print("Ensure category placeholder images (textbooks.jpg, electronics.jpg, etc.)")
      print("are placed in the 'app/static/product_images/' directory.")
@@ -496,16 +624,22 @@ if __name__ == "__main__":
      if not conn: exit()
      start_time = datetime.now()
      print(f"\n--- Starting Database Seeding ({start_time.strftime('%Y-%m-%d %H:%M:%S')}) ---")
+     bulk_state = None
      try:
+        bulk_state = begin_bulk_load(conn)
         campus_map = seed_campuses(conn)
         category_map = seed_categories(conn)
-        user_ids = seed_users(conn, NUM_USERS, campus_map)
-        product_id_map = seed_products(conn, user_ids, category_map, NUM_PRODUCTS_PER_USER_RANGE)
+        user_ids = seed_users(conn, args.users, campus_map, chunk_size=args.chunk_size)
+        product_id_map = seed_products(conn, user_ids, category_map, args.products_per_user,
+                                       chunk_size=args.chunk_size, workers=workers)
         product_ids = list(product_id_map.keys())
         if product_ids:
-             seed_comments(conn, user_ids, product_ids, NUM_COMMENTS_PER_PRODUCT_RANGE)
-             seed_likes(conn, user_ids, product_ids, LIKE_PROBABILITY)
-        seed_reviews(conn, user_ids, product_id_map, NUM_REVIEWS_PER_USER_RANGE)
+             seed_comments(conn, user_ids, product_ids, args.comments_per_product, chunk_size=args.chunk_size)
+             seed_likes(conn, user_ids, product_ids, args.like_probability,
+                        max_likes_per_user=args.max_likes_per_user, chunk_size=args.chunk_size)
+        seed_reviews(conn, user_ids, product_id_map, args.reviews_per_user, chunk_size=args.chunk_size)
+        end_bulk_load(conn, bulk_state)
+        bulk_state = None
         end_time = datetime.now()
         print(f"\n--- Database seeding completed successfully ({end_time.strftime('%Y-%m-%d %H:%M:%S')}) ---")
         print(f"--- Total time: {end_time - start_time} ---")
@@ -527,5 +661,7 @@ if __name__ == "__main__":
         conn.rollback()
      finally:
         if conn:
+            if bulk_state is not None:
+                end_bulk_load(conn, bulk_state) # Never leave the database without its indexes
             conn.close()
-            print("Database connection closed.")
\ No newline at end of file
+            print("Database connection closed.")
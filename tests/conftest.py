@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from config import Config
+from db.db import get_db, init_db
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Builds an app on a fresh database in tmp_path; keyword arguments override config values."""
+    def make(**overrides):
+        class TestConfig(Config):
+            DATABASE = str(tmp_path / 'test.sqlite')
+            TESTING = True
+            WTF_CSRF_ENABLED = False
+            JOBS_SYNC = True
+            LOG_LEVEL = 'WARNING'
+            PAGE_CACHE_DIR = str(tmp_path / 'page_cache')
+
+        for name, value in overrides.items():
+            setattr(TestConfig, name, value)
+        app = create_app(TestConfig)
+        with app.app_context():
+            init_db()
+            get_db().commit()
+        return app
+    return make
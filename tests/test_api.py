@@ -0,0 +1,46 @@
+from db.db import get_db
+
+
+def _seed_product(app):
+    with app.app_context():
+        db = get_db()
+        category_id = db.execute('SELECT id FROM categories ORDER BY id LIMIT 1').fetchone()['id']
+        user_id = db.execute(
+            'INSERT INTO users (name, email, password_hash) VALUES (?, ?, ?)', ('Seller', 'seller@example.edu', 'x')
+        ).lastrowid
+        product_id = db.execute(
+            '''INSERT INTO products (title, description, price, condition, category_id, seller_id)
+               VALUES (?, ?, ?, ?, ?, ?)''',
+            ('Desk lamp', 'Test listing', 15.0, 'Good', category_id, user_id)
+        ).lastrowid
+        db.commit()
+    return user_id, product_id
+
+
+def test_product_detail_requires_login(make_app):
+    app = make_app()
+    _, product_id = _seed_product(app)
+    client = app.test_client()
+
+    for url in (f'/api/v1/products/{product_id}', f'/api/v1/products/{product_id}/comments'):
+        response = client.get(url)
+        assert response.status_code == 401
+        assert 'error' in response.get_json()
+
+    # Listings stay public
+    assert client.get('/api/v1/products').status_code == 200
+
+
+def test_product_detail_when_logged_in(make_app):
+    app = make_app()
+    user_id, product_id = _seed_product(app)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+    response = client.get(f'/api/v1/products/{product_id}?fields=id,title')
+    assert response.status_code == 200
+    assert response.get_json()['data'] == {'id': product_id, 'title': 'Desk lamp'}
+    assert response.cache_control.private and not response.cache_control.public
+    assert client.get(f'/api/v1/products/{product_id}/comments').get_json()['data'] == []
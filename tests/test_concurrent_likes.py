@@ -0,0 +1,86 @@
+import sqlite3
+import threading
+
+import pytest
+
+from app.product import set_like
+from db.db import get_db, get_read_db
+
+USERS = 8
+PRODUCTS = 4
+ROUNDS = 25
+READERS = 4
+
+
+def _seed(app):
+    with app.app_context():
+        db = get_db()
+        category_id = db.execute('SELECT id FROM categories ORDER BY id LIMIT 1').fetchone()['id']
+        for n in range(USERS):
+            db.execute(
+                'INSERT INTO users (name, email, password_hash) VALUES (?, ?, ?)',
+                (f'User {n}', f'user{n}@example.edu', 'x')
+            )
+        for n in range(PRODUCTS):
+            db.execute(
+                '''INSERT INTO products (title, description, price, condition, category_id, seller_id)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                (f'Product {n}', 'Test listing', 10.0, 'Good', category_id, 1)
+            )
+        db.commit()
+        user_ids = [row['id'] for row in db.execute('SELECT id FROM users')]
+        product_ids = [row['id'] for row in db.execute('SELECT id FROM products')]
+    return user_ids, product_ids
+
+
+@pytest.mark.parametrize('write_batch_size', [1, 64], ids=['direct', 'batched'])
+def test_readers_do_not_block_on_like_writes(make_app, write_batch_size):
+    app = make_app(WRITE_BATCH_SIZE=write_batch_size, PAGE_CACHE_BACKEND='none')
+    user_ids, product_ids = _seed(app)
+    errors = []
+    done = threading.Event()
+
+    def read():
+        while not done.is_set():
+            with app.app_context():
+                try:
+                    get_read_db().execute(
+                        '''SELECT p.id, p.like_count, COUNT(l.user_id)
+                           FROM products p LEFT JOIN likes l ON l.product_id = p.id
+                           GROUP BY p.id'''
+                    ).fetchall()
+                except sqlite3.Error as e:
+                    errors.append(e)
+
+    def write(user_id):
+        with app.app_context():
+            for n in range(ROUNDS):
+                # Alternates between like and unlike, so the last round leaves every other product liked by all
+                for product_id in product_ids:
+                    try:
+                        set_like(product_id, user_id, liked=(n + product_id) % 2 == 0)
+                    except sqlite3.Error as e:
+                        errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(READERS)]
+    writers = [threading.Thread(target=write, args=(user_id,)) for user_id in user_ids]
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    done.set()
+    for thread in readers:
+        thread.join()
+
+    assert not [e for e in errors if 'database is locked' in str(e)]
+    assert not errors
+
+    with app.app_context():
+        rows = get_read_db().execute(
+            '''SELECT p.id, p.like_count, COUNT(l.user_id) AS likes
+               FROM products p LEFT JOIN likes l ON l.product_id = p.id
+               GROUP BY p.id'''
+        ).fetchall()
+    for row in rows:
+        expected = USERS if (ROUNDS - 1 + row['id']) % 2 == 0 else 0
+        assert row['like_count'] == row['likes'] == expected
@@ -0,0 +1,120 @@
+import time
+
+import pytest
+
+from app.jobs import claim_next_job, enqueue, job, requeue_stale_jobs, retry_jobs_command, run_job
+from db.db import get_db, get_read_db
+
+calls = []
+
+@job('test.record')
+def _record(value):
+    calls.append(value)
+
+@job('test.fail')
+def _fail(value):
+    raise RuntimeError(f'cannot handle {value}')
+
+
+@pytest.fixture
+def app(make_app):
+    calls.clear()
+    # No workers, so the tests drive the queue themselves
+    return make_app(JOBS_SYNC=False, JOBS_WORKERS=0, JOBS_MAX_ATTEMPTS=3, JOBS_RETRY_BASE_SECONDS=10)
+
+def _jobs():
+    return [dict(row) for row in get_read_db().execute('SELECT * FROM jobs ORDER BY id')]
+
+
+def test_enqueue_is_part_of_the_callers_transaction(app):
+    with app.app_context():
+        db = get_db()
+        enqueue(db, 'test.record', value=1)
+        db.rollback()
+        assert _jobs() == []
+
+        job_id = enqueue(db, 'test.record', value=2)
+        db.commit()
+        assert [row['id'] for row in _jobs()] == [job_id]
+
+def test_enqueue_rejects_unknown_kinds(app):
+    with app.app_context(), pytest.raises(KeyError):
+        enqueue(get_db(), 'test.unknown')
+
+
+def test_claim_takes_the_oldest_due_job_once(app):
+    with app.app_context():
+        db = get_db()
+        first = enqueue(db, 'test.record', value=1)
+        second = enqueue(db, 'test.record', value=2)
+        db.commit()
+
+        claimed = claim_next_job()
+        assert (claimed['id'], claimed['attempts']) == (first, 1)
+        assert claim_next_job()['id'] == second
+        assert claim_next_job() is None
+        assert {row['status'] for row in _jobs()} == {'running'}
+
+def test_successful_job_is_deleted(app):
+    with app.app_context():
+        db = get_db()
+        enqueue(db, 'test.record', value='done')
+        db.commit()
+
+        assert run_job(claim_next_job()) is True
+        assert calls == ['done']
+        assert _jobs() == []
+
+
+def test_failed_job_retries_with_backoff_then_fails(app):
+    with app.app_context():
+        db = get_db()
+        enqueue(db, 'test.fail', value='x')
+        db.commit()
+
+        started = time.time()
+        assert run_job(claim_next_job()) is False
+        row, = _jobs()
+        assert row['status'] == 'queued'
+        assert row['last_error'] == 'RuntimeError: cannot handle x'
+        assert row['run_after'] >= started + 10 # JOBS_RETRY_BASE_SECONDS for the first retry
+        assert claim_next_job() is None # Still backing off
+
+        run_job(claim_next_job(include_delayed=True))
+        row, = _jobs()
+        assert row['run_after'] >= started + 20 # Doubled
+
+        run_job(claim_next_job(include_delayed=True))
+        row, = _jobs()
+        assert (row['status'], row['attempts']) == ('failed', 3) # JOBS_MAX_ATTEMPTS
+        assert claim_next_job(include_delayed=True) is None
+
+
+def test_stale_running_jobs_are_requeued(app):
+    with app.app_context():
+        db = get_db()
+        enqueue(db, 'test.record', value=1)
+        db.commit()
+        claimed = claim_next_job()
+        assert requeue_stale_jobs() == 0 # Not stale yet
+
+        db.execute('UPDATE jobs SET updated_at = ?', (time.time() - app.config['JOBS_STALE_AFTER_SECONDS'] - 1,))
+        db.commit()
+        assert requeue_stale_jobs() == 1
+        assert claim_next_job()['id'] == claimed['id']
+
+
+def test_retry_command_requeues_failed_jobs(app):
+    with app.app_context():
+        db = get_db()
+        enqueue(db, 'test.fail', value='x')
+        db.execute("UPDATE jobs SET status = 'failed', attempts = 3")
+        db.commit()
+
+    result = app.test_cli_runner().invoke(retry_jobs_command)
+    assert 'Requeued 1 failed jobs.' in result.output
+
+    with app.app_context():
+        row, = _jobs()
+        assert (row['status'], row['attempts']) == ('queued', 0)
+        assert claim_next_job()['id'] == row['id']
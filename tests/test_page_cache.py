@@ -0,0 +1,57 @@
+import os
+import time
+
+from app.page_cache import CachedPage, FileBackend, MemoryBackend, PageCache
+
+
+def _page(body=b'<html></html>'):
+    return CachedPage(body, 'text/html', 'etag', int(time.time()), time.time() + 60)
+
+
+def _key(cache, path):
+    return f'{cache.generation()}:{path}'
+
+
+def test_memory_invalidation_starts_a_new_generation():
+    cache = PageCache(MemoryBackend(16), ttl=60)
+    key = _key(cache, '/')
+    cache.set(key, _page())
+    assert cache.get(_key(cache, '/')) is not None
+
+    cache.clear()
+    assert _key(cache, '/') != key
+    assert cache.get(_key(cache, '/')) is None
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_file_invalidation_is_shared_and_swept(tmp_path):
+    backend = FileBackend(str(tmp_path))
+    other_process = FileBackend(str(tmp_path))
+    cache = PageCache(backend, ttl=60)
+    cache.set(_key(cache, '/'), _page())
+    old_page, = tmp_path.glob('*.page')
+
+    backend._request_sweep = lambda: None # Sweep by hand below rather than on the background thread
+    cache.clear()
+    assert other_process.generation() == backend.generation() != ''
+    assert cache.get(_key(cache, '/')) is None
+    assert old_page.exists() # Left for the sweeper, not deleted by the request
+
+    cache.set(_key(cache, '/category'), _page())
+    new_page = tmp_path / os.path.basename(backend._path(_key(cache, '/category')))
+    # Explicit mtimes, so coarse filesystem timestamps cannot order the files wrongly
+    generation_mtime = os.stat(tmp_path / 'GENERATION').st_mtime_ns
+    os.utime(old_page, ns=(generation_mtime - 10**9, generation_mtime - 10**9))
+    os.utime(new_page, ns=(generation_mtime + 10**9, generation_mtime + 10**9))
+    backend._sweep()
+    assert list(tmp_path.glob('*.page')) == [new_page]
+    assert cache.get(_key(cache, '/category')) is not None
+
+
+def test_memory_invalidation_is_per_process():
+    # Two workers each have their own MemoryBackend; see PAGE_CACHE_BACKEND in config.py
+    worker, other_worker = PageCache(MemoryBackend(16), ttl=60), PageCache(MemoryBackend(16), ttl=60)
+    other_worker.set(_key(other_worker, '/'), _page())
+
+    worker.clear()
+    assert other_worker.get(_key(other_worker, '/')) is not None
@@ -0,0 +1,71 @@
+import base64
+import json
+
+import pytest
+
+from app.pagination import decode_cursor, encode_cursor, split_page
+from app.routes import search_cursor
+
+
+def _token(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('sort_value, row_id', [
+    ('2026-01-31 12:00:00', 42), # Date-sorted listings
+    (-3.25, 7), # Search rank
+    (0, 1),
+    ('Bücher & "quotes"', 2 ** 40),
+])
+def test_cursor_round_trips(sort_value, row_id):
+    token = encode_cursor(sort_value, row_id)
+    assert '=' not in token and '/' not in token and '+' not in token
+    assert decode_cursor(token) == (sort_value, row_id)
+
+
+@pytest.mark.parametrize('token', [
+    None,
+    '',
+    'not base64!',
+    _token('just a string')[:-2], # Truncated
+    'e30', # {}
+    _token([1, 2, 3]),
+    _token(['2026-01-31', '42']), # row id is not an int
+    _token(['2026-01-31', 4.2]),
+    _token([['nested'], 42]),
+    _token([None, 42]),
+    _token(['2026-01-31', True]), # bool is an int subclass, but not a row id
+    _token([False, 42]),
+    _token({'sort': 'x', 'id': 1}),
+])
+def test_tampered_or_foreign_cursor_is_ignored(token):
+    assert decode_cursor(token) is None
+
+
+def test_split_page_only_has_a_cursor_when_there_is_more():
+    rows = [{'date_posted': f'2026-01-{day:02}', 'id': day} for day in range(31, 25, -1)]
+    page, cursor = split_page(rows, 5)
+    assert page == rows[:5]
+    assert decode_cursor(cursor) == ('2026-01-27', 27)
+    assert split_page(rows[:5], 5) == (rows[:5], None)
+
+
+@pytest.mark.parametrize('cursor, match_query, expected', [
+    (encode_cursor(-1.5, 3), '"lamp"', (-1.5, 3)), # Rank cursor on a keyword search
+    (encode_cursor('2026-01-31 12:00:00', 3), None, ('2026-01-31 12:00:00', 3)), # Date cursor on a date sort
+    (encode_cursor('2026-01-31 12:00:00', 3), '"lamp"', None), # Date cursor on a keyword search
+    (encode_cursor(-1.5, 3), None, None), # Rank cursor on a date sort
+    ('garbage', '"lamp"', None),
+])
+def test_search_cursor_must_fit_the_sort_order(make_app, cursor, match_query, expected):
+    app = make_app()
+    with app.test_request_context('/search', query_string={'cursor': cursor}):
+        assert search_cursor(match_query) == expected
+
+
+def test_listing_with_a_tampered_cursor_serves_the_first_page(make_app):
+    app = make_app(PAGE_CACHE_BACKEND='none')
+    client = app.test_client()
+    first_page = client.get('/').get_data()
+    assert client.get('/?cursor=' + _token(['x', 'y'])).get_data() == first_page
+    assert client.get('/?cursor=%25%25%25').status_code == 200
@@ -0,0 +1,28 @@
+from app.product_detail import ProductDetailCache
+
+
+def test_put_is_dropped_if_invalidated_while_loading():
+    cache = ProductDetailCache(max_size=8, ttl=60)
+    version = cache.version(1)
+    cache.invalidate(1) # e.g. a like committed while the page was being loaded
+    cache.put(1, {'like_count': 0}, version)
+    assert cache.get(1) is None
+
+    cache.put(1, {'like_count': 1}, cache.version(1))
+    assert cache.get(1) == {'like_count': 1}
+
+
+def test_put_is_dropped_if_cleared_while_loading():
+    cache = ProductDetailCache(max_size=8, ttl=60)
+    version = cache.version(1)
+    cache.clear()
+    cache.put(1, {'seller_name': 'Old name'}, version)
+    assert cache.get(1) is None
+
+
+def test_invalidating_another_product_keeps_the_put():
+    cache = ProductDetailCache(max_size=8, ttl=60)
+    version = cache.version(1)
+    cache.invalidate(2)
+    cache.put(1, {'like_count': 3}, version)
+    assert cache.get(1) == {'like_count': 3}
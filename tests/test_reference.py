@@ -0,0 +1,33 @@
+import sqlite3
+
+from app import create_app
+from app.reference import get_category, reference_data, refresh_reference_data_command
+
+
+def test_change_by_another_process_is_picked_up(make_app):
+    app = make_app(REFERENCE_CACHE_TTL=3600)
+    with app.app_context():
+        category = get_category(1)
+
+    # Another process (here a plain connection) renames the category
+    con = sqlite3.connect(app.config['DATABASE'])
+    con.execute('UPDATE categories SET name = ? WHERE id = ?', ('Renamed', category['id']))
+    con.commit()
+    con.close()
+
+    with app.app_context():
+        assert get_category(category['id'])['name'] == 'Renamed'
+
+
+def test_refresh_command_reloads_running_servers(make_app):
+    server = make_app(REFERENCE_CACHE_TTL=3600)
+    with server.app_context():
+        loaded = reference_data()._stamp
+
+    cli = create_app(type('CliConfig', (), dict(server.config)))
+    result = cli.test_cli_runner().invoke(refresh_reference_data_command)
+    assert result.exit_code == 0, result.output
+
+    with server.app_context():
+        reference_data().categories
+        assert reference_data()._stamp != loaded
@@ -0,0 +1,30 @@
+from tests.test_api import _seed_product
+
+
+def _logged_in_client(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+def test_oversized_listing_form_redirects_back(make_app):
+    app = make_app(MAX_CONTENT_LENGTH=1024)
+    user_id, _ = _seed_product(app)
+    client = _logged_in_client(app, user_id)
+
+    response = client.post('/product/create', data={'description': 'x' * 4096})
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/product/create')
+
+
+def test_oversized_json_request_gets_a_413(make_app):
+    app = make_app(MAX_CONTENT_LENGTH=1024)
+    user_id, product_id = _seed_product(app)
+    client = _logged_in_client(app, user_id)
+
+    response = client.post(f'/product/like/{product_id}.json', data={'liked': '1' * 4096},
+                           headers={'Accept': 'application/json'})
+    assert response.status_code == 413
+    assert 'error' in response.get_json()
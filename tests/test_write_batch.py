@@ -0,0 +1,108 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from app.write_batch import WriteBatcher, _Write, _apply_writes, run_write
+from db.db import get_db, get_read_db
+
+
+def _insert(db, value):
+    db.execute('INSERT INTO scratch (value) VALUES (?)', (value,))
+    return value
+
+def _fail(db, value):
+    db.execute('INSERT INTO scratch (value) VALUES (?)', (value,))
+    raise ValueError('rejected')
+
+def _slow(db, value):
+    time.sleep(0.5)
+    return _insert(db, value)
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app(WRITE_BATCH_SIZE=64, WRITE_BATCH_INTERVAL_MS=100)
+    with app.app_context():
+        get_db().execute('CREATE TABLE scratch (value TEXT)')
+        get_db().commit()
+    return app
+
+def _values(app):
+    with app.app_context():
+        return sorted(row['value'] for row in get_read_db().execute('SELECT value FROM scratch'))
+
+
+def test_queued_writes_are_committed_as_one_batch(app):
+    batcher = WriteBatcher(app)
+    writes = [_Write('test', _insert, (str(n),)) for n in range(5)]
+    for write in writes:
+        batcher._queue.put(write)
+    batch = batcher._next_batch()
+    assert batch == writes
+
+    with app.app_context():
+        db = get_db()
+        changes = db.total_changes
+        _apply_writes(db, batch)
+        assert db.total_changes - changes == 5
+    assert [write.future.result() for write in writes] == ['0', '1', '2', '3', '4']
+    assert _values(app) == ['0', '1', '2', '3', '4']
+
+
+def test_concurrent_writes_share_the_writer_thread(app):
+    results = []
+
+    def write(n):
+        with app.app_context():
+            results.append(run_write('test', _insert, str(n)))
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == [str(n) for n in range(8)]
+    assert _values(app) == [str(n) for n in range(8)]
+
+
+def test_failing_write_is_rolled_back_alone(app):
+    writes = [_Write('test', _insert, ('a',)), _Write('test', _fail, ('b',)), _Write('test', _insert, ('c',))]
+    with app.app_context():
+        _apply_writes(get_db(), writes)
+
+    assert writes[0].future.result() == 'a'
+    with pytest.raises(ValueError):
+        writes[1].future.result()
+    assert writes[2].future.result() == 'c'
+    assert _values(app) == ['a', 'c']
+
+
+def test_waiting_too_long_raises_operational_error(app):
+    with app.app_context():
+        app.extensions['write_batcher'].timeout = 0.05
+        with pytest.raises(sqlite3.OperationalError, match='Timed out'):
+            run_write('test', _slow, 'late')
+
+
+def test_batched_write_refuses_when_holding_the_writer(app):
+    with app.app_context():
+        get_db()
+        with pytest.raises(RuntimeError):
+            run_write('test', _insert, 'x')
+
+
+def test_direct_write_refuses_inside_an_open_transaction(make_app):
+    app = make_app(WRITE_BATCH_SIZE=1)
+    with app.app_context():
+        db = get_db()
+        db.execute('CREATE TABLE scratch (value TEXT)')
+        db.commit()
+        assert run_write('test', _insert, 'a') == 'a'
+
+        db.execute('INSERT INTO scratch (value) VALUES (?)', ('pending',))
+        with pytest.raises(RuntimeError):
+            run_write('test', _insert, 'b')
+        db.rollback()
+    assert _values(app) == ['a']